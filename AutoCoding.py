@@ -19,6 +19,22 @@ Modifiers are done
     $ python AutoCode.py [-I inputDir|--inputDir=inputDir]
         [-i inputFile|--inputFile=inputFile]
         [-O outputDir|--outputDir=outputDir]
+        [-W workers|--workers=workers]
+        [-H hostname|--MetaMapLiteHost=hostname]
+        [-P port|--MetaMapLitePort=port]
+        [-U URL|--MetaMapLiteURL=URL]
+        [-E host:port[/URL]|--MetaMapLiteEndpoint=host:port[/URL]]...
+        [--MetaMapLitePoolSize=poolSize]
+        [--MetaMapLiteConcurrency=concurrency]
+        [--MetaMapLiteEjectTime=seconds]
+        [--MetaMapLiteMaxFailures=failures]
+        [--MetaMapLiteCache=cacheFile]
+        [--MetaMapLiteCacheSize=megabytes]
+        [--MetaMapLiteBackend=backend]
+        [--MetaMapLiteSentenceCache]
+        [--MetaMapLiteRecord=recordFile]
+        [-B bundleFile|--solutionBundle=bundleFile]
+        [--verifyTerms]
         [-C configDir|--configDir=configDir]
         [-c configFile|--configFile=configFile]
         [-v loggingLevel|--verbose=logingLevel]
@@ -40,6 +56,13 @@ Modifiers are done
     -O outputDir|--outputDir=outputDir
     The foleder where the output file(s) will be created.
 
+    -W workers|--workers=workers
+    The number of worker processes AutoCoding the clinical documents in inputDir in parallel (default=1).
+    Each worker process loads the solution once, then takes clinical documents from a shared queue,
+    so the MetaMapLite waits of one worker overlap with the AutoCoding in the other workers.
+    The output files, and the log, are the same as AutoCoding the clinical documents one at a time.
+    The --MetaMapLiteConcurrency limit applies to all the worker processes together. The --MetaMapLitePoolSize applies to each worker process.
+
     -H hostname|--MetaMapLiteHost=hostname
     The name of the MetaMapLite Server (default="localhost")
 
@@ -49,6 +72,56 @@ Modifiers are done
     -U URL|--MetaMapLiteURL=URL
     The URL for the AutoCoding service on the MetaMapLite Server (default="/AutoCoding/MetaMapLite")
 
+    -E host:port[/URL]|--MetaMapLiteEndpoint=host:port[/URL]
+    A MetaMapLite endpoint. May be repeated to spread the load over several MetaMapLite Servers.
+    Replaces the -H/-P/-U MetaMapLite Server. The URL defaults to the -U URL.
+    Each document is sent to the endpoint with the fewest requests in flight.
+
+    --MetaMapLitePoolSize=poolSize
+    The maximum number of reusable (keep-alive) connections to each MetaMapLite endpoint (default=4)
+
+    --MetaMapLiteConcurrency=concurrency
+    The maximum number of requests in flight to the MetaMapLite Server(s) (default=1).
+    Further requests wait in a queue. The time spent waiting is reported separately from the MetaMapLite service time.
+
+    --MetaMapLiteEjectTime=seconds
+    The number of seconds an unhealthy MetaMapLite endpoint is ejected for, before being re-admitted (default=30)
+
+    --MetaMapLiteMaxFailures=failures
+    The number of consecutive failures that make a MetaMapLite endpoint unhealthy (default=3)
+
+    --MetaMapLiteCache=cacheFile
+    An SQLite database file for caching MetaMapLite responses (default no cache).
+    The cache can be shared by concurrent AutoCoding processes. With a warm cache, changes to the
+    'complete' and 'analyze' configuration can be re-run over a whole corpus without calling MetaMapLite.
+
+    --MetaMapLiteCacheSize=megabytes
+    The maximum size of the cache of MetaMapLite responses (default=1024).
+    The least recently used responses are evicted when the cache grows past this size.
+
+    --MetaMapLiteBackend=backend
+    The identifier of the MetaMapLite backend, such as the MetaMapLite version and UMLS index (default="MetaMapLite").
+    This is part of every cache key, so change it whenever the MetaMapLite backend changes.
+
+    --MetaMapLiteSentenceCache
+    Also cache the MetaMapLite annotations of each sentence (requires --MetaMapLiteCache).
+    Only the sentences that are not in the cache are sent to MetaMapLite, which saves re-annotating
+    repeated boilerplate sentences, such as specimen descriptions and disclaimers.
+
+    --MetaMapLiteRecord=recordFile
+    Append every MetaMapLite response to this file (default no recording).
+    The recorded responses can be replayed by replayMetaMapLite.py, so that AutoCoding can be run without a MetaMapLite Server.
+    Only responses from the MetaMapLite Service are recorded, so don't use a warm cache when recording.
+
+    -B bundleFile|--solutionBundle=bundleFile
+    Load the solution configuration data from a compiled solution bundle, created by compileSolution.py (default load the Excel workbooks).
+    Starting from a bundle doesn't need openpyxl or pandas and is much faster, which matters when AutoCoding with --workers.
+    A bundle that is out of date with the solution folder is rejected.
+
+    --verifyTerms
+    Check the fused term replacement, which skips the blocks of terms that cannot match a line, against applying every term to every line.
+    Any difference is logged as a warning, and the result of applying every term is used.
+
     -v loggingLevel|--verbose=loggingLevel
     Set the level of logging that you want.
 
@@ -100,35 +173,20 @@ Modifiers are done
 import os
 import sys
 import logging
-import importlib
-import threading
-import re
 from http import client
-from openpyxl import load_workbook
 from flask import Flask
 import functions as f
-import excelFunctions as excel
+import checkFunctions as ch
+import metaMapLiteFunctions as mm
+import cacheFunctions as cache
+import solutionFunctions as sol
+import batchFunctions as batch
 import data as d
 
 
 app = Flask(__name__)
-import flaskFunctions as flsk
-
-
-def getDocument(fileName):
-    '''
-    Get a clinical from a file or standard input
-    '''
-    d.rawClinicalDocument = ''
-    if fileName == '-':     # Use standard input
-        for line in sys.stdin:
-            d.rawClinicalDocument += line.rstrip() + '\n'
-        return
-    with open(fileName, 'rt', newline='', encoding='utf-8') as fp:
-        for line in fp:
-            d.rawClinicalDocument += line.rstrip() + '\n'
-        return
-
+if __name__ == '__main__':      # Not when imported by a --workers worker process (flaskFunctions imports app from __main__)
+    import flaskFunctions as flsk
 
 
 if __name__ == '__main__':
@@ -163,247 +221,30 @@ if __name__ == '__main__':
 
     # Make sure we can connect to the MetaMapLite Service
     MetaMapLiteConnection = None                # The MetaMapLite http connection
-    d.MetaMapLiteServiceLock = threading.Lock()    # A Threading Lock used to avoid threading issues in the MetaMapLiteService
     d.MetaMapLiteHeaders = {'Content-type':'application/x-www-form-urlencoded', 'Accept':'application/json'}
-    try:
-        MetaMapLiteConnection = client.HTTPConnection(d.MetaMapLiteHost, d.MetaMapLitePort)
-        MetaMapLiteConnection.close()
-    except (client.NotConnected, client.InvalidURL, client.UnknownProtocol,client.UnknownTransferEncoding,client.UnimplementedFileMode,
-            client.IncompleteRead, client.ImproperConnectionState, client.CannotSendRequest, client.CannotSendHeader,
-            client.ResponseNotReady, client.BadStatusLine) as e:
-        logging.critical('Cannot connect to the MetaMapLite Service on host (%s) and port (%s) [error:(%s)]',
-                         d.MetaMapLiteHost, d.MetaMapLitePort, repr(e))
-        logging.shutdown()
-        sys.stdout.flush()
-        sys.exit(d.EX_UNAVAILABLE)
-    # logging.debug('Connection to MetaMapLite server tested')
-
-    # Check that the solution files all exist and appear correct.
-    if not os.path.isdir(os.path.join('solutions', d.solution)):
-        logging.critical('No solution folder named "%s"', d.solution)
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    if not os.path.isfile(os.path.join('solutions', d.solution, 'solutionData.py')):
-        logging.critical('No solution file "solutionData.py" in solution folder "%s"', d.solution)
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    if not os.path.isfile(os.path.join('solutions', d.solution, 'prepare.py')):
-        logging.critical('No solution file "prepare.py" in solution folder "%s"', d.solution)
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    if not os.path.isfile(os.path.join('solutions', d.solution, 'prepare.xlsx')):
-        logging.critical('No solution file "prepare.xlsx" in solution folder "%s"', d.solution)
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    if not os.path.isfile(os.path.join('solutions', d.solution, 'complete.py')):
-        logging.critical('No solution file "complete.py" in solution folder "%s"', d.solution)
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    if not os.path.isfile(os.path.join('solutions', d.solution, 'complete.xlsx')):
-        logging.critical('No solution file "complete.xlsx" in solution folder "%s"', d.solution)
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    if not os.path.isfile(os.path.join('solutions', d.solution, 'analyze.py')):
-        logging.critical('No solution file "analyze.py" in solution folder "%s"', d.solution)
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    if not os.path.isfile(os.path.join('solutions', d.solution, 'analyze.xlsx')):
-        logging.critical('No solution file "analyze.xlsx" in solution folder "%s"', d.solution)
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    if not os.path.isfile(os.path.join('solutions', d.solution, 'Solution MetaThesaurus.xlsx')):
-        logging.critical('No solution file "Solution MetaThesaurus.xlsx" in solution folder "%s"', d.solution)
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-
-    # Check the solution specific MetaThesaurus Excel workbook
-    wb = load_workbook(os.path.join('solutions', d.solution, 'Solution MetaThesaurus.xlsx'))
-    requiredColumns = ['MetaThesaurus code', 'MetaThesaurus description','Source', 'Source code']
-    this_df = excel.checkWorksheet(wb, 'Solution MetaThesaurus', 'Solution MetaThesaurus', requiredColumns, True)
-    this_df = this_df.set_index(this_df.iloc[:,0].name)     # The code is really the index/dictionary keys()
-    this_df = this_df.rename(columns={'MetaThesaurus_description': 'description'})
-    d.solutionMetaThesaurus = this_df.to_dict(orient='index')
-
-    # Import the solution specific data module
-    try:
-        d.sd = importlib.import_module('solutions.' + d.solution + '.solutionData')
-    except Exception as e:
-        logging.fatal('Cannot import "solutionData.py" for solution "%s"', d.solution)
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    # logging.debug('Solution specific data loaded')
-
-    # Check the solution 'prepare' Excel workbook
-    wb = load_workbook(os.path.join('solutions', d.solution, 'prepare.xlsx'))
-    requiredColumns = ['Label', 'Replacement']
-    d.labels = excel.loadSimpleCompileSheet(wb, 'prepare', 'labels', requiredColumns, r'^', None, False, False)
-    requiredColumns = ['Common', 'Technical']
-    d.terms = excel.loadSimpleCompileSheet(wb, 'prepare', 'terms', requiredColumns, None, None, True, True)
-    requiredColumns = ['Preamble markers', 'isCase', 'isStart']
-    d.preambleMarkers = excel.loadBoolCompileWorksheet(wb, 'prepare', 'preamble markers', requiredColumns, None, None, True)
-    requiredColumns = ['Preamble terms', 'Technical']
-    d.preambleTerms = excel.loadSimpleCompileSheet(wb, 'prepare', 'preamble terms', requiredColumns, None, None, True, True)
-
-    # Import the solution specific prepare module and check that it has all the required functions
-    try:
-        d.sp = importlib.import_module('solutions.' + d.solution + '.prepare')
-    except Exception as e:
-        logging.fatal('Cannot import "prepare.py" for solution "%s"', d.solution)
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    for requiredFunction in ['configure', 'solutionCleanDocument', 'solutionCheckPreamble', 'solutionCheckNotPreamble']:
-        if not hasattr(d.sp, requiredFunction):
-            logging.fatal('"prepare" module in solution "%s" is missing the "%s" function', d.solution, requiredFunction)
+    for endpoint in d.MetaMapLiteEndpoints:
+        try:
+            MetaMapLiteConnection = client.HTTPConnection(endpoint['host'], endpoint['port'])
+            MetaMapLiteConnection.close()
+        except (client.NotConnected, client.InvalidURL, client.UnknownProtocol,client.UnknownTransferEncoding,client.UnimplementedFileMode,
+                client.IncompleteRead, client.ImproperConnectionState, client.CannotSendRequest, client.CannotSendHeader,
+                client.ResponseNotReady, client.BadStatusLine) as e:
+            logging.critical('Cannot connect to the MetaMapLite Service on host (%s) and port (%s) [error:(%s)]',
+                             endpoint['host'], endpoint['port'], repr(e))
             logging.shutdown()
-            sys.exit(d.EX_CONFIG)
-
-    # Now do any solution specific 'prepare' configuration and initialzation
-    configConcepts = d.sp.configure(wb)
-    d.knownConcepts.update(configConcepts)
-    # logging.debug('Prepare module loaded and configured')
-
-    # Check the solution 'complete' Excel workbook
-    wb = load_workbook(os.path.join('solutions', d.solution, 'complete.xlsx'))
-    requiredColumns = ['History markers', 'isCase', 'isStart']
-    d.historyMarkers = excel.loadBoolCompileWorksheet(wb, 'complete', 'history markers', requiredColumns, None, None, True)
-    requiredColumns = ['Pre history']
-    d.preHistory = excel.loadSimpleCompileSheet(wb, 'complete', 'pre history', requiredColumns, None, None, True, True)
-    requiredColumns = ['Section markers', 'Section', 'isCase']
-    d.sectionMarkers = excel.loadSimpleCompileSheet(wb, 'complete', 'section markers', requiredColumns, None, None, True, True)
-    requiredColumns = ['SolutionID', 'MetaThesaurusID(s)']
-    this_df = excel.checkWorksheet(wb, 'complete', 'equivalents', requiredColumns, False)
-    thisData = this_df.values.tolist()
-    for record in thisData:
-        if record[0] is None:
-            break
-        # logging.debug("sheet(site implied), columns(%s), record(%s)", requiredColumns, record)
-        equivalent = record[0]
-        d.knownConcepts.add(equivalent)
-        j = 1
-        while (j < len(record)) and (record[j] is not None):
-            d.equivalents[record[j]] = equivalent
-            d.knownConcepts.add(record[j])
-            j += 1
-    requiredColumns = ['But boundaries']
-    d.butBoundaries = excel.loadSimpleCompileSheet(wb, 'complete', 'but boundaries', requiredColumns, None, None, True, True)
-    requiredColumns = ['Pre negations']
-    d.preNegation = excel.loadCompileConceptsWorksheet(wb, 'complete', 'pre negations', requiredColumns, None, r'.*')
-    requiredColumns = ['Immediate pre negations']
-    d.immediatePreNegation = excel.loadCompileConceptsWorksheet(wb, 'complete', 'immediate pre negations', requiredColumns, None, r'\s+')
-    requiredColumns = ['Post negations', 'Exceptions']
-    d.postNegation = excel.loadCompileCompileWorksheet(wb, 'complete', 'post negations', requiredColumns, r'.*')
-    requiredColumns = ['Immediate post negations', 'Exceptions']
-    d.immediatePostNegation = excel.loadCompileCompileWorksheet(wb, 'complete', 'immediate post negations', requiredColumns, r'\s*')
-    requiredColumns = ['Pre ambiguous']
-    d.preAmbiguous = excel.loadCompileConceptsWorksheet(wb, 'complete', 'pre ambiguous', requiredColumns, None, r'.*')
-    requiredColumns = ['Immediate pre ambiguous']
-    d.immediatePreAmbiguous = excel.loadCompileConceptsWorksheet(wb, 'complete', 'immediate pre ambiguous', requiredColumns, None, r'\s+')
-    requiredColumns = ['Post ambiguous', 'Exceptions']
-    d.postAmbiguous = excel.loadCompileCompileWorksheet(wb, 'complete', 'post ambiguous', requiredColumns, r'\s*')
-    requiredColumns = ['Immediate post ambiguous', 'Exceptions']
-    d.immediatePostAmbiguous = excel.loadCompileCompileWorksheet(wb, 'complete', 'immediate post ambiguous', requiredColumns, r'\s*')
-    requiredColumns = ['MetaThesaurusID', 'SolutionID', 'Modifier']
-    this_df = excel.checkWorksheet(wb, 'complete', 'pre modifiers', requiredColumns, True)
-    d.preModifiers = excel.loadModifierWorksheet(wb, 'complete', 'pre modifiers', requiredColumns, None, r'\s.*$')
-    d.postModifiers = excel.loadModifierWorksheet(wb, 'complete', 'post modifiers', requiredColumns, r'^\s*', None)
-    requiredColumns = ['SolutionID', 'Concept']
-    this_df = excel.checkWorksheet(wb, 'complete', 'sentence concepts', requiredColumns, True)
-    for row in this_df.itertuples():
-        if row.SolutionID is None:
-            break
-        # logging.debug("sheet(sentence concepts)), columns(%s), row(%s)", requiredColumns, row)
-        concept, isNeg = excel.checkConfigConcept(row.SolutionID)
-        reText = re.compile(excel.checkPattern(row.Concept), flags=re.IGNORECASE|re.DOTALL)
-        text = row.Concept
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r'\b', '', text)
-        text = re.sub(r'\(', '(', text)
-        text = re.sub(r'\)', ')', text)
-        d.sentenceConcepts.append((concept, reText, isNeg, text))
-        d.knownConcepts.add(concept)
-    requiredColumns = ['Start Negation', 'End Negation', 'Sentences']
-    this_df = excel.checkWorksheet(wb, 'complete', 'gross negations', requiredColumns, True)
-    for row in this_df.itertuples():
-        if row.Start_Negation is None:
-            break
-        # logging.debug("sheet(gross negations)), columns(%s), row(%s)", requiredColumns, row)
-        startNeg = re.compile(excel.checkPattern(row.Start_Negation), flags=re.IGNORECASE|re.DOTALL)
-        endNeg = re.compile(excel.checkPattern(row.End_Negation), flags=re.IGNORECASE|re.DOTALL)
-        sentences = int(row.Sentences)
-        d.grossNegation.append((startNeg, endNeg, sentences))
-    requiredColumns = ['SolutionID', 'Section', 'Negate', 'MetaThesaurusIDs']
-    d.sentenceNegationLists = excel.loadNegationListWorksheet(wb, 'complete', 'sentence negation lists', requiredColumns)
-    d.documentNegationLists = excel.loadNegationListWorksheet(wb, 'complete', 'document negation lists', requiredColumns)
-    requiredColumns = ['SolutionID', 'Asserted', 'MetaThesaurus or Solution IDs']
-    d.sentenceConceptSequenceSets = excel.loadSequenceConceptSetsWorksheet(wb, 'complete', 'sent strict seq concept sets', requiredColumns, True)
-    d.sentenceConceptSequenceSets += excel.loadSequenceConceptSetsWorksheet(wb, 'complete', 'sentence sequence concept sets', requiredColumns, False)
-    requiredColumns = ['SolutionID', 'Sentences', 'Asserted', 'MetaThesaurus or Solution IDs']
-    d.sentenceConceptSequenceSets += excel.loadSequenceConceptSetsWorksheet(wb, 'complete', 'multi sent strict seq conc sets', requiredColumns, True)
-    d.sentenceConceptSequenceSets += excel.loadSequenceConceptSetsWorksheet(wb, 'complete', 'multi sentence seq concept sets', requiredColumns, False)
-    requiredColumns = ['SolutionID', 'Asserted', 'MetaThesaurus or Solution IDs']
-    d.sentenceConceptSets = excel.loadConceptSetsWorksheet(wb, 'complete', 'sentence concept sets', requiredColumns)
-    requiredColumns = ['SolutionID', 'Sentences', 'Asserted', 'MetaThesaurus or Solution IDs']
-    d.sentenceConceptSets += excel.loadConceptSetsWorksheet(wb, 'complete', 'multi sentence concept sets', requiredColumns)
-    requiredColumns = ['SolutionID', 'Asserted', 'MetaThesaurus or Solution IDs']
-    d.documentConceptSequenceSets = excel.loadConceptSetsWorksheet(wb, 'complete', 'document sequence concept sets', requiredColumns)
-    d.documentConceptSets = excel.loadConceptSetsWorksheet(wb, 'complete', 'document concept sets', requiredColumns)
-    requiredColumns = ['MetaThesaurus code']
-    this_df = excel.checkWorksheet(wb, 'complete', 'other concepts', requiredColumns, True)
-    d.otherConcepts = set(this_df['MetaThesaurus_code'].unique())
-
-
-    # Import the solution specific complete module and check that it has all the required functions
-    try:
-        d.sc = importlib.import_module('solutions.' + d.solution + '.complete')
-    except Exception as e:
-        logging.fatal('Cannot import "complete.py" for solution "%s"', d.solution)
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    for requiredFunction in ['configure', 'requireConcept', 'solutionCheckHistory', 'addRawConcepts', 'initalizeNegation',
-                             'extendNegation', 'higherConceptFound', 'setConcept', 'solutionAddAdditionalConcept', 'addFinalConcepts', 'complete']:
-        if not hasattr(d.sc, requiredFunction):
-            logging.fatal('"complete" module in solution "%s" is missing the "%s" function', d.solution, requiredFunction)
-            logging.shutdown()
-            sys.exit(d.EX_CONFIG)
-
-    # Now do any solution specific 'complete' configuration and initialzation
-    configConcepts = d.sc.configure(wb)
-    d.knownConcepts.update(configConcepts)
-    # logging.debug('Complete module loaded and configured')
-
-    # Check the solution 'analyze' Excel workbook
-    wb = load_workbook(os.path.join('solutions', d.solution, 'analyze.xlsx'))
+            sys.stdout.flush()
+            sys.exit(d.EX_UNAVAILABLE)
+    # logging.debug('Connection to MetaMapLite server tested')
 
-    # There are no standard solution 'analyze' Excel worksheets
+    # Create the pools of reusable connections to the MetaMapLite endpoints and the limit on requests in flight
+    mm.openPool()
 
-    # Import the solution specific analyze module and check that it has all the required functions
-    try:
-        d.sa = importlib.import_module('solutions.' + d.solution + '.analyze')
-    except Exception as e:
-        logging.fatal('Cannot import "analyze.py" for solution "%s"', d.solution)
-        logging.shutdown()
-        sys.exit(d.EX_CONFIG)
-    for requiredFunction in ['configure', 'analyze']:
-        if not hasattr(d.sa, requiredFunction):
-            logging.fatal('"analyze" module in solution "%s" is missing the "%s" function', d.solution, requiredFunction)
-            logging.shutdown()
-            sys.exit(d.EX_CONFIG)
-    if isFlask:
-        for requiredFunction in ['reportHTML', 'reportJSON']:
-            if not hasattr(d.sa, requiredFunction):
-                logging.fatal('"analyze" module in solution "%s" is missing the "%s" function', d.solution, requiredFunction)
-                logging.shutdown()
-                sys.exit(d.EX_CONFIG)
-    else:
-        if not hasattr(d.sa, 'reportFile'):
-            logging.fatal('"analyze" module in solution "%s" is missing the "reportFile" function', d.solution)
-            logging.shutdown()
-            sys.exit(d.EX_CONFIG)
+    # Open the cache of MetaMapLite responses
+    if d.MetaMapLiteCacheFile is not None:
+        cache.openCache()
 
-    # Now do any solution specific 'analyze' configuration and initialzation
-    configConcepts = d.sa.configure(wb)
-    d.knownConcepts.update(configConcepts)
-    # logging.debug('Analyze module loaded and configured')
+    # Load and configure the solution
+    sol.loadSolution(isFlask)
 
     if isFlask:         # Run as a website and api service
         print(f'flsk:{flsk}')
@@ -425,24 +266,34 @@ if __name__ == '__main__':
     else:
         files = os.listdir(d.inputDir)
 
-    for file in files:
-        if d.inputDir is None:
-            getDocument(file)
-        else:
-            getDocument(os.path.join(d.inputDir, file))
-
-        # AutoCode this clinical document
-        success = f.AutoCode()
-        if success != d.EX_OK:
-            continue
-
-        # Print this clinical document
-        if file == '-':
-            d.sa.reportFile(None, None)
+    if (d.workers > 1) and (len(files) > 1):       # AutoCode them in parallel
+        batch.codeFiles(files, d.workers)
+    else:
+        for file in files:
+            if d.inputDir is not None:
+                batch.codeFile(file)
+                continue
+
+            # AutoCode the clinical document from standard input
+            context = d.AutoCodingContext(batch.getDocument(file))
+            success = f.AutoCode(context)
+            if success != d.EX_OK:
+                continue
+
+            # Print this clinical document
+            d.sa.reportFile(context, None, None)
+            mm.logStatistics()
+            mm.closePool()
+            if d.MetaMapLiteCacheFile is not None:
+                cache.logStatistics()
+            ch.logSetStatistics()
+            ch.logPrefilterStatistics()
             sys.exit(d.EX_OK)
-        baseFile = os.path.basename(file)
-        filePart, ext = os.path.splitext(baseFile)
-        if d.outputDir is None:
-            d.sa.reportFile(d.inputDir, 'AutoCoded_' + filePart)
-        else:
-            d.sa.reportFile(d.outputDir, filePart)
+
+    # Report the MetaMapLite connection pool, concurrency and cache statistics, the concept set statistics and the literal prefilter statistics
+    mm.logStatistics()
+    mm.closePool()
+    if d.MetaMapLiteCacheFile is not None:
+        cache.logStatistics()
+    ch.logSetStatistics()
+    ch.logPrefilterStatistics()
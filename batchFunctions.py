@@ -0,0 +1,261 @@
+'''
+The functions for AutoCoding a folder of clinical documents
+
+With d.workers greater than one, the clinical documents are AutoCoded in parallel by a pool of worker processes.
+Each worker process loads the solution once and then takes clinical documents from a shared queue,
+AutoCodes them and creates their output files. While one worker is waiting for MetaMapLite,
+the other workers get on with preparing, completing and analyzing their clinical documents.
+The log messages for each clinical document are captured in the worker and logged by the main process
+in the order of the clinical documents, so the output files and the log are the same as AutoCoding the documents one at a time.
+'''
+
+# pylint: disable=invalid-name, line-too-long, broad-exception-caught
+
+import os
+import sys
+import logging
+import traceback
+import queue
+import multiprocessing
+import functions as f
+import checkFunctions as ch
+import metaMapLiteFunctions as mm
+import cacheFunctions as cache
+import solutionFunctions as sol
+import data as d
+
+# The data, set from the command line, that each worker process needs
+settingNames = ['progName', 'inputDir', 'inputFile', 'outputDir', 'MetaMapLiteHost', 'MetaMapLitePort', 'MetaMapLiteURL', 'MetaMapLiteHeaders',
+                'MetaMapLiteConcurrency', 'MetaMapLitePoolSize', 'MetaMapLiteEjectTime', 'MetaMapLiteMaxFailures', 'MetaMapLiteCacheFile',
+                'MetaMapLiteCacheSize', 'MetaMapLiteBackend', 'MetaMapLiteSentenceCache', 'MetaMapLiteRecordFile', 'solution', 'solutionBundle',
+                'verifyTerms']
+
+
+def getDocument(fileName):
+    '''
+    Get a clinical from a file or standard input
+    '''
+    rawClinicalDocument = ''
+    if fileName == '-':     # Use standard input
+        for line in sys.stdin:
+            rawClinicalDocument += line.rstrip() + '\n'
+        return rawClinicalDocument
+    with open(fileName, 'rt', newline='', encoding='utf-8') as fp:
+        for line in fp:
+            rawClinicalDocument += line.rstrip() + '\n'
+        return rawClinicalDocument
+
+
+def codeFile(file):
+    '''
+    AutoCode one clinical document from d.inputDir and create the output file
+    Parameters
+        file    - str, the name of the clinical document file in d.inputDir
+    Returns
+        Nothing
+    '''
+
+    context = d.AutoCodingContext(getDocument(os.path.join(d.inputDir, file)))
+
+    # AutoCode this clinical document
+    success = f.AutoCode(context)
+    if success != d.EX_OK:
+        return
+
+    # Print this clinical document
+    baseFile = os.path.basename(file)
+    filePart, ext = os.path.splitext(baseFile)
+    if d.outputDir is None:
+        d.sa.reportFile(context, d.inputDir, 'AutoCoded_' + filePart)
+    else:
+        d.sa.reportFile(context, d.outputDir, filePart)
+    return
+
+
+class CaptureHandler(logging.Handler):
+    '''
+    A logging Handler that captures the log records in a worker process, so that they can be logged by the main process
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        '''
+        Capture this log record, with the message and any exception already formatted (the arguments may not be picklable)
+        '''
+
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info is not None:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+    def takeRecords(self):
+        '''
+        Return, and forget, the captured log records
+        '''
+
+        records = self.records
+        self.records = []
+        return records
+
+
+def worker(settings, endpoints, limiter, flight, loggingLevel, tasks, results):
+    '''
+    A worker process - load the solution, then AutoCode clinical documents from the tasks queue until there are no more
+    Parameters
+        settings        - dict, the data set from the command line (settingNames)
+        endpoints       - list, the MetaMapLite endpoints (host, port and url)
+        limiter         - multiprocessing.BoundedSemaphore, the limit on requests in flight to MetaMapLite, shared by all the worker processes
+        flight          - multiprocessing.Array, the requests in flight to MetaMapLite and waiting, across all the worker processes
+        loggingLevel    - int, the logging level
+        tasks           - multiprocessing.Queue, the clinical documents to AutoCode - (fileNo, file), then None when there are no more
+        results         - multiprocessing.Queue, the captured log records and the outcome of each clinical document, then the statistics
+    Returns
+        Nothing
+    '''
+
+    # Capture the logging, so that the main process can log it in order
+    handler = CaptureHandler()
+    rootLogger = logging.getLogger()
+    for oldHandler in list(rootLogger.handlers):
+        rootLogger.removeHandler(oldHandler)
+    rootLogger.addHandler(handler)
+    rootLogger.setLevel(loggingLevel)
+
+    # Set up this worker - the main process has already checked the solution, so just load it
+    for name, value in settings.items():
+        setattr(d, name, value)
+    d.MetaMapLiteEndpoints = endpoints
+    try:
+        mm.openPool()
+        mm.shareLimiter(limiter, flight)
+        if d.MetaMapLiteCacheFile is not None:
+            cache.openCache()
+        sol.loadSolution(False)
+    except SystemExit as e:
+        results.put(('failed', handler.takeRecords(), e.code))
+        return
+    handler.takeRecords()
+
+    # AutoCode clinical documents until there are no more, or one fails
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        fileNo, file = task
+        outcome = None
+        try:
+            codeFile(file)
+        except SystemExit as e:
+            outcome = ('exit', e.code)
+        except Exception:
+            outcome = ('exception', traceback.format_exc())
+        results.put(('document', fileNo, handler.takeRecords(), outcome))
+        if outcome is not None:
+            break
+
+    # Return this worker's MetaMapLite, concept set and literal prefilter statistics
+    mm.closePool()
+    cacheStats = None
+    if d.MetaMapLiteCacheFile is not None:
+        cacheStats = cache.statistics()
+    results.put(('statistics', mm.poolStatistics(), mm.limiterStatistics(), mm.endpointStatistics(), cacheStats, ch.setStatistics(), ch.prefilterStatistics()))
+    return
+
+
+def stopWorkers(processes, exitCode):
+    '''
+    Stop all the worker processes and exit
+    Parameters
+        processes   - list, the worker processes
+        exitCode    - int, the exit code
+    Returns
+        Does not return
+    '''
+
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+    logging.shutdown()
+    sys.exit(exitCode)
+
+
+def codeFiles(files, workers):
+    '''
+    AutoCode the clinical documents in d.inputDir in parallel, using a pool of worker processes
+    Parameters
+        files   - list, the names of the clinical document files in d.inputDir
+        workers - int, the number of worker processes
+    Returns
+        Nothing
+    '''
+
+    # Queue up the clinical documents, followed by one 'no more' for each worker
+    mpContext = multiprocessing.get_context('spawn')      # Fresh worker processes - no inherited connections, locks or cache handles
+    tasks = mpContext.Queue()
+    results = mpContext.Queue()
+    for fileNo, file in enumerate(files):
+        tasks.put((fileNo, file))
+    workers = min(workers, len(files))
+    for i in range(workers):
+        tasks.put(None)
+
+    # Start the worker processes
+    settings = {name:getattr(d, name) for name in settingNames}
+    endpoints = [{'host':endpoint['host'], 'port':endpoint['port'], 'url':endpoint['url']} for endpoint in d.MetaMapLiteEndpoints]
+    loggingLevel = logging.getLogger().level
+    limiter = mpContext.BoundedSemaphore(d.MetaMapLiteConcurrency)      # One limit on requests in flight to MetaMapLite, for all the workers
+    flight = mpContext.Array('i', 4)
+    mm.shareLimiter(limiter, flight)
+    processes = []
+    for i in range(workers):
+        process = mpContext.Process(target=worker, args=(settings, endpoints, limiter, flight, loggingLevel, tasks, results), daemon=True)
+        process.start()
+        processes.append(process)
+    logging.info('AutoCoding %d clinical documents with %d worker processes', len(files), workers)
+
+    # Log each clinical document's messages in the order of the clinical documents
+    done = {}
+    nextFileNo = 0
+    running = workers
+    while (nextFileNo < len(files)) or (running > 0):
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            for process in processes:
+                if process.exitcode not in [None, 0]:
+                    logging.critical('AutoCoding worker process (%d) died - exit code(%d)', process.pid, process.exitcode)
+                    stopWorkers(processes, d.EX_SOFTWARE)
+            continue
+        if result[0] == 'failed':           # A worker process could not load the solution
+            for record in result[1]:
+                logging.getLogger().handle(record)
+            stopWorkers(processes, result[2])
+        elif result[0] == 'statistics':
+            mm.mergeStatistics(result[1], result[2], result[3])
+            if result[4] is not None:
+                cache.mergeStatistics(result[4])
+            ch.mergeSetStatistics(result[5])
+            ch.mergePrefilterStatistics(result[6])
+            running -= 1
+        else:
+            done[result[1]] = result
+        while nextFileNo in done:
+            _, fileNo, records, outcome = done.pop(nextFileNo)
+            for record in records:
+                logging.getLogger().handle(record)
+            nextFileNo += 1
+            if outcome is None:
+                continue
+            if outcome[0] == 'exit':        # This clinical document stopped AutoCoding
+                stopWorkers(processes, outcome[1])
+            logging.critical('AutoCoding of clinical document (%s) failed:\n%s', files[fileNo], outcome[1])
+            stopWorkers(processes, d.EX_SOFTWARE)
+    for process in processes:
+        process.join()
+    return
@@ -0,0 +1,402 @@
+'''
+The functions for the disk cache of MetaMapLite responses
+
+The cache is an SQLite database, so it can be shared by concurrent AutoCoding processes.
+Each MetaMapLite response is keyed by a hash of the prepared document and the MetaMapLite backend identifier (d.MetaMapLiteBackend).
+The cache is limited to d.MetaMapLiteCacheSize megabytes. When it grows past that, the least recently used responses are evicted.
+
+With d.MetaMapLiteSentenceCache the cache also holds the MetaMapLite annotations of each segment of a document.
+A segment is a run of lines ending with a line that ends with a full stop (so segments never split a MetaMapLite sentence).
+Only the segments that are not in the cache are sent to MetaMapLite (as one batch).
+The cached annotations are relative to the start of the segment and are rebased into document coordinates when the response is assembled.
+'''
+
+# pylint: disable=invalid-name, line-too-long, broad-exception-caught
+
+import os
+import sys
+import logging
+import re
+import json
+import bisect
+import hashlib
+import sqlite3
+import threading
+import time
+import metaMapLiteFunctions as mm
+import data as d
+
+cacheLocal = threading.local()      # Each thread (in each process) has its own connection to the cache database
+statsLock = threading.Lock()        # A Threading Lock to protect the cache statistics
+segmentEnd = re.compile(r'\.\n')    # Segments end after a line that ends with a full stop
+
+
+def cacheKey(text):
+    '''
+    Compute the cache key for this text
+    Parameters
+        text    - str, the text sent to MetaMapLite
+    Returns
+        key     - str, the SHA-256 hash of the MetaMapLite backend identifier and the text
+    '''
+
+    return hashlib.sha256((d.MetaMapLiteBackend + '\0' + text).encode('utf-8')).hexdigest()
+
+
+def getCacheConnection():
+    '''
+    Get this thread's connection to the cache database, creating the cache tables if necessary
+    Parameters
+        None
+    Returns
+        connection  - sqlite3.Connection, the connection to the cache database
+    '''
+
+    connection = getattr(cacheLocal, 'connection', None)
+    if (connection is not None) and (cacheLocal.pid == os.getpid()):
+        return connection
+    # Connections can't be shared between processes, or threads, so create a new one for this thread
+    connection = sqlite3.connect(d.MetaMapLiteCacheFile, timeout=60, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, size INTEGER NOT NULL, lastUsed REAL NOT NULL, response BLOB NOT NULL)')
+    connection.execute('CREATE INDEX IF NOT EXISTS responsesLRU ON responses (lastUsed)')
+    connection.execute('CREATE TABLE IF NOT EXISTS segments (key TEXT PRIMARY KEY, size INTEGER NOT NULL, lastUsed REAL NOT NULL, annotations BLOB NOT NULL)')
+    connection.execute('CREATE INDEX IF NOT EXISTS segmentsLRU ON segments (lastUsed)')
+    cacheLocal.connection = connection
+    cacheLocal.pid = os.getpid()
+    return connection
+
+
+def openCache():
+    '''
+    Open (or create) the cache of MetaMapLite responses and zero the cache statistics
+    Parameters
+        None
+    Returns
+        Nothing
+    '''
+
+    d.MetaMapLiteCacheStats = {'hits':0, 'misses':0, 'stores':0, 'evictions':0, 'segmentHits':0, 'segmentMisses':0, 'fallbacks':0}
+    try:
+        getCacheConnection()
+    except sqlite3.Error as e:
+        logging.critical('Cannot open the MetaMapLite cache (%s) - error(%s)', d.MetaMapLiteCacheFile, repr(e))
+        logging.shutdown()
+        sys.exit(d.EX_CANTCREAT)
+    return
+
+
+def addStats(**counts):
+    '''
+    Add to the cache statistics
+    Parameters
+        counts - keyword arguments, the amount to add to each named statistic
+    Returns
+        Nothing
+    '''
+
+    with statsLock:
+        for stat, count in counts.items():
+            d.MetaMapLiteCacheStats[stat] += count
+    return
+
+
+def statistics():
+    '''
+    Return a copy of the cache statistics
+    Parameters
+        None
+    Returns
+        stats - dict, hits, misses, stores, evictions, segmentHits, segmentMisses and fallbacks
+    '''
+
+    with statsLock:
+        return dict(d.MetaMapLiteCacheStats)
+
+
+def mergeStatistics(stats):
+    '''
+    Add the cache statistics from a worker process to these statistics
+    Parameters
+        stats - dict, the worker's cache statistics (from statistics())
+    Returns
+        Nothing
+    '''
+
+    with statsLock:
+        for stat, count in stats.items():
+            d.MetaMapLiteCacheStats[stat] += count
+    return
+
+
+def logStatistics():
+    '''
+    Log the cache statistics
+    Parameters
+        None
+    Returns
+        Nothing
+    '''
+
+    stats = statistics()
+    logging.info('MetaMapLite cache: hits(%d), misses(%d), stores(%d), evictions(%d)',
+                 stats['hits'], stats['misses'], stats['stores'], stats['evictions'])
+    if d.MetaMapLiteSentenceCache:
+        logging.info('MetaMapLite sentence cache: hits(%d), misses(%d), whole document fallbacks(%d)',
+                     stats['segmentHits'], stats['segmentMisses'], stats['fallbacks'])
+    return
+
+
+def getResponse(document):
+    '''
+    Get the cached MetaMapLite response for this document
+    Parameters
+        document    - str, the prepared clinical document
+    Returns
+        response    - bytes, the cached MetaMapLite response, or None if this document isn't in the cache
+    '''
+
+    key = cacheKey(document)
+    try:
+        connection = getCacheConnection()
+        row = connection.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            connection.execute('UPDATE responses SET lastUsed = ? WHERE key = ?', (time.time(), key))
+    except sqlite3.Error as e:
+        logging.warning('MetaMapLite cache read failed - error(%s)', repr(e))
+        row = None
+    if row is None:
+        addStats(misses=1)
+        return None
+    addStats(hits=1)
+    return row[0]
+
+
+def evict(connection):
+    '''
+    Evict the least recently used responses and segments until the cache is no bigger than d.MetaMapLiteCacheSize megabytes
+    (must be called inside a transaction)
+    Parameters
+        connection  - sqlite3.Connection, the connection to the cache database
+    Returns
+        evicted     - int, the number of responses and segments evicted
+    '''
+
+    maxSize = d.MetaMapLiteCacheSize * 1024 * 1024
+    cacheSize = connection.execute('SELECT TOTAL(size) FROM responses').fetchone()[0]
+    cacheSize += connection.execute('SELECT TOTAL(size) FROM segments').fetchone()[0]
+    if cacheSize <= maxSize:
+        return 0
+    evictions = {'responses':[], 'segments':[]}
+    for table, oldKey, size, lastUsed in connection.execute('SELECT \'responses\', key, size, lastUsed FROM responses UNION ALL SELECT \'segments\', key, size, lastUsed FROM segments ORDER BY lastUsed'):
+        if cacheSize <= maxSize:
+            break
+        evictions[table].append((oldKey,))
+        cacheSize -= size
+    connection.executemany('DELETE FROM responses WHERE key = ?', evictions['responses'])
+    connection.executemany('DELETE FROM segments WHERE key = ?', evictions['segments'])
+    return len(evictions['responses']) + len(evictions['segments'])
+
+
+def putResponse(document, response):
+    '''
+    Save the MetaMapLite response for this document in the cache, evicting the least recently used responses if the cache is too big
+    Parameters
+        document    - str, the prepared clinical document
+        response    - bytes, the MetaMapLite response
+    Returns
+        Nothing
+    '''
+
+    key = cacheKey(document)
+    try:
+        connection = getCacheConnection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('INSERT OR REPLACE INTO responses (key, size, lastUsed, response) VALUES (?, ?, ?, ?)',
+                               (key, len(response), time.time(), response))
+            evicted = evict(connection)
+            connection.execute('COMMIT')
+        except Exception:         # Never leave the transaction (and the database write lock) open
+            connection.execute('ROLLBACK')
+            raise
+    except (sqlite3.Error, ValueError) as e:
+        logging.warning('MetaMapLite cache write failed - error(%s)', repr(e))
+        return
+    addStats(stores=1, evictions=evicted)
+    return
+
+
+def splitSegments(document):
+    '''
+    Split a prepared document into segments, each ending after a line that ends with a full stop
+    Parameters
+        document    - str, the prepared clinical document
+    Returns
+        segments    - list, of (start, text) tuples - the segments, which concatenate back to the document
+    '''
+
+    segments = []
+    start = 0
+    for match in segmentEnd.finditer(document):
+        segments.append((start, document[start:match.end()]))
+        start = match.end()
+    if start < len(document):
+        segments.append((start, document[start:]))
+    return segments
+
+
+def getSegments(segments):
+    '''
+    Get the cached MetaMapLite annotations for these segments
+    Parameters
+        segments    - list, of (start, text) tuples - the segments of the prepared clinical document
+    Returns
+        annotations - list, the cached annotations (relative to the start of the segment) for each segment, or None if this segment isn't in the cache
+    '''
+
+    annotations = []
+    try:
+        connection = getCacheConnection()
+        now = time.time()
+        for start, text in segments:
+            key = cacheKey(text)
+            row = connection.execute('SELECT annotations FROM segments WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                annotations.append(None)
+                continue
+            connection.execute('UPDATE segments SET lastUsed = ? WHERE key = ?', (now, key))
+            annotations.append(json.loads(row[0]))
+    except (sqlite3.Error, ValueError) as e:
+        logging.warning('MetaMapLite cache read failed - error(%s)', repr(e))
+        annotations = [None] * len(segments)
+    hits = len(segments) - annotations.count(None)
+    addStats(segmentHits=hits, segmentMisses=len(segments) - hits)
+    return annotations
+
+
+def putSegments(segments, annotations):
+    '''
+    Save the MetaMapLite annotations for these segments in the cache, evicting the least recently used responses and segments if the cache is too big
+    Parameters
+        segments    - list, of (start, text) tuples - the segments of the prepared clinical document
+        annotations - list, the annotations (relative to the start of the segment) for each segment
+    Returns
+        Nothing
+    '''
+
+    now = time.time()
+    rows = []
+    for (start, text), annotation in zip(segments, annotations):
+        blob = json.dumps(annotation).encode('utf-8')
+        rows.append((cacheKey(text), len(blob), now, blob))
+    try:
+        connection = getCacheConnection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany('INSERT OR REPLACE INTO segments (key, size, lastUsed, annotations) VALUES (?, ?, ?, ?)', rows)
+            evicted = evict(connection)
+            connection.execute('COMMIT')
+        except Exception:         # Never leave the transaction (and the database write lock) open
+            connection.execute('ROLLBACK')
+            raise
+    except (sqlite3.Error, ValueError) as e:
+        logging.warning('MetaMapLite cache write failed - error(%s)', repr(e))
+        return
+    addStats(stores=len(rows), evictions=evicted)
+    return
+
+
+def splitResponse(segments, response):
+    '''
+    Split a MetaMapLite response for the concatenated text of these segments into the annotations for each segment
+    Parameters
+        segments    - list, of (start, text) tuples - the segments, where start is the position of the segment in the text sent to MetaMapLite
+        response    - dict, the MetaMapLite response with 'concepts' and 'sentences'
+    Returns
+        annotations - list, the annotations (relative to the start of the segment) for each segment,
+                      or None if a sentence or concept crosses a segment boundary
+    '''
+
+    starts = [start for start, text in segments]
+    annotations = [{'concepts':[], 'sentences':[]} for segment in segments]
+    for sentence in response['sentences']:
+        segmentNo = bisect.bisect_right(starts, sentence['start']) - 1
+        if segmentNo < 0:
+            return None
+        segmentStart, segmentText = segments[segmentNo]
+        if sentence['start'] + len(sentence['text']) > segmentStart + len(segmentText):
+            return None
+        annotations[segmentNo]['sentences'].append({'start':sentence['start'] - segmentStart, 'text':sentence['text']})
+    for concept in response['concepts']:
+        conceptID = list(concept.keys())[0]
+        thisStart = int(concept[conceptID]['start'])
+        segmentNo = bisect.bisect_right(starts, thisStart) - 1
+        if segmentNo < 0:
+            return None
+        segmentStart, segmentText = segments[segmentNo]
+        if thisStart + int(concept[conceptID]['length']) > segmentStart + len(segmentText):
+            return None
+        attributes = dict(concept[conceptID])
+        attributes['start'] = thisStart - segmentStart
+        annotations[segmentNo]['concepts'].append({conceptID:attributes})
+    return annotations
+
+
+def getSegmentedResponse(document):
+    '''
+    Get the MetaMapLite response for this document, only sending the segments that are not in the cache to MetaMapLite
+    Parameters
+        document    - str, the prepared clinical document
+    Returns
+        success     - int, d.EX_OK or the error status
+        response    - bytes, the MetaMapLite response for the whole document, or the reason for the failure
+    '''
+
+    segments = splitSegments(document)
+    annotations = getSegments(segments)
+
+    # Send the unseen segments to MetaMapLite as one batch (segments of nothing but white space have no annotations)
+    unseen = []
+    batchStart = 0
+    for segmentNo, (start, text) in enumerate(segments):
+        if annotations[segmentNo] is not None:
+            continue
+        if text.strip() == '':
+            annotations[segmentNo] = {'concepts':[], 'sentences':[]}
+            continue
+        unseen.append((segmentNo, batchStart, text))
+        batchStart += len(text)
+    if len(unseen) > 0:
+        batch = ''.join([text for segmentNo, start, text in unseen])
+        success, responseData = mm.callMetaMapLite(batch)
+        if success != d.EX_OK:
+            return (success, responseData)
+        try:
+            batchResponse = json.loads(responseData)
+        except ValueError:
+            return (d.EX_OK, responseData)          # Let AutoCode() report the invalid response
+        batchSegments = [(start, text) for segmentNo, start, text in unseen]
+        batchAnnotations = splitResponse(batchSegments, batchResponse)
+        if batchAnnotations is None:
+            # MetaMapLite didn't respect the segment boundaries - so annotate the whole document
+            logging.info('MetaMapLite annotations cross a segment boundary - annotating the whole document')
+            addStats(fallbacks=1)
+            if batch == document:
+                return (d.EX_OK, responseData)
+            return mm.callMetaMapLite(document)
+        putSegments(batchSegments, batchAnnotations)
+        for (segmentNo, start, text), annotation in zip(unseen, batchAnnotations):
+            annotations[segmentNo] = annotation
+
+    # Assemble the response, rebasing the annotations into document coordinates
+    response = {'concepts':[], 'sentences':[]}
+    for (start, text), annotation in zip(segments, annotations):
+        for concept in annotation['concepts']:
+            conceptID = list(concept.keys())[0]
+            attributes = dict(concept[conceptID])
+            attributes['start'] += start
+            response['concepts'].append({conceptID:attributes})
+        for sentence in annotation['sentences']:
+            response['sentences'].append({'start':sentence['start'] + start, 'text':sentence['text']})
+    return (d.EX_OK, json.dumps(response).encode('utf-8'))
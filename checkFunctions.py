@@ -5,17 +5,81 @@ The common functions for the Clinical Costing system.
 # pylint: disable=invalid-name, line-too-long, broad-exception-caught, unused-variable, superfluous-parens, too-many-lines
 
 import sys
+import re
+import bisect
 import logging
+import threading
 import functions as f
 import data as d
 
+# The families of negation and ambiguity triggers, in data.py, that are indexed for each sentence
+triggerFamilies = ['preNegation', 'immediatePreNegation', 'immediatePreAmbiguous', 'preAmbiguous',
+                   'postAmbiguous', 'immediatePostAmbiguous', 'postNegation', 'immediatePostNegation']
+# Anchors, lookarounds, atomic groups, possessive repeats and inline flags can see past the ends of a slice of the sentence, so triggers using them are not indexed
+unindexable = re.compile(r'[\^$]|\\[AZ]|\(\?[=!<>(aLu]|[*+?}]\+')
+wordChar = re.compile(r'\w')
+statsLock = threading.Lock()      # A Threading Lock to protect the concept set and literal prefilter statistics
 
-def checkPreamble(inPreamble, text):
+
+def firstMarker(family, text):
+    '''
+    Find the first match of a family of markers in text - the match that starts first, or the match of the first marker in the list if several start there.
+    The fused gates find where that is, then the markers are matched there, in order
+    Parameters
+        family  - str, the family of markers in d.fusedMarkers (e.g. 'historyStart')
+        text    - str, the text to be searched
+    Returns
+        match   - re.Match, the first match, or None if none of the markers are in the text
+    '''
+
+    markers, gates = d.fusedMarkers[family]
+    if gates is None:       # Search for every marker
+        firstMatch = None
+        for marker in markers:
+            match = marker.search(text)
+            if (match is not None) and ((firstMatch is None) or (match.start() < firstMatch.start())):
+                firstMatch = match
+        return firstMatch
+    firstAt = None
+    for gate in gates:
+        match = gate.search(text)
+        if (match is not None) and ((firstAt is None) or (match.start() < firstAt)):
+            firstAt = match.start()
+    if firstAt is None:
+        return None
+    for marker in markers:
+        match = marker.match(text, firstAt)
+        if match is not None:
+            return match
+    return None
+
+
+def anyMarker(family, text):
+    '''
+    Check if any of a family of markers is in text, using the fused gates
+    Parameters
+        family  - str, the family of markers in d.fusedMarkers (e.g. 'section')
+        text    - str, the text to be searched
+    Returns
+        found   - boolean, False if none of the markers are in the text
+    '''
+
+    markers, gates = d.fusedMarkers[family]
+    if gates is None:
+        return True
+    for gate in gates:
+        if gate.search(text) is not None:
+            return True
+    return False
+
+
+def checkPreamble(context, inPreamble, text):
     '''
     Check for preamble markers in document as a whole.
     If we are already in preamble, then check for an end of preamble marker.
     If we are not in preamble, then check for a start of preamble marker.
     Parameters
+        context    - d.AutoCodingContext, the state of AutoCoding this clinical document
         inPreamble - Boolean, True if the end of the last piece of text was preamble
         text - the text to be tested
     Returns 
@@ -30,19 +94,13 @@ def checkPreamble(inPreamble, text):
         # Check for the configured end of preamble markers (regular expression, ignore case)
         documentFound = False
         changeAt = None
-        # Search for the end 'start of preamble marker'
-        for marker, isStart in d.preambleMarkers:
-            # logging.debug('Checking marker:%s', marker.pattern)
-            if isStart:    # This is a start of preamble marker, but we are in preamble, so skip this marker
-                continue
-            match = marker.search(text)
-            if match is not None:        # End of preamble found
-                documentFound = True        # Some document text found
-                # Remember where we ended preamble
-                if (changeAt is None) or (match.start() < changeAt):
-                    changeAt = match.start()
+        # Search for the first 'end of preamble marker'
+        match = firstMarker('preambleEnd', text)
+        if match is not None:        # End of preamble found
+            documentFound = True        # Some document text found
+            changeAt = match.start()        # Remember where we ended preamble
         if not documentFound:        # We are still in preamble, or at least we think we are - the specific solution may have a different answer
-            changeAt = d.sp.solutionCheckNotPreamble(text)
+            changeAt = d.sp.solutionCheckNotPreamble(context, text)
             if changeAt >= 0:    # The specific solution found the end of preamble
                 documentFound = True
         if documentFound:        # We did bounced out of preamble
@@ -54,18 +112,19 @@ def checkPreamble(inPreamble, text):
         preambleFound = False
         changeAt = None
         # Search for the first occurance of a 'start of preamble marker' in this sentence
-        for marker, isStart in d.preambleMarkers:
-            # logging.debug('Checking marker:%s', marker[0].pattern)
-            if not isStart:    # This is an end of preamble marker, but we are not in preamble, so skip this marker
-                continue
-            match = marker.search(text)
-            if match is not None:    # Start of preamble marker found
-                preambleFound = True        # Start of preamble marker found
-                # Remember where we started preamble
-                if (changeAt is None) or (match.start() > changeAt):
-                    changeAt = match.start()
+        if anyMarker('preambleStart', text):     # At least one of the start of preamble markers is in this text
+            for marker, isStart in d.preambleMarkers:
+                # logging.debug('Checking marker:%s', marker[0].pattern)
+                if not isStart:    # This is an end of preamble marker, but we are not in preamble, so skip this marker
+                    continue
+                match = marker.search(text)
+                if match is not None:    # Start of preamble marker found
+                    preambleFound = True        # Start of preamble marker found
+                    # Remember where we started preamble
+                    if (changeAt is None) or (match.start() > changeAt):
+                        changeAt = match.start()
         if not preambleFound:        # We aren't in preamble, or at least we don't think we are - the specific solution may have a different answer
-            changeAt = d.sp.solutionCheckPreamble(text)
+            changeAt = d.sp.solutionCheckPreamble(context, text)
             if changeAt >= 0:    # The specific solution found the end of preamble
                 preambleFound = True
         if preambleFound:                # We bounced into preamble
@@ -74,14 +133,15 @@ def checkPreamble(inPreamble, text):
             return (False, 0)        # No preamble in this document
 
 
-def checkHistory(inHistory, text, depth):
+def checkHistory(context, inHistory, text, depth):
     '''
     Check for history markers in this text.
     If we are already in history, then check for an end of history marker.
     If we are not in history, then check for a start of history marker.
-    This function is called as d.sentences is being compiled/growing.
-    So 'text' will be in the last line added to d.sentences
+    This function is called as context.sentences is being compiled/growing.
+    So 'text' will be in the last line added to context.sentences
     Parameters
+        context     - d.AutoCodingContext, the state of AutoCoding this clinical document
         inHistory   - Boolean, True if the end of the last piece of text was history
         text        - the text to be tested
         depth       - the level of recursion
@@ -95,26 +155,16 @@ def checkHistory(inHistory, text, depth):
     if inHistory:        # We are in history - check to see if we've come to the end of this history section
         # logging.debug('checkHistory() - checking for leaving history in text(%s)', text)
         # Check for the configured end of history markers (regular expression, ignore case)
-        historyEndFound = False
-        newStart = None
-        matchLen = None
         # Search for the first occurence of an 'end of history marker' in this text
-        for marker, isStart in d.historyMarkers:
-            if isStart:    # This is a start of history marker, but we are in history, so skip this marker
-                continue
-            # logging.debug('checkHistory() - checking endOfHistory marker:%s[%s]', marker.pattern, marker.flags)
-            match = marker.search(text)
-            if match is not None:        # End of history found
-                historyEndFound = True        # Some document 'end of history' text found
-                # Remember where we ended history
-                if (newStart is None) or (match.start() < newStart):
-                    newStart = match.start()
-                    matchLen = len(match.group())
-        if historyEndFound:        # We did bounced out of history
+        match = firstMarker('historyEnd', text)
+        if match is not None:        # We did bounced out of history
+            # Remember where we ended history
+            newStart = match.start()
+            matchLen = len(match.group())
             # logging.debug('checkHistory() - end of history found at %d with "%s"', newStart, text[newStart:newStart + matchLen])
             return newStart, matchLen
         # We are still in history, or at least we think we are - the specific solution may have a different answer
-        historyEnds, scChangeAt, scLen = d.sc.solutionCheckHistory(inHistory, text)
+        historyEnds, scChangeAt, scLen = d.sc.solutionCheckHistory(context, inHistory, text)
         # The solution can indicate that history ended at a previous sentence
         # All sentences between this new end of history and the current sentence are not history
         if historyEnds == 0:        # History ends with this sentence
@@ -131,56 +181,46 @@ def checkHistory(inHistory, text, depth):
                 sys.exit(d.EX_CONFIG)
             thisHistory = False
             for fixIt in range(0, historyEnds):
-                d.sentences[-1 - fixIt][0] = False        # Has no history changes
-                d.sentences[-1 - fixIt][1] = False        # Starts with not history
-                d.sentences[-1 - fixIt][5] = []            # No history changes
-                txt = str(d.sentences[-1 - fixIt][4])
+                context.sentences[-1 - fixIt].hasChanges = False        # Has no history changes
+                context.sentences[-1 - fixIt].isHistory = False        # Starts with not history
+                context.sentences[-1 - fixIt].changesAt = []            # No history changes
+                txt = str(context.sentences[-1 - fixIt].text)
                 # We have to check if this sentence has a sentence history tag somewhere in the sentence
                 firstChange = True
                 lastChange = 0
-                changesAt, matchLen = checkHistory(thisHistory, txt, depth + 1)
+                changesAt, matchLen = checkHistory(context, thisHistory, txt, depth + 1)
                 while changesAt is not None:        # Bounced in or out of history mid sentence
                     # logging.debug('checkHistory() - bounced in/out of history at %d for %d characters', changesAt, matchLen)
                     if firstChange and (changesAt == 0):            # Changed at the start of the text which is the start of the sentence
-                        d.sentences[-1 - fixIt][1] = not thisHistory
-                    elif len(d.sentences[-1 - fixIt][5]) == 0:    # Check for previous changes
-                        d.sentences[-1 - fixIt][5].append(changesAt)
-                        d.sentences[-1 - fixIt][0] = True    # Does contain history changes
+                        context.sentences[-1 - fixIt].isHistory = not thisHistory
+                    elif len(context.sentences[-1 - fixIt].changesAt) == 0:    # Check for previous changes
+                        context.sentences[-1 - fixIt].changesAt.append(changesAt)
+                        context.sentences[-1 - fixIt].hasChanges = True    # Does contain history changes
                     else:
-                        changesAt += d.sentences[-1 - fixIt][5][-1] + lastChange
-                        d.sentences[-1 - fixIt][5].append(changesAt)
-                        d.sentences[-1 - fixIt][0] = True    # Does contain history changes
+                        changesAt += context.sentences[-1 - fixIt].changesAt[-1] + lastChange
+                        context.sentences[-1 - fixIt].changesAt.append(changesAt)
+                        context.sentences[-1 - fixIt].hasChanges = True    # Does contain history changes
                     firstChange = False
                     lastChange = matchLen
                     thisHistory = not thisHistory
                     txt = txt[changesAt + matchLen:]
-                    changesAt, matchLen = checkHistory(thisHistory, txt, depth + 1)
+                    changesAt, matchLen = checkHistory(context, thisHistory, txt, depth + 1)
             return None, None       # No changes in current sentence
         else:
             return None, None
     else:        # We are not in history - check that we didn't fall into another history section
         # logging.debug('Checking for entering history in text(%s)', text)
         # Check for the configured start of history markers (regular expression, ignore case)
-        historyFound = False
-        newStart = None
-        matchLen = None
         # Search for the first occurance of a 'start of history marker' in this text
-        for marker, isStart in d.historyMarkers:
-            if not isStart:    # This is an end of history marker, but we are not in history, so skip this marker
-                continue
-            # logging.debug('Checking inHistory marker:%s[%s]', marker.pattern, marker.flags)
-            match = marker.search(text)
-            if match is not None:    # Start of history found
-                historyFound = True        # Start of history marker found
-                # Remember where we started history
-                if (newStart is None) or (match.start() < newStart):
-                    newStart = match.start()
-                    matchLen = len(match.group())
-        if historyFound:        # We did bounce into history
+        match = firstMarker('historyStart', text)
+        if match is not None:        # We did bounce into history
+            # Remember where we started history
+            newStart = match.start()
+            matchLen = len(match.group())
             # logging.debug('checkHistory() - history found at %d with text "%s"', newStart, text[newStart:newStart + matchLen])
             return newStart, matchLen
         # We aren't in history, or at least we don't think we are - the specific solution may have a different answer
-        historyAt, scChangeAt, scLen = d.sc.solutionCheckHistory(inHistory, text)
+        historyAt, scChangeAt, scLen = d.sc.solutionCheckHistory(context, inHistory, text)
         # The solution can indicate that history started at a previous sentence
         # All sentences between this new start of history and the current sentence are history
         if historyAt == 0:            # History starts with this sentence
@@ -197,57 +237,212 @@ def checkHistory(inHistory, text, depth):
             # logging.debug('checkHistory() - solution says history started %d sentences ago', historyAt)
             thisHistory = True
             for fixIt in range(0, historyAt):
-                d.sentences[-1 - fixIt][0] = False        # Has no history changes
-                d.sentences[-1 - fixIt][1] = True        # Starts with history
-                d.sentences[-1 - fixIt][5] = []            # No history changes
-                txt = str(d.sentences[-1 - fixIt][4])
+                context.sentences[-1 - fixIt].hasChanges = False        # Has no history changes
+                context.sentences[-1 - fixIt].isHistory = True        # Starts with history
+                context.sentences[-1 - fixIt].changesAt = []            # No history changes
+                txt = str(context.sentences[-1 - fixIt].text)
                 # We have to check if this sentence has a sentence history tag somewhere in the sentence
                 firstChange = True
                 lastChange = 0
-                changesAt, matchLen = checkHistory(thisHistory, txt, depth + 1)
+                changesAt, matchLen = checkHistory(context, thisHistory, txt, depth + 1)
                 while changesAt is not None:        # Bounced in or out of history mid sentence
                     if firstChange and (changesAt == 0):            # Changed at the start of the text which is the start of the sentence
-                        d.sentences[-1 - fixIt][1] = not thisHistory
-                    elif len(d.sentences[-1 - fixIt][5]) == 0:    # Check for previous changes
-                        d.sentences[-1 - fixIt][5].append(changesAt)
-                        d.sentences[-1 - fixIt][0] = True    # Does contain history somewhere
+                        context.sentences[-1 - fixIt].isHistory = not thisHistory
+                    elif len(context.sentences[-1 - fixIt].changesAt) == 0:    # Check for previous changes
+                        context.sentences[-1 - fixIt].changesAt.append(changesAt)
+                        context.sentences[-1 - fixIt].hasChanges = True    # Does contain history somewhere
                     else:
-                        changesAt += d.sentences[-1 - fixIt][5][-1] + lastChange
-                        d.sentences[-1 - fixIt][5].append(changesAt)
-                        d.sentences[-1 - fixIt][0] = True    # Does contain history somewhere
+                        changesAt += context.sentences[-1 - fixIt].changesAt[-1] + lastChange
+                        context.sentences[-1 - fixIt].changesAt.append(changesAt)
+                        context.sentences[-1 - fixIt].hasChanges = True    # Does contain history somewhere
                     firstChange = False
                     lastChange = matchLen
                     thisHistory = not thisHistory
                     txt = txt[changesAt + matchLen:]
-                    changesAt, matchLen = checkHistory(thisHistory, txt, depth + 1)
+                    changesAt, matchLen = checkHistory(context, thisHistory, txt, depth + 1)
             return None, None       # No changes in current sentence
         else:
             # We didn't run into history. Check if we have a pre-history sentence tag in the sentence
-            startHistory = None
-            matchLen = None
-            for prehistory in d.preHistory:
-                match = prehistory.search(text)
-                if match is not None:
-                    if (startHistory is None) or (match.start() < startHistory):
-                        # Remember where we entered history
-                        startHistory = match.start()
-                        matchLen = len(match.group())
-            if startHistory is not None:
+            match = firstMarker('preHistory', text)
+            if match is not None:
+                # Remember where we entered history
+                startHistory = match.start()
+                matchLen = len(match.group())
                 # logging.debug('checkHistory() - found a pre-history tag at %d', startHistory)
                 return startHistory, matchLen
         return None, None
 
 
-def checkNegation(concept, text, start, sentenceNo, isNeg):
+def prefilterText(text):
+    '''
+    Return the text, in lowercase, for checking the literals that a configured regular expression requires (see mayMatch())
+    Parameters
+        text        - str, the text to be searched
+    Returns
+        lowerText   - str, the lowercase text, or None if the text is not ASCII (some non-ASCII characters match ASCII letters when ignoring case)
+    '''
+
+    if not text.isascii():
+        return None
+    return text.lower()
+
+
+def mayMatch(pattern, lowerText, counts):
+    '''
+    Check if a configured regular expression may match the text - the text must contain every literal that every match contains
+    Parameters
+        pattern     - compiled regular expression, the rule's pattern
+        lowerText   - str, the text in lowercase (from prefilterText()), or None if the text cannot be prefiltered
+        counts      - list, the caller's [rules run, rules skipped] for this family of rules (see addPrefilterStatistics())
+    Returns
+        mayMatch    - boolean, False if the pattern cannot match the text, so the rule can be skipped
+    '''
+
+    literals = d.requiredLiterals.get(pattern)
+    if (lowerText is not None) and (literals is not None):
+        for literal in literals:
+            if literal not in lowerText:
+                counts[1] += 1
+                return False
+    counts[0] += 1
+    return True
+
+
+def triggerPositions(pattern, text):
+    '''
+    Find every position in text where a negation or ambiguity trigger matches (including overlapping matches)
+    Parameters
+        pattern     - compiled regular expression, the trigger
+        text        - str, the text of a sentence
+    Returns
+        positions   - list or range, the start of every match, in order, or None if this trigger cannot be indexed
+    '''
+
+    if (unindexable.search(pattern.pattern) is not None) or ((pattern.flags & (re.ASCII | re.LOCALE)) != 0):
+        return None
+    if ((pattern.flags & re.DOTALL) != 0) and pattern.pattern.startswith('.*') and (pattern.pattern[2:3] not in ['*', '+', '{']) and ('|' not in pattern.pattern):
+        # A trigger starting with .* matches at every position up to the last position where it matches - which is a binary search,
+        # rather than a search that backtracks from the end of the text at every position
+        if pattern.match(text) is None:
+            return []
+        first = 0
+        last = len(text)
+        while first < last:
+            middle = (first + last + 1) // 2
+            if pattern.match(text, middle) is None:
+                last = middle - 1
+            else:
+                first = middle
+        return range(first + 1)
+    positions = []
+    match = pattern.search(text)
+    while match is not None:
+        if match.end() == match.start():        # finditer() has special rules for empty matches
+            return None
+        positions.append(match.start())
+        match = pattern.search(text, match.start() + 1)
+    return positions
+
+
+def sentenceTriggers(context, sentenceNo):
+    '''
+    Return the trigger index for this sentence, building it the first time it is needed.
+    The trigger index is a dictionary of the negation and ambiguity trigger families, and for each family, a list of the positions
+    in the sentence (from triggerPositions()) of each trigger in that family
+    Parameters
+        context     - d.AutoCodingContext, the state of AutoCoding this clinical document
+        sentenceNo  - int, the sentence in context.sentences
+    Returns
+        triggers    - dict, the trigger index for this sentence
+    '''
+
+    triggers = context.triggerIndexes.get(sentenceNo)
+    if triggers is None:
+        thisText = context.sentences[sentenceNo].text
+        lowerText = prefilterText(thisText)
+        counts = [0, 0]
+        triggers = {}
+        for family in triggerFamilies:
+            positions = []
+            for trigger in getattr(d, family):
+                if mayMatch(trigger[0], lowerText, counts):
+                    positions.append(triggerPositions(trigger[0], thisText))
+                else:       # This trigger is nowhere in the sentence
+                    positions.append([])
+            triggers[family] = positions
+        addPrefilterStatistics('triggers', counts)
+        context.triggerIndexes[sentenceNo] = triggers
+    return triggers
+
+
+def cleanCut(pattern, sentence, start, end):
+    '''
+    Check that slicing a sentence cannot create a match for a trigger that is not a match in the whole sentence.
+    Word boundaries (\\b and \\B) at the ends of a slice act as if there was a non-word character just outside the slice,
+    which only differs from the whole sentence if the character just outside the slice is a word character
+    Parameters
+        pattern     - compiled regular expression, the trigger
+        sentence    - str, the text of the sentence
+        start       - int, the start of the slice
+        end         - int, the end of the slice
+    Returns
+        isClean     - boolean, True if every match in the slice starts at a match in the whole sentence
+    '''
+
+    if end <= start:
+        return False
+    notBoundary = '\\B' in pattern.pattern
+    if (start > 0) and (wordChar.match(sentence, start - 1) is not None):
+        if notBoundary or (wordChar.match(sentence, start) is not None):
+            return False
+    if (end < len(sentence)) and (wordChar.match(sentence, end) is not None):
+        if notBoundary or (wordChar.match(sentence, end - 1) is not None):
+            return False
+    return True
+
+
+def findTriggers(positions, pattern, text, offset, sentence):
+    '''
+    Find the start of each match of a trigger in text, a slice of a sentence, exactly as pattern.finditer(text) would.
+    Only the positions of this trigger in the whole sentence can be the start of a match in the slice, so only they are checked
+    Parameters
+        positions   - list or range, the positions of this trigger in the sentence (from triggerPositions()), or None if this trigger is not indexed
+        pattern     - compiled regular expression, the trigger
+        text        - str, the slice of the sentence being searched
+        offset      - int, the start of text in the sentence, or None if text is not a simple slice of the sentence
+        sentence    - str, the text of the sentence
+    Returns
+        starts      - list, the start (in text) of each match
+    '''
+
+    if (positions is None) or (offset is None) or not cleanCut(pattern, sentence, offset, offset + len(text)):
+        return [match.start() for match in pattern.finditer(text)]
+    starts = []
+    nextPosition = bisect.bisect_left(positions, offset)
+    lastPosition = bisect.bisect_right(positions, offset + len(text))
+    while nextPosition < lastPosition:
+        match = pattern.match(text, positions[nextPosition] - offset)
+        if match is None:
+            nextPosition += 1
+            continue
+        if match.end() == match.start():        # finditer() has special rules for empty matches
+            return [match.start() for match in pattern.finditer(text)]
+        starts.append(match.start())
+        nextPosition = bisect.bisect_left(positions, offset + match.end(), nextPosition + 1, lastPosition)     # finditer() matches don't overlap
+    return starts
+
+
+def checkNegation(context, concept, text, start, sentenceNo, isNeg):
     '''
     Check if this concept needs to be negated
     concept (which was triggered by 'text'), is at (start) in the document,
     which is in sentence(sentenceNo). It may already be negated(isNeg)
     Parameters
+        context     - d.AutoCodingContext, the state of AutoCoding this clinical document
         concept     - str, the SolutionID
         text        - str, the text that has been coded to this SolutionID
         start       - int, the start of this text in this document
-        sentenceNo  - int, the sentence in d.sentences where this text/concept was found
+        sentenceNo  - int, the sentence in context.sentences where this text/concept was found
         isNeg       - boolean, True if concept is a negated concept
     Returns
         changeIt    - str, single character indication whether the negation of concept needs to be changed
@@ -256,166 +451,178 @@ def checkNegation(concept, text, start, sentenceNo, isNeg):
         prePost     - str, the name of the name of the data set of patterns containing reason
     '''
 
-    # logging.debug('looking for negation of %s[%s] in %s', text, isNeg, d.sentences[sentenceNo][4])
+    # logging.debug('looking for negation of %s[%s] in %s', text, isNeg, context.sentences[sentenceNo].text)
     changeIt = '0'
     changeAt = -1
     reason = ''
     prePost = ''
 
     # Find the start of this trigger in this sentence
-    thisStart = start - d.sentences[sentenceNo][2]      # Start in document minus start of this sentence
+    thisStart = start - context.sentences[sentenceNo].start      # Start in document minus start of this sentence
+    sentence = context.sentences[sentenceNo].text
+    triggers = sentenceTriggers(context, sentenceNo)
 
     # Find the nearest, preceding and following but boundaries, if any
     butBefore = None
     butAfter = None
-    for butBoundary in d.butBoundaries:
-        # logging.debug('looking for butBoundary (%s)', butBoundary.pattern)
-        match = butBoundary.search(d.sentences[sentenceNo][4])
-        if match is not None:
-            if match.start() < thisStart:
-                if (butBefore is None) or (butBefore < match.start()):
-                    butBefore = match.start()
-            elif match.start() > thisStart:
-                if (butAfter is None) or (butAfter > match.start()):
-                    butAfter = match.start()
-                # logging.debug('found butBoundary (%s) at %d', butBoundary, match.start())
+    buts = context.sentences[sentenceNo].markers['but']
+    before = bisect.bisect_left(buts, thisStart)
+    if before > 0:
+        butBefore = buts[before - 1]
+    after = bisect.bisect_right(buts, thisStart)
+    if after < len(buts):
+        butAfter = buts[after]
     # Truncate the sentence text if there are any but boundaries
     if butBefore is None:
         if butAfter is None:
-            thisText = d.sentences[sentenceNo][4]
+            thisText = context.sentences[sentenceNo].text
         else:
-            thisText = d.sentences[sentenceNo][4][:butAfter]
+            thisText = context.sentences[sentenceNo].text[:butAfter]
     else:
         thisStart -= butBefore
         if butAfter is None:
-            thisText = d.sentences[sentenceNo][4][butBefore:]
+            thisText = context.sentences[sentenceNo].text[butBefore:]
         else:
-            thisText = d.sentences[sentenceNo][4][butBefore:butAfter]
+            thisText = context.sentences[sentenceNo].text[butBefore:butAfter]
 
     # Find the start of the text for "post" things
     thisEnd = thisStart + len(text)
 
+    # Find the text for "pre" and "post" things, and where they are in the sentence
+    sliceStart = 0
+    if butBefore is not None:
+        sliceStart = butBefore
+    preText = thisText[:thisStart]
+    preAt = None
+    if thisStart >= 0:
+        preAt = sliceStart
+    postText = thisText[thisEnd:]
+    postAt = None
+    if thisEnd >= 0:
+        postAt = sliceStart + min(thisEnd, len(thisText))
+
     # Find the nearest negation before this concept
     if isNeg != '1':        # Don't look for negation of already negated
         # Check for pre-negations
-        for preNegate in d.preNegation:
+        for i, preNegate in enumerate(d.preNegation):
             if (len(preNegate) > 1) and (concept not in preNegate[1:]):        # Check if this negation is limited to a list of concepts
                 continue
             # logging.debug('looking for preNegation of (%s) in (%s)', preNegate[0].pattern, thisText[:thisStart])
-            for match in preNegate[0].finditer(thisText[:thisStart]):
-                if match.start() > changeAt:
-                    changeAt = match.start()
+            for matchStart in findTriggers(triggers['preNegation'][i], preNegate[0], preText, preAt, sentence):
+                if matchStart > changeAt:
+                    changeAt = matchStart
                     changeIt = '1'
                     reason = preNegate[0].pattern
                     prePost = 'preNegation'
                     # logging.debug('found preNegation(%s) at %d', reason, changeAt)
-        for immedPreNegate in d.immediatePreNegation:
+        for i, immedPreNegate in enumerate(d.immediatePreNegation):
             if (len(immedPreNegate) > 1) and (concept not in immedPreNegate[1:]):        # Check if this negation is limited to a list of concepts
                 continue
             # logging.debug('looking for immediatePreNegation of (%s) in (%s)', immedPreNegate[0].pattern, thisText[:thisStart])
-            for match in immedPreNegate[0].finditer(thisText[:thisStart]):
-                if match.start() > changeAt:
-                    changeAt = match.start()
+            for matchStart in findTriggers(triggers['immediatePreNegation'][i], immedPreNegate[0], preText, preAt, sentence):
+                if matchStart > changeAt:
+                    changeAt = matchStart
                     changeIt = '1'
                     reason = immedPreNegate[0].pattern
                     prePost = 'immediatePreNegation'
                     # logging.debug('found immediatePreNegation (%s) at %d', reason, changeAt)
-    for immedPreAmbig in d.immediatePreAmbiguous:
+    for i, immedPreAmbig in enumerate(d.immediatePreAmbiguous):
         if (len(immedPreAmbig) > 1) and (concept not in immedPreAmbig[1:]):        # Check if this ambiguity is limited to a list of concepts
             continue
         # logging.debug('looking for immediate preAmbiguous of (%s) in (%s)', immedPreAmbig[0].pattern, thisText[:thisStart + len(text)])
-        for match in immedPreAmbig[0].finditer(thisText[:thisStart]):
-            if match.start() > changeAt:
-                changeAt = match.start()
+        for matchStart in findTriggers(triggers['immediatePreAmbiguous'][i], immedPreAmbig[0], preText, preAt, sentence):
+            if matchStart > changeAt:
+                changeAt = matchStart
                 changeIt = '2'
                 reason = immedPreAmbig[0].pattern
                 prePost = 'immediatePreAmbiguous'
                 # logging.debug('found immediatePreAmbiguous(%s) at %d', reason, changeAt)
-    for preAmbig in d.preAmbiguous:
+    for i, preAmbig in enumerate(d.preAmbiguous):
         if (len(preAmbig) > 1) and (concept not in preAmbig[1:]):        # Check if this ambiguity is limited to a list of concepts
             continue
         # logging.debug('looking for preAmbiguous of (%s) in (%s)', preAmbig[0].pattern, thisText[:thisStart + len(text)])
-        for match in preAmbig[0].finditer(thisText[:thisStart]):
-            if match.start() > changeAt:
-                changeAt = match.start()
+        for matchStart in findTriggers(triggers['preAmbiguous'][i], preAmbig[0], preText, preAt, sentence):
+            if matchStart > changeAt:
+                changeAt = matchStart
                 changeIt = '2'
                 reason = preAmbig[0].pattern
                 prePost = 'preAmbiguous'
                 # logging.debug('found preAmbiguous(%s) at %d', reason, changeAt)
     if changeIt == '0':
         # No preNegate or preAmbiguous, so try postNegate and postAmbiguous
-        changeAt = len(d.sentences[sentenceNo][4]) + 1
-        for postAmbig, exceptAmbig in d.postAmbiguous:
+        changeAt = len(context.sentences[sentenceNo].text) + 1
+        for i, (postAmbig, exceptAmbig) in enumerate(d.postAmbiguous):
             # logging.debug('looking for postAmbigous of (%s) in (%s)', postAmbig.pattern, thisText[thisStart:])
-            for match in postAmbig.finditer(thisText[thisEnd:]):
+            for matchStart in findTriggers(triggers['postAmbiguous'][i], postAmbig, postText, postAt, sentence):
                 if exceptAmbig is not None:
-                    exceptMatch = exceptAmbig.search(thisText[thisEnd:])
+                    exceptMatch = exceptAmbig.search(postText)
                     if exceptMatch is not None:
                         continue
-                if match.start() < changeAt:
-                    changeAt = match.start()
+                if matchStart < changeAt:
+                    changeAt = matchStart
                     changeIt = '2'
                     reason = postAmbig.pattern
                     prePost = 'postAmbiguous'
                     # logging.debug('found postAmbigous(%s) at %d', postAmbig[0].pattern, changeAt)
-        for immedPostAmbig, exceptAmbig in d.immediatePostAmbiguous:
+        for i, (immedPostAmbig, exceptAmbig) in enumerate(d.immediatePostAmbiguous):
             # logging.debug('looking for immediate postAmbigous of (%s) in (%s)', immedPostAmbig.pattern, thisText[thisStart:])
-            for match in immedPostAmbig.finditer(thisText[thisEnd:]):
+            for matchStart in findTriggers(triggers['immediatePostAmbiguous'][i], immedPostAmbig, postText, postAt, sentence):
                 if exceptAmbig is not None:
-                    exceptMatch = immedPostAmbig[1].search(thisText[thisEnd:])
+                    exceptMatch = exceptAmbig.search(postText)
                     if exceptMatch is not None:
                         continue
-                if match.start() < changeAt:
-                    changeAt = match.start()
+                if matchStart < changeAt:
+                    changeAt = matchStart
                     changeIt = '2'
                     reason = immedPostAmbig.pattern
                     prePost = 'immediatePostAmbiguous'
                     # logging.debug('found immediatePostAmbigous(%s) at %d', immedPostAmbig[0].pattern, changeAt)
         if isNeg != '1':        # Don't look for negation of already negated
-            for postNegate, exceptNegate in d.postNegation:
+            for i, (postNegate, exceptNegate) in enumerate(d.postNegation):
                 # logging.debug('looking for postNegation of (%s) in (%s)', postNegate.pattern, thisText[thisStart:])
-                for match in postNegate.finditer(thisText[thisEnd:]):
+                for matchStart in findTriggers(triggers['postNegation'][i], postNegate, postText, postAt, sentence):
                     if exceptNegate is not None:
-                        exceptMatch = exceptNegate.search(thisText[thisEnd:])
+                        exceptMatch = exceptNegate.search(postText)
                         if exceptMatch is not None:
                             continue
-                    if match.start() < changeAt:
-                        changeAt = match.start()
+                    if matchStart < changeAt:
+                        changeAt = matchStart
                         changeIt = '1'
                         reason = postNegate.pattern
                         prePost = 'postNegation'
                         # logging.debug('found postNegation(%s) at %d', postNegate[0].pattern, changeAt)
-            for immedPostNegate, exceptNegate in d.immediatePostNegation:
+            for i, (immedPostNegate, exceptNegate) in enumerate(d.immediatePostNegation):
                 # logging.debug('looking for immediatePostNegation of (%s) in (%s)', immedPostNegate.pattern, thisText[thisStart:])
-                for match in immedPostNegate.finditer(thisText[thisEnd:]):
+                for matchStart in findTriggers(triggers['immediatePostNegation'][i], immedPostNegate, postText, postAt, sentence):
                     if exceptNegate is not None:
-                        exceptMatch = exceptNegate.search(thisText[thisEnd:])
+                        exceptMatch = exceptNegate.search(postText)
                         if exceptMatch is not None:
                             continue
-                    if match.start() < changeAt:
-                        changeAt = match.start()
+                    if matchStart < changeAt:
+                        changeAt = matchStart
                         changeIt = '1'
-                        reason = immedPostNegate[0].pattern
+                        reason = immedPostNegate.pattern
                         prePost = 'immediatePostNegation'
                         # logging.debug('found immediatePostNegation (%s) at %d', immedPostNegate[0].pattern, changeAt)
     return (changeIt, reason, prePost)
 
 
-def checkModified(concept, isNeg, sentenceNo, start, miniDoc):
+def checkModified(context, concept, isNeg, sentenceNo, start, miniDoc):
     '''
     Check if this concept has a modified definition,
     either because of an immediately preceding preModifier or because of an immediately following postModifier
     and if it does, then modify it.
     Parameters
+        context     - d.AutoCodingContext, the state of AutoCoding this clinical document
         concept     - str, SolutionID which may need modification
         isNeg       - str, one character indicating negation/ambiguity
-        sentenceNo  - int, the sentence in d.sentences where this concept was found
+        sentenceNo  - int, the sentence in context.sentences where this concept was found
         start       - int, the location of the text in this sentence which was coded to this concept
     Returns
         nothing
     '''
 
-    document = d.sentences[sentenceNo][6]        # Sentences hold mini-documents
+    document = context.sentences[sentenceNo].document        # Sentences hold mini-documents
     # Check concept, oldNeg, newConcept, newNeg, pattern
     if concept in d.preModifiers:
         thisNeg, newConcept, newNeg, modifier = d.preModifiers[concept]
@@ -424,16 +631,11 @@ def checkModified(concept, isNeg, sentenceNo, start, miniDoc):
                 return
         # Phrases preceding this concept that change the semantic meaning of this concept
         # this.logger.debug('looking for preModifier of (%s) in (%s)', str(preModier[4].pattern), str(preText))
-        preText = d.sentences[sentenceNo][4][:start]    # The text before this concept text in the sentence
+        preText = context.sentences[sentenceNo].text[:start]    # The text before this concept text in the sentence
         match = modifier.search(preText)
         if match is not None:
             logging.info('Changing concept from (%s[%s]) to (%s[%s])', concept, isNeg, newConcept, newNeg)
-            if newConcept in d.solutionMetaThesaurus:
-                document[start][miniDoc]['description'] = d.solutionMetaThesaurus[newConcept]['description'] + '(was:' + concept + ')'
-            else:
-                document[start][miniDoc]['description'] = 'unknown (was:' + concept + ' - ' + document[start][miniDoc]['description'] + ')'
-            document[start][miniDoc]['concept'] = newConcept
-            document[start][miniDoc]['negation'] = newNeg
+            document[start][miniDoc].modify(concept, newConcept, newNeg)
     # Check concept, oldNeg, newConcept, newNeg, pattern
     if concept in d.postModifiers:
         thisNeg, newConcept, newNeg, modifier = d.postModifiers[concept]
@@ -442,30 +644,232 @@ def checkModified(concept, isNeg, sentenceNo, start, miniDoc):
                 return
         # Phrases that follow this concept and change the semantic meaning of this concept
         # this.logger.debug('looking for postModifier of (%s) in (%s)', str(postModier[4].pattern), str(preText))
-        conceptEnd = start + document[start][miniDoc]['length']            # The end of this concept text in the sentence
-        postText = d.sentences[sentenceNo][4][conceptEnd:]    # The text after this concept text in the sentence
+        conceptEnd = start + document[start][miniDoc].length            # The end of this concept text in the sentence
+        postText = context.sentences[sentenceNo].text[conceptEnd:]    # The text after this concept text in the sentence
         match = modifier.search(postText)
         if match is not None:
             logging.info('Changing concept from (%s[%s]) to (%s[%s])', concept, isNeg, newConcept, newNeg)
-            if newConcept in d.solutionMetaThesaurus:
-                document[start][miniDoc]['description'] = d.solutionMetaThesaurus[newConcept]['description'] + '(was:' + concept + ')'
-            else:
-                document[start][miniDoc]['description'] = 'unknown (was:' + concept + ' - ' + document[start][miniDoc]['description'] + ')'
-            document[start][miniDoc]['concept'] = newConcept
-            document[start][miniDoc]['negation'] = newNeg
+            document[start][miniDoc].modify(concept, newConcept, newNeg)
+    return
+
+
+def conceptInventory(context, history):
+    '''
+    Count the concepts in this document that could be part of a concept set - the unused concepts in the history, or non-history, text
+    Parameters
+        context     - d.AutoCodingContext, the state of AutoCoding this clinical document
+        history     - boolean, True if we are checking in historical text
+    Returns
+        inventory   - dict, the count of each (concept, negation) in the document
+    '''
+
+    inventory = {}
+    for sentence in context.sentences:
+        for alternates in sentence.document.values():
+            for miniDoc in alternates:
+                if (miniDoc.history != history) or miniDoc.used:
+                    continue
+                key = (miniDoc.concept, miniDoc.negation)
+                if key not in inventory:
+                    inventory[key] = 1
+                else:
+                    inventory[key] += 1
+    return inventory
+
+
+def setCandidates(inventory):
+    '''
+    Find the concept sets that could be started in this document - the concept sets with at least one concept that is in the document
+    and the concept sequence sets whose first concept is in the document.
+    This uses the inverted index from concept to concept sets (d.conceptSetIndex)
+    Parameters
+        inventory   - dict, the count of each (concept, negation) in the document
+    Returns
+        candidates  - dict, for each kind of concept set, the set of the numbers of the concept sets that could be started
+    '''
+
+    concepts = set(concept for concept, isNeg in inventory)
+    candidates = {}
+    for setsName, index in d.conceptSetIndex.items():
+        candidates[setsName] = set()
+        for concept in concepts:
+            if concept in index:
+                candidates[setsName].update(index[concept])
+    return candidates
+
+
+def setIsPossible(inventory, thisSet, isSequence):
+    '''
+    Check that the document has enough of each of the concepts in this concept set for the set to be found
+    Parameters
+        inventory   - dict, the count of each (concept, negation) in the document
+        thisSet     - list, the (concept, negation) of each concept in this concept set
+        isSequence  - boolean, True if this is a concept sequence set (where ambiguous negations match each other)
+    Returns
+        isPossible  - boolean, False if at least one of the concepts in this concept set is not in the document often enough
+    '''
+
+    toFindCount = {}        # The count of the number of times each concept/negation occurs in this set
+    for concept, isNeg in thisSet:
+        if (concept, isNeg) not in toFindCount:
+            toFindCount[(concept, isNeg)] = 1
+        else:
+            toFindCount[(concept, isNeg)] += 1
+    for (concept, isNeg), count in toFindCount.items():
+        if isSequence and (isNeg in ['2', '3']):
+            found = inventory.get((concept, '2'), 0) + inventory.get((concept, '3'), 0)
+        else:
+            found = inventory.get((concept, isNeg), 0)
+        if found < count:
+            return False
+    return True
+
+
+def setStatistics():
+    '''
+    Return a copy of the concept set statistics
+    Parameters
+        None
+    Returns
+        stats - dict, checked (concept sets stepped through the sentences), absent (skipped - not started in the document)
+                and incomplete (skipped - some concept missing from the document)
+    '''
+
+    with statsLock:
+        return dict(d.conceptSetStats)
+
+
+def addSetStatistics(counts):
+    '''
+    Add to the concept set statistics
+    Parameters
+        counts - dict, the amount to add to each concept set statistic
+    Returns
+        Nothing
+    '''
+
+    with statsLock:
+        for stat, count in counts.items():
+            d.conceptSetStats[stat] += count
+    return
+
+
+def mergeSetStatistics(stats):
+    '''
+    Add the concept set statistics from a worker process to these statistics
+    Parameters
+        stats - dict, the worker's concept set statistics (from setStatistics())
+    Returns
+        Nothing
+    '''
+
+    addSetStatistics(stats)
+    return
+
+
+def logSetStatistics():
+    '''
+    Log the concept set statistics
+    Parameters
+        None
+    Returns
+        Nothing
+    '''
+
+    stats = setStatistics()
+    logging.info('Concept sets: checked(%d), skipped(%d) - not started in the document(%d), some concept missing from the document(%d)',
+                 stats['checked'], stats['absent'] + stats['incomplete'], stats['absent'], stats['incomplete'])
+    return
+
+
+def prefilterStatistics():
+    '''
+    Return a copy of the literal prefilter statistics
+    Parameters
+        None
+    Returns
+        stats - dict, for each family of rules, [rules run, rules skipped because a required literal was not in the text]
+    '''
+
+    stats = {}
+    with statsLock:
+        for family, counts in d.prefilterStats.items():
+            stats[family] = list(counts)
+    return stats
+
+
+def addPrefilterStatistics(family, counts):
+    '''
+    Add to the literal prefilter statistics for a family of rules
+    Parameters
+        family  - str, the family of rules in d.prefilterStats (e.g. 'triggers')
+        counts  - list, [rules run, rules skipped] to add
+    Returns
+        Nothing
+    '''
+
+    with statsLock:
+        d.prefilterStats[family][0] += counts[0]
+        d.prefilterStats[family][1] += counts[1]
+    return
+
+
+def mergePrefilterStatistics(stats):
+    '''
+    Add the literal prefilter statistics from a worker process to these statistics
+    Parameters
+        stats - dict, the worker's literal prefilter statistics (from prefilterStatistics())
+    Returns
+        Nothing
+    '''
+
+    for family, counts in stats.items():
+        addPrefilterStatistics(family, counts)
+    return
+
+
+def logPrefilterStatistics():
+    '''
+    Log the literal prefilter statistics - the skip rate for each family of rules
+    Parameters
+        None
+    Returns
+        Nothing
+    '''
+
+    for family, (run, skipped) in prefilterStatistics().items():
+        if run + skipped > 0:
+            logging.info('Literal prefilter for %s: run(%d), skipped(%d) - %.1f%% skipped', family, run, skipped, 100.0 * skipped / (run + skipped))
     return
 
 
-def checkSets(history):
+def checkSets(context, history):
     '''
     Work through each of the 'sets' concepts and see if we can find matches for each 'set'
     We do sentence sets before document sets, and sequential sets before non-sequential sets.
     Parameters
+        context - d.AutoCodingContext, the state of AutoCoding this clinical document
         history - boolean, True if we are checking in historical text
     Returns
         Nothing
     '''
 
+    # Only check the concept sets that could be found, using an inventory of the concepts in this document.
+    # Sets with none of their concepts in the document (sequence sets without their first concept) can't be started
+    # and sets with a concept that is missing from the document can't be completed.
+    # Finding a set adds a higher concept (which may be in other sets) and marks concepts as used, so the inventory is refreshed after any set is found
+    inventory = conceptInventory(context, history)
+    candidates = setCandidates(inventory)
+    changed = False
+    setStats = {'checked':0, 'absent':0, 'incomplete':0}     # This check's concept set statistics - added to d.conceptSetStats at the end
+    # The document concept sets use the sentenceEnd left by the last sentence set, which an incomplete set can move,
+    # so the last sentence set is checked whenever it is started
+    lastSentenceSet = None
+    for setsName in ['sentenceConceptSequenceSets', 'sentenceConceptSets']:
+        for setNo, conceptSet in enumerate(getattr(d, setsName)):
+            if len(conceptSet[1]) > 0:
+                lastSentenceSet = (setsName, setNo)
+
     # Check if any of the sentences contains any of the the Sentence (Strict) Sequence Concept Sets
     # We test sentence sequence sets first because they are a stricter test.
     # Sentence sequence sets are checked in the order in which they are appended to the sentenceConceptSequenceSets array
@@ -478,36 +882,54 @@ def checkSets(history):
         #               setNo, history, d.sentenceConceptSequenceSets[setNo])
         if len(thisSet) == 0:       # Empty concept list
             continue
+        if changed:
+            inventory = conceptInventory(context, history)
+            candidates = setCandidates(inventory)
+            changed = False
+        if setNo not in candidates['sentenceConceptSequenceSets']:      # The first concept in this set is not in this document
+            setStats['absent'] += 1
+            if len(context.sentences) > 0:
+                # Leave sentenceEnd where stepping through the sentences would have left it (the document concept sets use it)
+                lastSentence = len(context.sentences) + sentenceRange - 2
+                if lastSentence >= len(context.sentences):
+                    lastSentence = len(context.sentences) - 1
+                sentenceEnd = context.sentences[lastSentence].start + context.sentences[lastSentence].length
+            continue
+        # An incomplete strict set is still checked, as abandoning a started strict set is logged
+        if (not isStrict) and (('sentenceConceptSequenceSets', setNo) != lastSentenceSet) and not setIsPossible(inventory, thisSet, True):
+            setStats['incomplete'] += 1
+            continue
+        setStats['checked'] += 1
         conceptNo = 0           # The index of the next concept in the sequence set
         conceptList = []        # The concepts in this set that have been found
         concept, isNeg = thisSet[conceptNo]     # The next concept that we are looking for
         firstConcept, firstIsNeg = thisSet[0]
-        for sentenceNo, sentence in enumerate(d.sentences):            # Step through each sentence
+        for sentenceNo, sentence in enumerate(context.sentences):            # Step through each sentence
             # logging.debug('checkSets() - sentence Concept (Strict) Sequence Sets - processing sentence[%d]', sentenceNo)
-            document = sentence[6]        # Sentences hold mini-documents
+            document = sentence.document        # Sentences hold mini-documents
             if len(conceptList) == 0:        # Compute a new 'valid range' if still looking for the first concept
                 # Compute the last sentence for this range
                 lastSentence = sentenceNo + sentenceRange - 1
-                if lastSentence >= len(d.sentences):
-                    lastSentence = len(d.sentences) - 1
+                if lastSentence >= len(context.sentences):
+                    lastSentence = len(context.sentences) - 1
                 # Compute the character position of the end of the last sentence in this range
-                sentenceEnd = d.sentences[lastSentence][2] + d.sentences[lastSentence][3]
-            for thisStart in sorted(document, key=int):        # We step through all concepts in each sentence
+                sentenceEnd = context.sentences[lastSentence].start + context.sentences[lastSentence].length
+            for thisStart in document:        # We step through all concepts in each sentence, in order
                 conceptFound = False                    # Concept in theSet at 'conceptNo' not yet found at thisStart
                 for jj, miniDoc in enumerate(document[thisStart]):    # Step through the list of alternate concepts at this point in this sentence
                     # Only check history if we are looking for history, and non-history if we are looking for non-history
-                    if miniDoc['history'] != history:
-                        # logging.debug('checkSets() - skipping (%s) - wrong history (%s v. %s)', miniDoc['concept'], miniDoc['history'], history)
+                    if miniDoc.history != history:
+                        # logging.debug('checkSets() - skipping (%s) - wrong history (%s v. %s)', miniDoc.concept, miniDoc.history, history)
                         break
-                    if miniDoc['used']:        # Skip used concepts
-                        # logging.debug('checkSets() - skipping (%s) - used', miniDoc['concept'])
+                    if miniDoc.used:        # Skip used concepts
+                        # logging.debug('checkSets() - skipping (%s) - used', miniDoc.concept)
                         continue
                     # Ignore any concept who's text extends beyond this sentence range
-                    if thisStart + miniDoc['length'] > sentenceEnd:
-                        # logging.debug('checkSets() - skipping (%s) - beyond end of sentence', miniDoc['concept'])
+                    if thisStart + miniDoc.length > sentenceEnd:
+                        # logging.debug('checkSets() - skipping (%s) - beyond end of sentence', miniDoc.concept)
                         continue
-                    thisConcept = miniDoc['concept']        # This concept
-                    thisIsNeg = miniDoc['negation']        # And it's negation
+                    thisConcept = miniDoc.concept        # This concept
+                    thisIsNeg = miniDoc.negation        # And it's negation
                     # Only check concepts that we know something about - the appeared in one of our configuration files
                     if thisConcept not in d.knownConcepts:
                         # logging.debug('checkSets() - skipping (%s) - unknown concept', thisConcept)
@@ -531,10 +953,10 @@ def checkSets(history):
                             # Found the first concept - restart the multi-sentence counter
                             # Compute the last sentence for this range
                             lastSentence = sentenceNo + sentenceRange - 1
-                            if lastSentence >= len(d.sentences):
-                                lastSentence = len(d.sentences) - 1
+                            if lastSentence >= len(context.sentences):
+                                lastSentence = len(context.sentences) - 1
                             # Compute the character position of the end of the last sentence in this range
-                            sentenceEnd = d.sentences[lastSentence][2] + d.sentences[lastSentence][3]
+                            sentenceEnd = context.sentences[lastSentence].start + context.sentences[lastSentence].length
                             conceptList = []
                             conceptList.append((sentenceNo, thisStart, jj))        # Add to the list of things we may need to mark as 'used'
                             conceptNo = 1
@@ -552,26 +974,27 @@ def checkSets(history):
                     if len(conceptList) == len(thisSet):
                         # We have a full concept (strict) (sequence) set - so save the higher concept - append the higher concept to the list of alternates
                         logging.info('checkSets(%s) - sentence concept sequence set (%s:%s) found', history, higherConcept, thisSet)
-                        f.addAdditionalConcept(higherConcept, sentenceNo, thisStart, jj, None, higherConceptNegated,
+                        f.addAdditionalConcept(context, higherConcept, sentenceNo, thisStart, jj, None, higherConceptNegated,
                                             f'sentenceConceptSequenceSet:{repr(thisSet)}', 0)
+                        changed = True
 
                         # Check if we should mark all/some of the concepts in the concept list as used
-                        if asserted or (d.sc.higherConceptFound(higherConcept)):
+                        if asserted or (d.sc.higherConceptFound(context, higherConcept)):
                             for sno, strt, k in conceptList:
-                                foundConcept = d.sentences[sno][6][strt][k]['concept']
+                                foundConcept = context.sentences[sno].document[strt][k].concept
                                 # Check if we should mark this concepts in the concept list as used
-                                if asserted or (d.sc.setConcept(higherConcept, foundConcept)):
-                                    d.sentences[sno][6][strt][k]['used'] = True
+                                if asserted or (d.sc.setConcept(context, higherConcept, foundConcept)):
+                                    context.sentences[sno].document[strt][k].used = True
                                     # logging.debug('checkSets() - marking sentence concept sequence set item at %d/%d as used', strt, k)
 
                         conceptNo = 0        # Restart in case the same concept sequence set exists later in the sentences
                         conceptList = []
                         # Compute the last sentence for this range
                         lastSentence = sentenceNo + sentenceRange - 1
-                        if lastSentence >= len(d.sentences):
-                            lastSentence = len(d.sentences) - 1
+                        if lastSentence >= len(context.sentences):
+                            lastSentence = len(context.sentences) - 1
                         # Compute the character position of the end of the last sentence in this range
-                        sentenceEnd = d.sentences[lastSentence][2] + d.sentences[lastSentence][3]
+                        sentenceEnd = context.sentences[lastSentence].start + context.sentences[lastSentence].length
                         break   # Proceed to next 'start' in this sentence
                     else:
                         concept, isNeg = thisSet[conceptNo]     # The next concept that we are looking for
@@ -583,9 +1006,9 @@ def checkSets(history):
                     conceptList = []
                     # Compute the last sentence for this range
                     lastSentence = sentenceNo + sentenceRange - 1
-                    if lastSentence >= len(d.sentences):
-                        lastSentence = len(d.sentences) - 1
-                    sentenceEnd = d.sentences[lastSentence][2] + d.sentences[lastSentence][3]
+                    if lastSentence >= len(context.sentences):
+                        lastSentence = len(context.sentences) - 1
+                    sentenceEnd = context.sentences[lastSentence].start + context.sentences[lastSentence].length
             # end of all the concepts in this sentence
             # If we are part way through matching the concepts, but this is the last sentence in the current range then start again
             if (conceptNo > 0) and (sentenceNo == lastSentence):
@@ -604,6 +1027,23 @@ def checkSets(history):
         #               history, setNo, d.sentenceConceptSets[setNo])
         if len(thisSet) == 0:       # Empty concept list
             continue
+        if changed:
+            inventory = conceptInventory(context, history)
+            candidates = setCandidates(inventory)
+            changed = False
+        if setNo not in candidates['sentenceConceptSets']:      # None of the concepts in this set are in this document
+            setStats['absent'] += 1
+            if len(context.sentences) > 0:
+                # Leave sentenceEnd where stepping through the sentences would have left it (the document concept sets use it)
+                lastSentence = len(context.sentences) + sentenceRange - 2
+                if lastSentence >= len(context.sentences):
+                    lastSentence = len(context.sentences) - 1
+                sentenceEnd = context.sentences[lastSentence].start + context.sentences[lastSentence].length
+            continue
+        if (('sentenceConceptSets', setNo) != lastSentenceSet) and not setIsPossible(inventory, thisSet, False):
+            setStats['incomplete'] += 1
+            continue
+        setStats['checked'] += 1
         toFindCount = {}        # The count of the number of times each concept/negation occurs in this set
         for concept, isNeg in thisSet:
             if (concept, isNeg) not in toFindCount:
@@ -611,29 +1051,29 @@ def checkSets(history):
             else:
                 toFindCount[(concept, isNeg)] += 1
         conceptList = []        # The concepts in this set that have been found
-        for sentenceNo, sentence in enumerate(d.sentences):            # Step through each sentence
+        for sentenceNo, sentence in enumerate(context.sentences):            # Step through each sentence
             # logging.debug('checkSets(%s) - sentence Concept Sets - processing sentence %d', history, sentenceNo)
-            document = sentence[6]        # Sentences hold mini-documents
+            document = sentence.document        # Sentences hold mini-documents
             if len(conceptList) == 0:        # Compute a new 'valid range' if still looking for the first concept
                 # Compute the last sentence for this range
                 lastSentence = sentenceNo + sentenceRange - 1
-                if lastSentence >= len(d.sentences):
-                    lastSentence = len(d.sentences) - 1
+                if lastSentence >= len(context.sentences):
+                    lastSentence = len(context.sentences) - 1
                 # Compute the character position of the end of the last sentence in this range
-                sentenceEnd = d.sentences[lastSentence][2] + d.sentences[lastSentence][3]
+                sentenceEnd = context.sentences[lastSentence].start + context.sentences[lastSentence].length
 
-            for thisStart in sorted(document, key=int):        # We step through all concepts in each sentence
+            for thisStart in document:        # We step through all concepts in each sentence, in order
                 for jj, miniDoc in enumerate(document[thisStart]):    # Step through the list of alternate concepts at this point in this sentence
                     # Only check history if we are looking for history, and non-history if we are looking for non-history
-                    if miniDoc['history'] != history:
+                    if miniDoc.history != history:
                         break
-                    if miniDoc['used']:        # Skip used concepts
+                    if miniDoc.used:        # Skip used concepts
                         continue
                     # Ignore any concept who's text extends beyond this sentence range
-                    if thisStart + miniDoc['length'] > sentenceEnd:
+                    if thisStart + miniDoc.length > sentenceEnd:
                         continue
-                    thisConcept = miniDoc['concept']        # This concept
-                    thisIsNeg = miniDoc['negation']        # And it's negation
+                    thisConcept = miniDoc.concept        # This concept
+                    thisIsNeg = miniDoc.negation        # And it's negation
                     # Only check concepts that we know something about - the appeared in one of our configuration files
                     if thisConcept not in d.knownConcepts:
                         continue
@@ -648,16 +1088,17 @@ def checkSets(history):
                     if len(conceptList) == len(thisSet):
                         # We have a full concept set - so save the higher concept - append the higher concept to the list of alternates
                         logging.info('checkSets(%s) - sentence concept setNo %d found - (%s <- %s)', history, setNo, higherConcept, thisSet)
-                        f.addAdditionalConcept(higherConcept, sentenceNo, thisStart, jj, None, higherConceptNegated,
+                        f.addAdditionalConcept(context, higherConcept, sentenceNo, thisStart, jj, None, higherConceptNegated,
                                             f'sentenceConceptSequenceSet:{repr(thisSet)}', 0)
+                        changed = True
 
                         # Check if we should mark all/some of the concepts in the concept list as used
-                        if (asserted) or (d.sc.higherConceptFound(higherConcept)):
+                        if (asserted) or (d.sc.higherConceptFound(context, higherConcept)):
                             for sno, strt, k in conceptList:
-                                foundConcept = d.sentences[sno][6][strt][k]['concept']
+                                foundConcept = context.sentences[sno].document[strt][k].concept
                                 # Check if we should mark this concepts in the concept list as used
-                                if asserted or (d.sc.setConcept(higherConcept, foundConcept)):
-                                    d.sentences[sno][6][strt][k]['used'] = True
+                                if asserted or (d.sc.setConcept(context, higherConcept, foundConcept)):
+                                    context.sentences[sno].document[strt][k].used = True
                                     # logging.debug('checkSets(%s) - marking sentence concept sequence set item at %d/%d as used', history, strt, k)
 
                         # Restart in case the same concept sequence set exists later in the sentences
@@ -670,10 +1111,10 @@ def checkSets(history):
                         conceptList = []        # The concepts in this set that have been found
                         # Compute the last sentence for this range
                         lastSentence = sentenceNo + sentenceRange - 1
-                        if lastSentence >= len(d.sentences):
-                            lastSentence = len(d.sentences) - 1
+                        if lastSentence >= len(context.sentences):
+                            lastSentence = len(context.sentences) - 1
                         # Compute the character position of the end of the last sentence in this range
-                        sentenceEnd = d.sentences[lastSentence][2] + d.sentences[lastSentence][3]
+                        sentenceEnd = context.sentences[lastSentence].start + context.sentences[lastSentence].length
                         break   # Proceed to next 'start' in this sentence
                 # end of all the alternate concepts at this point in the sentence
             # end of all the concepts in this sentence
@@ -689,22 +1130,34 @@ def checkSets(history):
     for setNo, (higherConcept, thisSet, sentenceRange, higherConceptNegated, asserted) in enumerate(d.documentConceptSequenceSets):
         # sentenceRange will be '1' and should be ignored, as this is a whole of document check
         # logging.debug('checkSets(%s) - checking document concept sequence setNo %d - (%s)', history, setNo, d.documentConceptSequenceSets[setNo])
+        if changed:
+            inventory = conceptInventory(context, history)
+            candidates = setCandidates(inventory)
+            changed = False
+        if (len(thisSet) > 0) and (setNo not in candidates['documentConceptSequenceSets']):      # The first concept in this set is not in this document
+            setStats['absent'] += 1
+            continue
+        # An incomplete set can still restart, on a repeat of its first concept, which moves the sentenceEnd used by the document concept sets
+        if (len(thisSet) > 0) and not setIsPossible(inventory, thisSet, True) and not setIsPossible(inventory, thisSet[:1] * 2, True):
+            setStats['incomplete'] += 1
+            continue
+        setStats['checked'] += 1
         conceptNo = 0                # Check each concept in the set in sequence
         conceptList = []            # And remember which one's we've found so we can mark them as used if we get a full set
         concept, isNeg = thisSet[conceptNo]     # The next concept that we are looking for
         firstConcept, firstIsNeg = thisSet[0]
-        for sentenceNo, sentence in enumerate(d.sentences):            # Step through each sentence
+        for sentenceNo, sentence in enumerate(context.sentences):            # Step through each sentence
             # logging.debug('checkSets - document Concept Sequence Sets - processing sentence[%d]', sentenceNo)
-            document = sentence[6]    # Sentences hold mini-documents
-            for thisStart in sorted(document, key=int):
+            document = sentence.document    # Sentences hold mini-documents
+            for thisStart in document:
                 conceptFound = False                    # Concept in theSet at 'conceptNo' not yet found at thisStart
                 for jj, miniDoc in enumerate(document[thisStart]):
                     # Only check history if we are looking for history, and non-history if we are looking for non-history
-                    if miniDoc['history'] != history:
+                    if miniDoc.history != history:
                         break
-                    thisConcept =  miniDoc['concept']
-                    thisIsNeg =  miniDoc['negation']        # Check negation matches
-                    if miniDoc['used']:        # Skip used concepts [only Findings get 'used']
+                    thisConcept =  miniDoc.concept
+                    thisIsNeg =  miniDoc.negation        # Check negation matches
+                    if miniDoc.used:        # Skip used concepts [only Findings get 'used']
                         continue
                     # Only check concepts that we know something about - the appeared in one of our configuration files
                     if thisConcept not in d.knownConcepts:
@@ -726,10 +1179,10 @@ def checkSets(history):
                             # Found the first concept - restart the multi-sentence counter
                             # Compute the last sentence for this range
                             lastSentence = sentenceNo + sentenceRange - 1
-                            if lastSentence >= len(d.sentences):
-                                lastSentence = len(d.sentences) - 1
+                            if lastSentence >= len(context.sentences):
+                                lastSentence = len(context.sentences) - 1
                             # Compute the character position of the end of the last sentence in this range
-                            sentenceEnd = d.sentences[lastSentence][2] + d.sentences[lastSentence][3]
+                            sentenceEnd = context.sentences[lastSentence].start + context.sentences[lastSentence].length
                             conceptList = []
                             conceptList.append((sentenceNo, thisStart, jj))        # Add to the list of things we may need to mark as 'used'
                             conceptNo = 1
@@ -745,28 +1198,29 @@ def checkSets(history):
                     if conceptNo == len(thisSet):
                         # We have a full set - so save the higher concept
                         logging.info('checkSets(%s) - document concept Sequence set (%s <- %s) found', history, higherConcept, thisSet)
-                        f.addAdditionalConcept(higherConcept, sentenceNo, thisStart, jj, None, higherConceptNegated,
+                        f.addAdditionalConcept(context, higherConcept, sentenceNo, thisStart, jj, None, higherConceptNegated,
                                              f'documentConceptSequenceSet:{repr(thisSet)}', 0)
+                        changed = True
 
                         # Check if we should mark all/some of the concepts in the concept list as used
-                        if asserted or (d.sc.higherConceptFound(higherConcept)):
+                        if asserted or (d.sc.higherConceptFound(context, higherConcept)):
                             for item, thisList in enumerate(conceptList):
                                 sno = thisList[0]
                                 strt = thisList[1]
                                 k = thisList[2]
-                                foundConcept = d.sentences[sno][6][strt][k]['concept']
+                                foundConcept = context.sentences[sno].document[strt][k].concept
                                 # Check if we should mark this concepts in the concept list as used
-                                if asserted or (d.sc.setConcept(higherConcept, foundConcept)):
-                                    d.sentences[sno][6][strt][k]['used'] = True
+                                if asserted or (d.sc.setConcept(context, higherConcept, foundConcept)):
+                                    context.sentences[sno].document[strt][k].used = True
                                 # logging.debug('Marking document concept Sequence set item at %d/%d as used', strt, k)
                         conceptNo = 0        # Restart in case the same concept sequence set exists later in the sentences
                         conceptList = []
                         # Compute the last sentence for this range
                         lastSentence = sentenceNo + sentenceRange - 1
-                        if lastSentence >= len(d.sentences):
-                            lastSentence = len(d.sentences) - 1
+                        if lastSentence >= len(context.sentences):
+                            lastSentence = len(context.sentences) - 1
                         # Compute the character position of the end of the last sentence in this range
-                        sentenceEnd = d.sentences[lastSentence][2] + d.sentences[lastSentence][3]
+                        sentenceEnd = context.sentences[lastSentence].start + context.sentences[lastSentence].length
                         break   # Proceed to next 'start' in this sentence
                     # end of list of things to check
                 # end of all the alternate concepts at this point in the sentence
@@ -781,6 +1235,17 @@ def checkSets(history):
         # logging.debug('checkSets(%s) - checking document Concept setNo %d - (%s)', history d.documentConceptSets[setNo])
         if len(thisSet) == 0:       # Empty concept list
             continue
+        if changed:
+            inventory = conceptInventory(context, history)
+            candidates = setCandidates(inventory)
+            changed = False
+        if setNo not in candidates['documentConceptSets']:      # None of the concepts in this set are in this document
+            setStats['absent'] += 1
+            continue
+        if not setIsPossible(inventory, thisSet, False):       # Some concept in this set is missing from the document
+            setStats['incomplete'] += 1
+            continue
+        setStats['checked'] += 1
         toFindCount = {}        # The count of the number of times each concept/negation occurs in this set
         for concept, isNeg in thisSet:
             if (concept, isNeg) not in toFindCount:
@@ -788,21 +1253,21 @@ def checkSets(history):
             else:
                 toFindCount[(concept, isNeg)] += 1
         conceptList = []        # The concepts in this set that have been found
-        for sentenceNo, sentence in enumerate(d.sentences):            # Step through each sentence
+        for sentenceNo, sentence in enumerate(context.sentences):            # Step through each sentence
             # logging.debug('checkSets(%s) - document Concept Sets - processing sentence no %d', history, sentenceNo)
-            document = sentence[6]        # Sentences hold mini-documents
-            for thisStart in sorted(document, key=int):        # We step through all concepts in each sentence
+            document = sentence.document        # Sentences hold mini-documents
+            for thisStart in document:        # We step through all concepts in each sentence, in order
                 for jj, miniDoc in enumerate(document[thisStart]):    # Step through the list of alternate concepts at this point in this sentence
                     # Only check history if we are looking for history, and non-history if we are looking for non-history
-                    if miniDoc['history'] != history:
+                    if miniDoc.history != history:
                         break
-                    if miniDoc['used']:        # Skip used concepts
+                    if miniDoc.used:        # Skip used concepts
                         continue
                     # Ignore any concept who's text extends beyond this sentence range
-                    if thisStart + miniDoc['length'] > sentenceEnd:
+                    if thisStart + miniDoc.length > sentenceEnd:
                         continue
-                    thisConcept = miniDoc['concept']        # This concept
-                    thisIsNeg = miniDoc['negation']        # And it's negation
+                    thisConcept = miniDoc.concept        # This concept
+                    thisIsNeg = miniDoc.negation        # And it's negation
                     # Only check concepts that we know something about - the appeared in one of our configuration files
                     if thisConcept not in d.knownConcepts:
                         continue
@@ -817,16 +1282,17 @@ def checkSets(history):
                     if len(conceptList) == len(thisSet):
                         # We have a full concept set - so save the higher concept - append the higher concept to the list of alternates
                         logging.info('Sentence concept set (%s:%s) found', higherConcept, thisSet)
-                        f.addAdditionalConcept(higherConcept, sentenceNo, thisStart, jj, None, higherConceptNegated,
+                        f.addAdditionalConcept(context, higherConcept, sentenceNo, thisStart, jj, None, higherConceptNegated,
                                             f'sentenceConceptSequenceSet:{repr(thisSet)}', 0)
+                        changed = True
 
                         # Check if we should mark all/some of the concepts in the concept list as used
-                        if (asserted) or (d.sc.higherConceptFound(higherConcept)):
+                        if (asserted) or (d.sc.higherConceptFound(context, higherConcept)):
                             for sno, strt, k in conceptList:
-                                foundConcept = d.sentences[sno][6][strt][k]['concept']
+                                foundConcept = context.sentences[sno].document[strt][k].concept
                                 # Check if we should mark this concepts in the concept list as used
-                                if asserted or (d.sc.setConcept(higherConcept, foundConcept)):
-                                    d.sentences[sno][6][strt][k]['used'] = True
+                                if asserted or (d.sc.setConcept(context, higherConcept, foundConcept)):
+                                    context.sentences[sno].document[strt][k].used = True
                                     # logging.debug('Marking sentence concept sequence set item at %d/%d as used', strt, k)
 
                         # Restart in case the same concept sequence set exists later in the sentences
@@ -842,4 +1308,5 @@ def checkSets(history):
             # end of all the concepts in this sentence
         # end of the sentences
     # end of sentence concept sequence set
+    addSetStatistics(setStats)
     return
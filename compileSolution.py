@@ -0,0 +1,90 @@
+# pylint: disable=line-too-long, invalid-name
+'''
+Script compileSolution.py
+Compile a solution into a compiled solution bundle, which AutoCoding.py can load (--solutionBundle) in milliseconds.
+
+This script checks the solution folder, loads the solution Excel workbooks, compiles all the regular expressions
+and runs the solution specific 'configure' functions, exactly as AutoCoding.py does at start up.
+It then saves the loaded solution configuration data as a compiled solution bundle.
+The bundle records the bundle format version and a fingerprint of the solution files (the Excel workbooks and the Python modules),
+so rerun this script whenever the solution changes - AutoCoding.py will reject an out of date bundle.
+
+
+    SYNOPSIS
+    $ python compileSolution.py -S solution|--Solution=solution
+        [-B bundleFile|--solutionBundle=bundleFile]
+        [-v loggingLevel|--verbose=logingLevel]
+        [-L logDir|--logDir=logDir]
+        [-l logfile|--logfile=logfile]
+
+
+    REQUIRED
+    -S solution|--Solution=solution
+    The folder containing the solution configuration files.
+
+
+    OPTIONS
+    -B bundleFile|--solutionBundle=bundleFile
+    The compiled solution bundle file to create (default="solutions/<solution>/solution.bundle")
+
+    -v loggingLevel|--verbose=loggingLevel
+    Set the level of logging that you want.
+
+    -L logDir|--logDir=logDir
+    The directory where the log file will be created (default=".").
+
+    -l logfile|--logfile=logfile
+    The name of a log file where you want all messages captured.
+'''
+
+import os
+import sys
+import argparse
+import logging
+import solutionFunctions as sol
+import data as d
+
+
+if __name__ == '__main__':
+    '''
+    The main code
+    Start by parsing the command line arguements and setting up logging.
+    Then load the solution and save it as a compiled solution bundle.
+    '''
+
+    # Set the command line options
+    parser = argparse.ArgumentParser(description='Compile a solution into a compiled solution bundle')
+    parser.add_argument('-S', '--Solution', dest='solution', required=True,
+                        help='The folder containing the solution configuration files')
+    parser.add_argument('-B', '--solutionBundle', dest='solutionBundle', metavar='bundleFile',
+                        help='The compiled solution bundle file to create (default="solutions/<solution>/solution.bundle")')
+    parser.add_argument ('-v', '--verbose', dest='verbose', type=int, choices=range(0,5),
+                         help='The level of logging\n\t0=CRITICAL,1=ERROR,2=WARNING,3=INFO,4=DEBUG')
+    parser.add_argument ('-L', '--logDir', dest='logDir', default='.', metavar='logDir',
+                         help='The name of the directory where the logging file will be created')
+    parser.add_argument ('-l', '--logFile', dest='logFile', metavar='logfile', help='The name of a logging file')
+
+    # Parse the command line
+    args = parser.parse_args()
+    d.solution = args.solution
+    bundleFile = args.solutionBundle
+    if bundleFile is None:
+        bundleFile = os.path.join('solutions', d.solution, 'solution.bundle')
+
+    # Set up logging
+    logging_levels = {0:logging.CRITICAL, 1:logging.ERROR, 2:logging.WARNING, 3:logging.INFO, 4:logging.DEBUG}
+    logfmt = 'compileSolution [%(asctime)s]: %(message)s'
+    loggingLevel = logging.WARNING
+    if args.verbose is not None:
+        loggingLevel = logging_levels[args.verbose]
+    if args.logFile is not None:
+        logging.basicConfig(format=logfmt, datefmt='%d/%m/%y %H:%M:%S %p', level=loggingLevel, filename=os.path.join(args.logDir, args.logFile), filemode='w')
+    else:
+        logging.basicConfig(format=logfmt, datefmt='%d/%m/%y %H:%M:%S %p', level=loggingLevel)
+
+    # Load the solution from the Excel workbooks and save it as a compiled solution bundle
+    sol.loadSolution(False)
+    sol.saveBundle(bundleFile)
+    logging.info('Solution "%s" compiled into (%s)', d.solution, bundleFile)
+    logging.shutdown()
+    sys.exit(d.EX_OK)
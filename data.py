@@ -5,6 +5,7 @@ The common data for AutoCoding Clinical Documents
 # pylint: disable=invalid-name, line-too-long
 
 import re
+import bisect
 from flask import Flask
 
 # This next section is plagurised from /usr/include/sysexits.h
@@ -32,65 +33,315 @@ progName = None             # The program name (stripped of .py)
 inputDir = None             # The folder containing the clinical documents
 inputFile = None            # The name of the clinical document to AutoCode
 outputDir = None            # The name of the folder where the AutoCoding output will be created
+workers = 1                 # The number of worker processes AutoCoding the clinical documents in inputDir
 MetaMapLiteHost = None      # The host name of the AutoCoding/MetaMapLite server
 MetaMapLitePort = None      # The port for the MetaMapLite service on the AutoCoding/MetaMapLite server
 MetaMapLiteURL = None       # The URL for the MetaMapLite service on the AutoCoding/MetaMapLite server
 MetaMapLiteHeaders = None   # The HTTP Headers for calls to the MetaMapLite Service
-MetaMapLiteServiceLock = None   # A Threading Lock used to avoid threadding issues in the MetaMapLite Service
-MetaMapLiteResponse = None  # The data returned by the MetaMapLite Service
+MetaMapLiteConcurrency = None   # The maximum number of requests in flight to the MetaMapLite Service
+MetaMapLiteLimiter = None   # A Threading (or, with --workers, a multiprocessing) Semaphore that limits the number of requests in flight to the MetaMapLite Service
+MetaMapLiteLimiterStats = {}    # The MetaMapLite concurrency statistics (requests, waiting, maxWaiting, inFlight, maxInFlight, queueWait, serviceTime)
+MetaMapLiteFlight = None    # With --workers, the requests in flight and waiting across all the worker processes - a shared Array [inFlight, maxInFlight, waiting, maxWaiting]
+MetaMapLitePoolSize = None  # The maximum number of connections to the MetaMapLite Service
+MetaMapLiteEndpoints = []   # The MetaMapLite endpoints - dictionaries of host, port, url, the pool of reusable (keep-alive) connections and health
+MetaMapLiteEjectTime = None # The number of seconds an unhealthy MetaMapLite endpoint is ejected for
+MetaMapLiteMaxFailures = None   # The number of consecutive failures that make a MetaMapLite endpoint unhealthy
+MetaMapLitePoolStats = {}   # The MetaMapLite connection pool statistics (requests, hits, newConnections, reconnects, waitTime)
+MetaMapLiteCacheFile = None # The SQLite database file holding the cache of MetaMapLite responses (None if there is no cache)
+MetaMapLiteCacheSize = None # The maximum size (in megabytes) of the cache of MetaMapLite responses
+MetaMapLiteBackend = None   # The identifier of the MetaMapLite backend (version and UMLS index) - part of every cache key
+MetaMapLiteSentenceCache = False    # Cache (and reuse) the MetaMapLite annotations of each sentence
+MetaMapLiteCacheStats = {}  # The MetaMapLite cache statistics (hits, misses, stores, evictions, segmentHits, segmentMisses, fallbacks)
+MetaMapLiteRecordFile = None    # The file where every MetaMapLite response is recorded, for replayMetaMapLite.py (None if not recording)
 FlaskPort = None            # The port for the AutoCoding service on this server
 solution = None             # The name of the solution for AutoCoding clinical documents
+solutionBundle = None       # The compiled solution bundle file (None if the solution is loaded from the Excel workbooks)
+verifyTerms = False         # Check the fused term replacement against applying every term to every line
 cleanPython = re.compile(r'\W+|^(?=\d)')  # Convert column names to valid Pandas variables
 solutionMetaThesaurus = {}  # The Solution Specific MetaThesaurus codes, descriptions, source and source code
 knownConcepts = set()       # The set of concepts known to be relevant to AutoCoding (from the configuration values)
 otherConcepts = set()       # The set of concepts found in clinical documents of this type, but known to be irrelevant to this solution
+requiredLiterals = {}       # For each configured regular expression, the lowercase literal text that every match must contain (see excelFunctions.literalPrefilter())
+prefilterStats = {'terms':[0, 0], 'markers':[0, 0], 'triggers':[0, 0], 'sentence concepts':[0, 0]}     # For each family of rules, [rules run, rules skipped by the literal prefilter]
 sd = None                   # The Solution data model
 sp = None                   # The Solution prepare module
 sc = None                   # The Solution complete module
 sa = None                   # The Solution analysis module
-rawClinicalDocument = None  # The Clinical Document "as read"
-preparedDocument = None     # The Prepared Clinical Document
-codedSentences = None       # The MetaMapLite coded version of the Clinical Document
-completedSentences = None   # The Coding Completed version of the Clinical Document
-sentences = []              # The list of sentences/sentence parts of the MetaMapLite response (to which we attach mini documents of concepts)
-'''
-This is the main data structure - a list of the sentences in the clinical document.
-Each sentence in the list has the following attributes
-    [0] - a boolean that indicates that this sentence contains changes - parts of this sentence are not the same history as the start
-    [1] - a boolean that indicates the initial history state of this sentence (True => isHistory)
-    [2] - an integer - the character position of the start of this sentence within the document
-    [3] - an integer - the length of this sentence
-    [4] - a string - the text of this sentence
-    [5] - a list of all the places in this sentence where history flips (into/out of history)
-    [6] - a dictionary of the concepts within this sentence (a mini-document)
-    [7] - the section containg this sentence
-
-    Each mini-document (d.sentences[sentenceNo][6]) is a dictionary with an integer as the key (the start of this concept in the main document).
-    The value for each key ('start') is a list of alternate concepts, all of which start at the same character position in the main document.
-    Each alternate concept in the list is a dictionary of concept attributes.
-    The keys for each alternate concept dictionary in the list are
-        'length' - an integer - the number of characters in the sentence required to identifying this concept
-        'history' - a boolean that indicates that this concept is historical information - in a history sentence or after this sentence flipped into history
-        'concept' - a string - the MetaThesaurus concept.
-        'used' - a boolean that is set to True when a concept has been used to identify a higher concept
-        'text' - a string - the text at start, for 'length', which MetaMapLite found to be 'concept'.
-        'partOfSpeech' - a sting - the part of speech tag (code) that indicates how this concept was used in the sentence (noun, adverb, adjective etc)
-        'negation' - a string that indicates that this is a positive ('0'), negative ('1') or ambiguous ('2') concept
-        'description' - a string - the description of this concept (which may differ from the text matched to this concept).
-'''
+
+
+class AutoCodingContext:
+    '''
+    The state of AutoCoding one clinical document.
+    A new context is created for each clinical document and passed to every function that works on that document,
+    including the solution 'prepare', 'complete' and 'analyze' functions, so that documents can be AutoCoded concurrently.
+
+    sentences is the main data structure - a list of the sentences in the clinical document (see Sentence).
+    Each sentence holds a mini-document of the concepts within that sentence (see ConceptMention).
+    '''
+
+    def __init__(self, rawClinicalDocument):
+        self.rawClinicalDocument = rawClinicalDocument  # The Clinical Document "as read"
+        self.preparedDocument = None        # The Prepared Clinical Document
+        self.MetaMapLiteResponse = None     # The data returned by the MetaMapLite Service
+        self.sentences = []                 # The list of sentences/sentence parts of the MetaMapLite response (to which we attach mini documents of concepts)
+        self.codedSentences = None          # The MetaMapLite coded version of the Clinical Document
+        self.completedSentences = None      # The Coding Completed version of the Clinical Document
+        self.solution = {}                  # A dictionary of the solution specific state variables for this Clinical Document
+        self.triggerIndexes = {}            # The negation and ambiguity trigger index for each sentence (see checkFunctions.sentenceTriggers())
+
+
+class Sentence:
+    '''
+    One sentence in a clinical document (an entry in context.sentences), with the following attributes
+        hasChanges  [0] - a boolean that indicates that this sentence contains changes - parts of this sentence are not the same history as the start
+        isHistory   [1] - a boolean that indicates the initial history state of this sentence (True => isHistory)
+        start       [2] - an integer - the character position of the start of this sentence within the document
+        length      [3] - an integer - the length of this sentence
+        text        [4] - a string - the text of this sentence
+        changesAt   [5] - a list of all the places in this sentence where history flips (into/out of history)
+        document    [6] - a MiniDocument of the concepts within this sentence
+        section     [7] - the section containg this sentence
+        markers     [8] - a dictionary of the positional markers (d.sentenceMarkers) in this sentence - a sorted list of positions (in the sentence) for each marker name
+
+    Each mini-document (context.sentences[sentenceNo].document) is a dictionary with an integer as the key (the start of this concept in the main document),
+    kept in order of start (see MiniDocument). The value for each key ('start') is a list of alternate concepts (ConceptMention),
+    all of which start at the same character position in the main document.
+
+    Sentences used to be lists, so the attributes can also be indexed by number (e.g. sentence[4] is sentence.text)
+    '''
+
+    __slots__ = ('hasChanges', 'isHistory', 'start', 'length', 'text', 'changesAt', 'document', 'section', 'markers')
+
+    def __init__(self, hasChanges, isHistory, start, length, text, changesAt, document, section, markers):
+        self.hasChanges = hasChanges
+        self.isHistory = isHistory
+        self.start = start
+        self.length = length
+        self.text = text
+        self.changesAt = changesAt
+        self.document = document
+        self.section = section
+        self.markers = markers
+
+    def __getitem__(self, index):
+        return getattr(self, self.__slots__[index])
+
+    def __setitem__(self, index, value):
+        setattr(self, self.__slots__[index], value)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+
+class MiniDocument(dict):
+    '''
+    The mini-document of the concepts in a sentence - a dictionary with the start of each concept in the main document as the key,
+    and the list of alternate concepts (ConceptMention) that start there as the value.
+    The starts are kept in order as concepts are added, so iterating over a mini-document goes through the starts in order
+    (as sorted(document) would) and between() finds the starts in a range. Don't add new starts while iterating over them.
+    Copies (copy(), |, copy.copy() and copy.deepcopy()) and pickled mini-documents are mini-documents, with their starts in order
+    '''
+
+    __slots__ = ('starts',)
+
+    def __init__(self):
+        super().__init__()
+        self.starts = []        # The keys, in order
+
+    def __setitem__(self, start, alternates):
+        if start not in self:
+            bisect.insort(self.starts, start)
+        super().__setitem__(start, alternates)
+
+    def __delitem__(self, start):
+        super().__delitem__(start)
+        del self.starts[bisect.bisect_left(self.starts, start)]
+
+    def __iter__(self):
+        return iter(self.starts)
+
+    def setdefault(self, start, alternates=None):
+        if start not in self:
+            self[start] = alternates
+        return self[start]
+
+    def pop(self, start, *default):
+        if start in self:
+            del self.starts[bisect.bisect_left(self.starts, start)]
+        return super().pop(start, *default)
+
+    def update(self, *args, **kwargs):
+        for start, alternates in dict(*args, **kwargs).items():
+            self[start] = alternates
+
+    def popitem(self):
+        start, alternates = super().popitem()
+        del self.starts[bisect.bisect_left(self.starts, start)]
+        return start, alternates
+
+    def clear(self):
+        super().clear()
+        self.starts = []
+
+    def copy(self):
+        document = MiniDocument()
+        document.update(self)
+        return document
+
+    def __or__(self, other):
+        document = self.copy()
+        document.update(other)
+        return document
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __reduce__(self):
+        # Pickle, copy.copy() and copy.deepcopy() make an empty mini-document and then add each start
+        return (MiniDocument, (), None, None, iter(dict.items(self)))
+
+    def between(self, first, last):
+        '''
+        Return the starts from first to last (inclusive), in order
+        Parameters
+            first   - int, the first start of interest
+            last    - int, the last start of interest
+        Returns
+            starts  - list, the starts in this mini-document from first to last
+        '''
+
+        return self.starts[bisect.bisect_left(self.starts, first):bisect.bisect_right(self.starts, last)]
+
+
+class ConceptMention:
+    '''
+    One alternate concept in a mini-document (see Sentence), with the following attributes
+        length          - an integer - the number of characters in the sentence required to identifying this concept
+        history         - a boolean that indicates that this concept is historical information - in a history sentence or after this sentence flipped into history
+        concept         - a string - the MetaThesaurus concept.
+        used            - a boolean that is set to True when a concept has been used to identify a higher concept
+        text            - a string - the text at start, for 'length', which MetaMapLite found to be 'concept'.
+        partOfSpeech    - a sting - the part of speech tag (code) that indicates how this concept was used in the sentence (noun, adverb, adjective etc)
+        negation        - a string that indicates that this is a positive ('0'), negative ('1') or ambiguous ('2') concept
+        description     - a string - the description of this concept (which may differ from the text matched to this concept).
+
+    Concepts used to be dictionaries, so the attributes can also be looked up by name (e.g. miniDoc['concept'] is miniDoc.concept)
+
+    The description of a concept that replaced another concept (an equivalent or a modified concept) says what it was - e.g. '...(was:...)'.
+    Most descriptions are never logged or reported, so the description is held as the plain description and a provenance chain,
+    which is only made into the full description when the description is asked for.
+    The provenance chain is None, or a tuple
+        ('equivalent', concept)                                     - replaced the MetaThesaurus concept 'concept'
+        ('modifier', concept)                                       - a modifier changed 'concept' into this concept
+        ('unknown modifier', concept, description, provenance)      - a modifier changed 'concept' (with this description and provenance)
+                                                                      into this concept, which is not in the Solution MetaThesaurus
+    '''
+
+    __slots__ = ('length', 'history', 'concept', 'used', 'text', 'partOfSpeech', 'negation', '_description', '_provenance')
+    attributes = ('length', 'history', 'concept', 'used', 'text', 'partOfSpeech', 'negation', 'description')
+
+    def __init__(self, concept, negation, text, length, history, partOfSpeech, description, provenance=None):
+        self.length = length
+        self.history = history
+        self.concept = concept
+        self.used = False
+        self.text = text
+        self.partOfSpeech = partOfSpeech
+        self.negation = negation
+        self._description = description
+        self._provenance = provenance
+
+    @property
+    def description(self):
+        '''
+        The description of this concept, including what it was, made when first asked for
+        '''
+
+        if self._provenance is not None:
+            self._description = describe(self._description, self._provenance)
+            self._provenance = None
+        return self._description
+
+    @description.setter
+    def description(self, description):
+        self._description = description
+        self._provenance = None
+
+    def modify(self, concept, newConcept, newNeg):
+        '''
+        Change this concept, which was 'concept', into a modified concept
+        Parameters
+            concept     - str, the concept that was modified
+            newConcept  - str, the modified concept
+            newNeg      - str, the negation/ambiguity of the modified concept
+        Returns
+            Nothing
+        '''
+
+        if newConcept in solutionMetaThesaurus:
+            self._provenance = ('modifier', concept)
+            self._description = solutionMetaThesaurus[newConcept]['description']
+        else:
+            self._provenance = ('unknown modifier', concept, self._description, self._provenance)
+            self._description = 'unknown'
+        self.concept = newConcept
+        self.negation = newNeg
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def asDict(self):
+        '''
+        Return this concept as a dictionary of its attributes
+        '''
+
+        return {name:getattr(self, name) for name in self.attributes}
+
+    def __repr__(self):
+        return repr(self.asDict())
+
+
+def describe(description, provenance):
+    '''
+    Make the full description of a concept from its plain description and its provenance chain (see ConceptMention)
+    Parameters
+        description - str, the plain description of the concept
+        provenance  - tuple or None, the provenance chain of the concept
+    Returns
+        description - str, the full description of the concept
+    '''
+
+    if provenance is None:
+        return description
+    if provenance[0] == 'equivalent':
+        if provenance[1] in solutionMetaThesaurus:
+            return description + '(was:' + solutionMetaThesaurus[provenance[1]]['description'] + ')'
+        return description + '(was:unknown)'
+    if provenance[0] == 'modifier':
+        return description + '(was:' + provenance[1] + ')'
+    return description + ' (was:' + provenance[1] + ' - ' + describe(provenance[2], provenance[3]) + ')'
+
 
 # Prepare
 labels = []					# The list of regular expressions that should be replaced with new labels
 terms = []					# The list of regular expressions that should be replaced with words
 preambleMarkers = []		# A list of things that indicate that the following text in the text document is preamble (not the body of the text document)
 preambleTerms = []			# The list of regular expressions that should be replaced with words in the preamble
+fusedTerms = []				# The blocks of terms, each with a fused gate - (gate, terms)
+fusedPreambleTerms = []		# The blocks of preambleTerms, each with a fused gate - (gate, terms)
 
 # Complete
 historyMarkers = []			# A list of things that indicate that the following sentences are history
 preHistory = []				# A list of things that indicate that the following concepts are from a previous test
 sectionMarkers = []			# A list of things that indicate that the following sentences are part of a specific section of the text document
+fusedMarkers = {}			# The history, preamble and section markers, in families (e.g. 'historyStart'), each with fused gates - (markers, gates)
 equivalents = {}			# The dictionary of MetaThesaurus concepts and their autocoding equivalents (i.e. don't use X, we use Y)
 butBoundaries = []			# A list of things that mark the end of a context when extending negation
+sentenceMarkers = {}		# The positional markers found in every sentence - lists of regular expressions by marker name ('but' is butBoundaries), solutions can add their own in configure()
 preNegation = []			# A list of things that negate the following concept
 immediatePreNegation = []	# A list of things that negate the immediately following concept
 postNegation = []			# A list of things that negate the preceeding concept and any exception
@@ -102,6 +353,7 @@ immediatePostAmbiguous = []	# A list of things that make the immediately preceed
 preModifiers = {}			# The dictionary of MetaThesaurus concepts that get modified to another concept when preceded by specific words or phrases
 postModifiers = {}			# The dictionary of MetaThesaurus concepts that get modified to another concept when followed by specific words or phrases
 sentenceConcepts = []		# The list of concept and the regular expressions that represent those concepts, that are check on a sentence by sentence basis
+fusedSentenceConcepts = []	# The blocks of sentenceConcepts, each with a fused gate - (gate, sentenceConcepts)
 grossNegation = []			# A list of pairs of things that negate all concept between these two markers
 sentenceNegationLists = {}	# The lists of lower concepts in a sentence that need to be made ambiguous because of a negated instance of the higher concept
 documentNegationLists = {}	# The lists of lower concepts anywhere in the document that need to be made ambiguous because of a negated instance of the higher concept
@@ -109,6 +361,8 @@ sentenceConceptSequenceSets = []	# The list of higher concepts and their asscoci
 sentenceConceptSets = []	# The list of higher concepts and their associated concept set that are checked on a sentence by sentence basis
 documentConceptSequenceSets = []	# The list of higher concepts and their asscociated concept sequence set that are checked on a whole of document basis
 documentConceptSets = []	# The list of higher concepts and their associated concept set that are checked on a whole of document basis
+conceptSetIndex = {}		# For each kind of concept set (e.g. 'sentenceConceptSets'), the dictionary of concept to the numbers of the sets containing it
+conceptSetStats = {'checked':0, 'absent':0, 'incomplete':0}	# The concept set statistics (sets checked, sets skipped as not started, sets skipped as incomplete)
 sentenceConceptFound = []   # The list of sentence concepts found
 documentConceptFound = []   # The list of documents concepts found
 
@@ -2,14 +2,22 @@
 The common functions for the Clinical Costing system associated with processing Excel workbooks.
 '''
 
-# pylint: disable=invalid-name, line-too-long, broad-exception-caught, unused-variable, superfluous-parens, too-many-lines
+# pylint: disable=invalid-name, line-too-long, broad-exception-caught, unused-variable, superfluous-parens, too-many-lines, import-outside-toplevel
 
 import sys
 import logging
 import re
-import pandas as pd
+import collections
+try:
+    from re import _parser as sre_parse     # Python 3.11 and later
+except ImportError:
+    import sre_parse
 import data as d
 
+# The regular expression operators whose contents must be in every match, even though the operator itself is not a literal
+repeatOps = [sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT] + ([sre_parse.POSSESSIVE_REPEAT] if hasattr(sre_parse, 'POSSESSIVE_REPEAT') else [])
+atomicOps = [sre_parse.ATOMIC_GROUP] if hasattr(sre_parse, 'ATOMIC_GROUP') else []
+
 
 def cleanColumnHeadings(columns):
     '''
@@ -31,7 +39,7 @@ def cleanColumnHeadings(columns):
     return cleanColumns
 
 
-def checkWorksheet(wb, workbookName, sheet, columns, exact):
+def openWorksheet(wb, workbookName, sheet, columns, exact):
     '''
     Check that a worksheet exist in the workbook and that the sheet has the required column headings.
     Parameters
@@ -41,7 +49,9 @@ def checkWorksheet(wb, workbookName, sheet, columns, exact):
         columns         - list(str), the list of columns required/to be loaded
         exact           - boolean, True of only the required columns are to be loaded
     Returns
-        sheet_df        - pandas dataframe, the loaded data
+        Row             - the named tuple class for each row, with the cleaned column headings as the field names
+        data            - iterator, the remaining rows of cell values from the worksheet
+        loadColumns     - list, the indexes of the columns to be loaded
     '''
     # Check that this worksheet exits
     if sheet not in wb.sheetnames:
@@ -51,10 +61,8 @@ def checkWorksheet(wb, workbookName, sheet, columns, exact):
 
     # Check this worksheet
     ws = wb[sheet]
-    row0 = list(ws.rows)[0]
-    headings = []
-    for heading in row0:
-        headings.append(heading.value)
+    data = ws.iter_rows(values_only=True)
+    headings = list(next(data, ()))
 
     # Make sure the required columns in the this worksheet are present
     for col in columns:
@@ -63,14 +71,63 @@ def checkWorksheet(wb, workbookName, sheet, columns, exact):
             logging.shutdown()
             sys.exit(d.EX_CONFIG)
 
-    # Check any codes that need to be in a code table
-    data = ws.values
-    headings = cleanColumnHeadings(next(data))
-    sheet_df = pd.DataFrame(list(data), columns=tuple(headings))
+    # Work out which columns are to be loaded
+    headings = cleanColumnHeadings(headings)
     if exact:
         newColumns = cleanColumnHeadings(columns)
-        sheet_df = sheet_df[sheet_df.columns.intersection(newColumns)]
-    return sheet_df
+        loadColumns = [i for i, heading in enumerate(headings) if heading in newColumns]
+    else:
+        loadColumns = list(range(len(headings)))
+    Row = collections.namedtuple('Row', [headings[i] for i in loadColumns], rename=True)
+    return Row, data, loadColumns
+
+
+def readWorksheet(wb, workbookName, sheet, columns, exact):
+    '''
+    Check that a worksheet exist in the workbook and that the sheet has the required column headings,
+    then stream the rows of the worksheet (open the workbook read only, so that rows are only read as they are needed).
+    Parameters
+        wb              - an openpyxl workbook containing configuration data
+        workbookName    - str, the name of the workbook/part of the solution
+        sheet           - str, the name of the sheet to be loaded
+        columns         - list(str), the list of columns required/to be loaded
+        exact           - boolean, True of only the required columns are to be loaded
+    Returns
+        rows            - iterator of named tuples, one per row, with the cleaned column headings as the field names
+    '''
+    Row, data, loadColumns = openWorksheet(wb, workbookName, sheet, columns, exact)
+    return streamRows(Row, data, loadColumns)
+
+
+def streamRows(Row, data, loadColumns):
+    '''
+    Stream the loaded columns of each row of a worksheet
+    Parameters
+        Row             - the named tuple class for each row
+        data            - iterator, the rows of cell values from the worksheet
+        loadColumns     - list, the indexes of the columns to be loaded
+    Returns
+        rows            - iterator of named tuples
+    '''
+    for values in data:
+        yield Row._make([values[i] if i < len(values) else None for i in loadColumns])
+
+
+def checkWorksheet(wb, workbookName, sheet, columns, exact):
+    '''
+    Check that a worksheet exist in the workbook and that the sheet has the required column headings.
+    Parameters
+        wb              - an openpyxl workbook containing configuration data
+        workbookName    - str, the name of the workbook/part of the solution
+        sheet           - str, the name of the sheet to be loaded
+        columns         - list(str), the list of columns required/to be loaded
+        exact           - boolean, True of only the required columns are to be loaded
+    Returns
+        sheet_df        - pandas dataframe, the loaded data
+    '''
+    Row, data, loadColumns = openWorksheet(wb, workbookName, sheet, columns, exact)
+    import pandas as pd         # Only needed by solutions that still want a dataframe
+    return pd.DataFrame(list(streamRows(Row, data, loadColumns)), columns=Row._fields)
 
 
 def checkPattern(pattern):
@@ -92,6 +149,63 @@ def checkPattern(pattern):
     return returnPattern
 
 
+def literalRuns(items, runs, run):
+    '''
+    Collect the runs of (ASCII) literal characters that every match of a parsed regular expression must contain.
+    Anything other than a literal, a group, or something repeated at least once, ends the current run
+    (alternatives, character classes, anchors, lookarounds and optional parts are not required, or are not literal)
+    Parameters
+        items   - list, the parsed regular expression (a sre_parse.SubPattern)
+        runs    - list, the completed runs of literal characters
+        run     - str, the run of literal characters leading up to these items
+    Returns
+        run     - str, the run of literal characters at the end of these items
+    '''
+    for op, av in items:
+        if (op == sre_parse.LITERAL) and (av < 128):     # Non-ASCII characters can match ASCII characters when ignoring case (e.g. the Kelvin sign)
+            run += chr(av).lower()
+            continue
+        if (op == sre_parse.SUBPATTERN) and (av[-1] is not None):      # A group - (group, add flags, del flags, items)
+            run = literalRuns(av[-1], runs, run)
+            continue
+        runs.append(run)
+        run = ''
+        if (op in repeatOps) and (av[0] >= 1):      # Repeated at least once - (min, max, items)
+            runs.append(literalRuns(av[2], runs, ''))
+        elif op in atomicOps:
+            runs.append(literalRuns(av, runs, ''))
+    return run
+
+
+def literalPrefilter(pattern):
+    '''
+    Find the literal text that every match of a compiled regular expression must contain (in the style of an RE2 prefilter)
+    and remember it in d.requiredLiterals, so that the pattern need not be run against text that does not contain it
+    Parameters
+        pattern     - compiled regular expression, a configured pattern
+    Returns
+        pattern     - compiled regular expression, the same pattern
+    '''
+    try:
+        items = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return pattern
+    runs = []
+    runs.append(literalRuns(items, runs, ''))
+    literals = []
+    for run in sorted(set(runs), key=lambda run: (-len(run), run)):     # The longest literals are the least likely to be in the text
+        if len(run) < 2:        # Single characters are in almost every text
+            continue
+        for literal in literals:
+            if run in literal:
+                break
+        else:
+            literals.append(run)
+    if len(literals) > 0:
+        d.requiredLiterals[pattern] = tuple(literals)
+    return pattern
+
+
 def checkConfigConcept(concept):
     '''
     Check if a configuration concept is negated or ambigous
@@ -128,10 +242,9 @@ def loadSimpleSheet(wb, workbook, sheet, columns):
     Returns
         target          - list
     '''
-    this_df = checkWorksheet(wb, workbook, sheet, columns, True)
-    thisData = this_df.values.tolist()
     target = []
-    for i, record in enumerate(thisData):
+    for i, record in enumerate(readWorksheet(wb, workbook, sheet, columns, True)):
+        record = list(record)
         # logging.debug("workbook(%s), sheet(%s), columns(%s), record(%s)", workbook, sheet, columns, record)
         if record[0] is None:
             break
@@ -158,17 +271,15 @@ def loadSimpleDictionarySheet(wb, workbook, sheet, columns, skip):
     Returns
         target          - dict
     '''
-    this_df = checkWorksheet(wb, workbook, sheet, columns, True)
-    thisData = this_df.values.tolist()
     target = {}
-    for record in thisData:
+    for record in readWorksheet(wb, workbook, sheet, columns, True):
         if record[0] is None:
             break
         # logging.debug("workbook(%s), sheet(%s), columns(%s), record(%s)", workbook, sheet, columns, record)
         if (1 + skip) == (len(columns) - 1):
             target[record[0]] = record[1 + skip]
         else:
-            target[record[0]] = record[1 + skip:]
+            target[record[0]] = list(record[1 + skip:])
     return target
 
 
@@ -188,10 +299,9 @@ def loadDictionaryDictionarySheet(wb, workbook, sheet, columns):
     Returns
         target          - dict
     '''
-    this_df = checkWorksheet(wb, workbook, sheet, columns, True)
     target = {}
     newColumns = cleanColumnHeadings(columns)
-    for row in this_df.itertuples(index=False):
+    for row in readWorksheet(wb, workbook, sheet, columns, True):
         # logging.debug("workbook(%s) sheet(%s), columns(%s), row(%s)", workbook, sheet, columns, row)
         thisKey = row[0]
         target[thisKey] = {}
@@ -216,10 +326,8 @@ def loadDictionarySetSheet(wb, workbook, sheet, columns):
     Returns
         target          - dict
     '''
-    this_df = checkWorksheet(wb, workbook, sheet, columns, False)
-    thisData = this_df.values.tolist()
     target = {}
-    for record in thisData:
+    for record in readWorksheet(wb, workbook, sheet, columns, False):
         if record[0] is None:
             break
         # logging.debug("workbook(%s), sheet(%s), columns(%s), record(%s)", workbook, sheet, columns, record)
@@ -249,10 +357,8 @@ def loadSimpleCompileSheet(wb, workbook, sheet, columns, pretext, posttext, igno
     Returns
         target          - list of tuples
     '''
-    this_df = checkWorksheet(wb, workbook, sheet, columns, True)
-    thisData = this_df.values.tolist()
     target = []
-    for record in thisData:
+    for record in readWorksheet(wb, workbook, sheet, columns, True):
         if record[0] is None:
             break
         # logging.debug("workbook(%s), sheet(%s), columns(%s), record(%s)", workbook, sheet, columns, record)
@@ -270,10 +376,11 @@ def loadSimpleCompileSheet(wb, workbook, sheet, columns, pretext, posttext, igno
             compText = re.compile(reText, flags=re.DOTALL)
         else:
             compText = re.compile(reText)
+        literalPrefilter(compText)
         if len(columns) == 1:
             target.append(compText)
         else:
-            target.append(tuple([compText] + record[1:]))
+            target.append(tuple([compText] + list(record[1:])))
     return target
 
 
@@ -293,8 +400,6 @@ def loadBoolCompileWorksheet(wb, workbook, sheet, columns, pretext, posttext, do
     Returns
         target          - list of tuples
     '''
-    this_df = checkWorksheet(wb, workbook, sheet, columns, True)
-    thisData = this_df.values.tolist()
     target = []
     try:
         isCase = columns.index('isCase')
@@ -306,7 +411,7 @@ def loadBoolCompileWorksheet(wb, workbook, sheet, columns, pretext, posttext, do
         isStart = columns.index('isStart')
     except ValueError:
         isStart = -1
-    for record in thisData:
+    for record in readWorksheet(wb, workbook, sheet, columns, True):
         if record[0] is None:
             break
         # logging.debug("workbook(%s), sheet(%s), columns(%s), record(%s)", workbook, sheet, columns, record)
@@ -333,12 +438,13 @@ def loadBoolCompileWorksheet(wb, workbook, sheet, columns, pretext, posttext, do
             compText = re.compile(reText, flags=re.IGNORECASE|re.DOTALL)
         else:
             compText = re.compile(reText, flags=re.IGNORECASE)
+        literalPrefilter(compText)
         if len(columns) == 1:
             target.append(compText)
         elif isCase < (len(columns) - 1):
-            target.append(tuple([compText] + record[1:isCase] + record[isCase + 1:]))
+            target.append(tuple([compText] + list(record[1:isCase]) + list(record[isCase + 1:])))
         else:
-            target.append(tuple([compText] + record[1:isCase]))
+            target.append(tuple([compText] + list(record[1:isCase])))
     return target
 
 
@@ -357,10 +463,8 @@ def loadCompileConceptsWorksheet(wb, workbook, sheet, columns, pretext, posttext
     Returns
         target          - list of variable length lists
     '''
-    this_df = checkWorksheet(wb, workbook, sheet, columns, False)
-    thisData = this_df.values.tolist()
     target = []
-    for record in thisData:
+    for record in readWorksheet(wb, workbook, sheet, columns, False):
         if record[0] is None:
             break
         # logging.debug("workbook(%s), sheet(%s), columns(%s), record(%s)", workbook, sheet, columns, record)
@@ -369,7 +473,7 @@ def loadCompileConceptsWorksheet(wb, workbook, sheet, columns, pretext, posttext
             reText = pretext + reText
         if posttext is not None:
             reText = reText + posttext
-        compText = re.compile(reText, flags=re.IGNORECASE|re.DOTALL)
+        compText = literalPrefilter(re.compile(reText, flags=re.IGNORECASE|re.DOTALL))
         concepts = []
         j = 1
         while (j < len(record)) and (record[j] is not None):
@@ -397,22 +501,20 @@ def loadCompileCompileWorksheet(wb, workbook, sheet, columns, pretext):
     Returns
         target          - list of tuples
     '''
-    this_df = checkWorksheet(wb, workbook, sheet, columns, True)
-    thisData = this_df.values.tolist()
     target = []
-    for record in thisData:
+    for record in readWorksheet(wb, workbook, sheet, columns, True):
         if record[0] is None:
             break
         # logging.debug("workbook(%s), sheet(%s), columns(%s), record(%s)", workbook, sheet, columns, record)
         reText = checkPattern(record[0])
         if pretext is not None:
             reText = pretext + reText
-        compText = re.compile(reText, flags=re.IGNORECASE|re.DOTALL)
+        compText = literalPrefilter(re.compile(reText, flags=re.IGNORECASE|re.DOTALL))
         if record[1] is not None:
             rexText = checkPattern(record[1])
             if pretext is not None:
                 rexText = pretext + rexText
-            exCompText = re.compile(rexText, flags=re.IGNORECASE|re.DOTALL)
+            exCompText = literalPrefilter(re.compile(rexText, flags=re.IGNORECASE|re.DOTALL))
             target.append((compText, exCompText))
         else:
             target.append((compText, None))
@@ -437,9 +539,8 @@ def loadModifierWorksheet(wb, workbook, sheet, columns, pretext, posttext):
     Returns
         target          - dict
     '''
-    this_df = checkWorksheet(wb, workbook, sheet, columns, True)
     target = {}
-    for row in this_df.itertuples(index=False):
+    for row in readWorksheet(wb, workbook, sheet, columns, True):
         if row.MetaThesaurusID is None:
             break
         # logging.debug("workbook(%s), sheet(%s), columns(%s), row(%s)", workbook, sheet, columns, row)
@@ -452,7 +553,7 @@ def loadModifierWorksheet(wb, workbook, sheet, columns, pretext, posttext):
             Modifier = pretext + Modifier
         if posttext is not None:
             Modifier = Modifier + posttext
-        compText = re.compile(Modifier, flags=re.IGNORECASE|re.DOTALL)
+        compText = literalPrefilter(re.compile(Modifier, flags=re.IGNORECASE|re.DOTALL))
         target[concept] = (oldNeg, newConcept, newNeg, compText)
     return target
 
@@ -480,10 +581,8 @@ def loadNegationListWorksheet(wb, workbook, sheet, columns):
     Returns
         target          - dict
     '''
-    this_df = checkWorksheet(wb, workbook, sheet, columns, False)
-    thisData = this_df.values.tolist()
     target = {}
-    for record in thisData:
+    for record in readWorksheet(wb, workbook, sheet, columns, False):
         if record[0] is None:
             break
         # logging.debug("workbook(%s), sheet(%s), columns(%s), record(%s)", workbook, sheet, columns, record)
@@ -541,10 +640,8 @@ def loadSequenceConceptSetsWorksheet(wb, workbook, sheet, columns, isStrict):
     except ValueError:
         isMulti = False
 
-    this_df = checkWorksheet(wb, workbook, sheet, columns, False)
-    thisData = this_df.values.tolist()
     target = []
-    for record in thisData:
+    for record in readWorksheet(wb, workbook, sheet, columns, False):
         if record[0] is None:
             break
         # logging.debug("workbook(%s), sheet(%s), columns(%s), record(%s)", workbook, sheet, columns, record)
@@ -609,10 +706,8 @@ def loadConceptSetsWorksheet(wb, workbook, sheet, columns):
     except ValueError:
         isMulti = False
 
-    this_df = checkWorksheet(wb, workbook, sheet, columns, False)
-    thisData = this_df.values.tolist()
     target = []
-    for record in thisData:
+    for record in readWorksheet(wb, workbook, sheet, columns, False):
         if record[0] is None:
             break
         # logging.debug("workbook(%s), sheet(%s), columns(%s), record(%s)", workbook, sheet, columns, record)
@@ -49,6 +49,9 @@ def FlaskAutoCoding():
     else:                                                                   # From an api call
         data = request.get_json()
 
+    # Each request has its own AutoCoding context, so concurrent requests don't share any clinical document state
+    context = d.AutoCodingContext('')
+
     # Check if a JSON or HTML response is required
     wantsJSON = False
     for i, (mimeType, quality) in enumerate(request.accept_mimetypes):
@@ -58,7 +61,7 @@ def FlaskAutoCoding():
     if 'document' not in data:
         if wantsJSON:
             logging.critical('No document in request')
-            newData = d.sa.reportJSON(False)
+            newData = d.sa.reportJSON(context, False)
             return jsonify(newData)
         else:
             message = '<html><head><title>AutoCoding Clinical Documents</title><link rel="icon" href="data:,"></head><body style="font-size:120%">'
@@ -68,14 +71,14 @@ def FlaskAutoCoding():
 
     # Now AutoCode the clinical document
     document = data['document']
-    d.rawClinicalDocument = ''
+    context.rawClinicalDocument = ''
     for line in document.split('\n'):
-        d.rawClinicalDocument += line.rstrip() + '\n'
-    success = f.AutoCode()
+        context.rawClinicalDocument += line.rstrip() + '\n'
+    success = f.AutoCode(context)
     if success != d.EX_OK:
         if wantsJSON:
-            logging.critical('AutoCoding failed for document:%s', d.rawClinicalDocument)
-            newData = d.sa.reportJSON(False)
+            logging.critical('AutoCoding failed for document:%s', context.rawClinicalDocument)
+            newData = d.sa.reportJSON(context, False)
             return jsonify(newData)
         else:
             message = '<html><head><title>AutoCoding Clinical Documents</title><link rel="icon" href="data:,"></head><body style="font-size:120%">'
@@ -85,7 +88,7 @@ def FlaskAutoCoding():
 
     if wantsJSON:
         # Return the results dictionary
-        newData = d.sa.reportJSON(True)
+        newData = d.sa.reportJSON(context, True)
         return jsonify(newData)
 
     # Return HTML
@@ -100,7 +103,7 @@ def FlaskAutoCoding():
     message += '};\n'
     message += '</script>\n'
     message += '</head><body style="font-size:120%">'
-    message += d.sa.reportHTML()
+    message += d.sa.reportHTML(context)
     message += '</p>'
     message += f'<p style="text-align:center"><b><a href="{url_for("splash")}">AutoCode another clinical document</a></b></p>'
 
@@ -110,25 +113,25 @@ def FlaskAutoCoding():
     message += '        <br><u><li style="display:block" onClick="toggleVisibility(document.getElementById(' + "'complete'" + '))">Completely coded Document</li></u>\n'
 
     message += '<div id="raw" style="display:none"><h3>Raw Input</h3><pre>\n'
-    message += d.rawClinicalDocument
+    message += context.rawClinicalDocument
     message += '</pre></div>\n'
     message += '<div id="prepared" style="display:none"><h3>Prepared Input</h3><pre>\n'
-    message += d.preparedDocument
+    message += context.preparedDocument
     message += '</pre></div>\n'
     message += '<div id="NLP" style="display:none"><h3>MetaMapLite coded Document</h3><pre>\n'
-    message += renderDocument(d.codedSentences)
+    message += renderDocument(context, context.codedSentences)
     message += '</pre></div>\n'
     message += '<div id="complete" style="display:none"><h3>Completely coded Document</h3><pre>\n'
-    message += renderDocument(d.completedSentences)
+    message += renderDocument(context, context.completedSentences)
     message += '</pre></div>\n'
 
     message += '</p></body></html>'
     return Response(response=message, status=200)
 
 
-def renderDocument(sentences):
+def renderDocument(context, sentences):
     '''
-    Render d.preparedDocument as lines with codes from 'sentences'
+    Render context.preparedDocument as lines with codes from 'sentences'
     '''
 
     # Output each sentence followed by the codes
@@ -136,7 +139,7 @@ def renderDocument(sentences):
     lineStart = 0
     lineEnd = 0
     sentenceNo = 0
-    for line in d.preparedDocument.split('\n'):
+    for line in context.preparedDocument.split('\n'):
         thisLine = line.strip()
         lineStart = lineEnd
         lineEnd += len(thisLine) + 1
@@ -144,30 +147,30 @@ def renderDocument(sentences):
         renderedLines.append(thisLine)
         if sentenceNo == len(sentences):
             continue
-        while (sentences[sentenceNo][2] + sentences[sentenceNo][3]) < lineStart:
+        while (sentences[sentenceNo].start + sentences[sentenceNo].length) < lineStart:
             # logging.debug('renderDocument() - skipping sentence %d, from %d to %d, (%s)',
-            #               sentenceNo, sentences[sentenceNo][2], sentences[sentenceNo][2] + sentences[sentenceNo][3], sentences[sentenceNo][4])
+            #               sentenceNo, sentences[sentenceNo].start, sentences[sentenceNo].start + sentences[sentenceNo].length, sentences[sentenceNo].text)
             sentenceNo += 1
             if sentenceNo == len(sentences):
                 break
         if sentenceNo == len(sentences):
             continue
         codeLines = []
-        while sentences[sentenceNo][2] + sentences[sentenceNo][3] < lineEnd:
+        while sentences[sentenceNo].start + sentences[sentenceNo].length < lineEnd:
             # logging.debug('renderDocument() - rendering sentence %d, from %d to %d, (%s)',
-            #               sentenceNo, sentences[sentenceNo][2], sentences[sentenceNo][2] + sentences[sentenceNo][3], sentences[sentenceNo][4])
-            document = sentences[sentenceNo][6]    # Sentences hold mini-documents
-            for start in sorted(document, key=int):        # We step through all concepts, in sequence across this sentence
+            #               sentenceNo, sentences[sentenceNo].start, sentences[sentenceNo].start + sentences[sentenceNo].length, sentences[sentenceNo].text)
+            document = sentences[sentenceNo].document    # Sentences hold mini-documents
+            for start in document:        # We step through all concepts, in sequence across this sentence
                 # logging.debug('renderDocument() - checking codes as %s with start %d and end %d', start, lineStart, lineEnd)
                 if start < lineStart:
                     continue
                 if start > lineEnd:
                     break
                 for j in range(len(document[start])):            # Step through the list of alternate concepts at this point in this sentence
-                    concept = document[start][j]['concept']        # This concept
+                    concept = document[start][j].concept        # This concept
                     if concept not in d.solutionMetaThesaurus:
                         continue
-                    codeAt = thisLine.find(document[start][j]['text'])
+                    codeAt = thisLine.find(document[start][j].text)
                     if codeAt == -1:
                         continue
                     # logging.debug('renderDocument() - rendering concept (%s) at %d', concept, codeAt)
@@ -182,7 +185,7 @@ def renderDocument(sentences):
                     pad = codeAt - len(codeLines[foundLine])
                     codeLines[foundLine] += ' ' * pad
                     codeLines[foundLine] += '<span style="color:blue;background-color:aqua">'
-                    codeLines[foundLine] += concept + f"[{document[start][j]['text']}]({d.solutionMetaThesaurus[concept]['description']})"
+                    codeLines[foundLine] += concept + f"[{document[start][j].text}]({d.solutionMetaThesaurus[concept]['description']})"
                     codeLines[foundLine] += '</span>'
             else:
                 break
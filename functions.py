@@ -9,9 +9,11 @@ import sys
 import argparse
 import logging
 import json
-from urllib.parse import urlencode
-from http import client
+import bisect
+import itertools
 import checkFunctions as ch
+import metaMapLiteFunctions as mm
+import cacheFunctions as cache
 import data as d
 
 
@@ -38,17 +40,43 @@ def setArguments(isFlask):
                             help='The name of the clinical document file (default exmaple1.txt)')
         parser.add_argument('-O', '--outputDir', dest='outputDir',
                             help='The folder where the AutoCoding output(s) will be created (default="testOutput")')
+        parser.add_argument('-W', '--workers', dest='workers', type=int, default=1,
+                            help='The number of worker processes AutoCoding the clinical documents in inputDir in parallel (default=1)')
     parser.add_argument('-H', '--MetaMapLiteHost', dest='MetaMapLiteHost', default='localhost',
                         help='The name of the MetaMapLite Server (default="localhost")')
     parser.add_argument('-P', '--MetaMapLitePort', dest='MetaMapLitePort', default='8080',
                         help='The port for the AutoCoding service on the MetaMapLite Server (default="8080")')
     parser.add_argument('-U', '--MetaMapLiteURL', dest='MetaMapLiteURL', default='/AutoCoding/MetaMapLite',
                         help='The URL for the AutoCoding service on the MetaMapLite Server (default="localhost"")')
+    parser.add_argument('-E', '--MetaMapLiteEndpoint', dest='MetaMapLiteEndpoints', action='append', metavar='host:port[/URL]',
+                        help='A MetaMapLite endpoint (may be repeated) - replaces the -H/-P/-U MetaMapLite Server')
+    parser.add_argument('--MetaMapLitePoolSize', dest='MetaMapLitePoolSize', type=int, default=4,
+                        help='The maximum number of reusable (keep-alive) connections to each MetaMapLite endpoint (default=4)')
+    parser.add_argument('--MetaMapLiteConcurrency', dest='MetaMapLiteConcurrency', type=int, default=1,
+                        help='The maximum number of requests in flight to the MetaMapLite Server(s) (default=1)')
+    parser.add_argument('--MetaMapLiteEjectTime', dest='MetaMapLiteEjectTime', type=int, default=30,
+                        help='The number of seconds an unhealthy MetaMapLite endpoint is ejected for (default=30)')
+    parser.add_argument('--MetaMapLiteMaxFailures', dest='MetaMapLiteMaxFailures', type=int, default=3,
+                        help='The number of consecutive failures that make a MetaMapLite endpoint unhealthy (default=3)')
+    parser.add_argument('--MetaMapLiteCache', dest='MetaMapLiteCacheFile', metavar='cacheFile',
+                        help='The SQLite database file for caching MetaMapLite responses (default no cache)')
+    parser.add_argument('--MetaMapLiteCacheSize', dest='MetaMapLiteCacheSize', type=int, default=1024,
+                        help='The maximum size, in megabytes, of the cache of MetaMapLite responses (default=1024)')
+    parser.add_argument('--MetaMapLiteBackend', dest='MetaMapLiteBackend', default='MetaMapLite',
+                        help='The identifier of the MetaMapLite backend (version and UMLS index), used in the cache keys (default="MetaMapLite")')
+    parser.add_argument('--MetaMapLiteSentenceCache', dest='MetaMapLiteSentenceCache', action='store_true',
+                        help='Also cache the MetaMapLite annotations of each sentence and only send unseen sentences to MetaMapLite (requires --MetaMapLiteCache)')
+    parser.add_argument('--MetaMapLiteRecord', dest='MetaMapLiteRecordFile', metavar='recordFile',
+                        help='The file where every MetaMapLite response is recorded, for replaying with replayMetaMapLite.py (default no recording)')
     if isFlask:
         parser.add_argument('-p', '--port', dest='FlaskPort', default='8000',
                             help='The port for the AutoCoding service on this server (default="8000")')
     parser.add_argument('-S', '--Solution', dest='solution', required=True,
                         help='The folder containing the solution configuration files')
+    parser.add_argument('-B', '--solutionBundle', dest='solutionBundle', metavar='bundleFile',
+                        help='The compiled solution bundle, created by compileSolution.py (default load the solution from the Excel workbooks)')
+    parser.add_argument('--verifyTerms', dest='verifyTerms', action='store_true',
+                        help='Check the fused term replacement against applying every term to every line, and warn of any difference')
     parser.add_argument ('-v', '--verbose', dest='verbose', type=int, choices=range(0,5),
                          help='The level of logging\n\t0=CRITICAL,1=ERROR,2=WARNING,3=INFO,4=DEBUG')
     parser.add_argument ('-L', '--logDir', dest='logDir', default='.', metavar='logDir',
@@ -72,12 +100,24 @@ def doArguments(parser, isFlask):
         d.inputDir = args.inputDir
         d.inputFile = args.inputFile
         d.outputDir = args.outputDir
+        d.workers = args.workers
     d.MetaMapLiteHost = args.MetaMapLiteHost
     d.MetaMapLitePort = args.MetaMapLitePort
     d.MetaMapLiteURL = args.MetaMapLiteURL
+    d.MetaMapLitePoolSize = args.MetaMapLitePoolSize
+    d.MetaMapLiteConcurrency = args.MetaMapLiteConcurrency
+    d.MetaMapLiteEjectTime = args.MetaMapLiteEjectTime
+    d.MetaMapLiteMaxFailures = args.MetaMapLiteMaxFailures
+    d.MetaMapLiteCacheFile = args.MetaMapLiteCacheFile
+    d.MetaMapLiteCacheSize = args.MetaMapLiteCacheSize
+    d.MetaMapLiteBackend = args.MetaMapLiteBackend
+    d.MetaMapLiteSentenceCache = args.MetaMapLiteSentenceCache
+    d.MetaMapLiteRecordFile = args.MetaMapLiteRecordFile
     if isFlask:
         d.FlaskPort = args.FlaskPort
     d.solution = args.solution
+    d.solutionBundle = args.solutionBundle
+    d.verifyTerms = args.verifyTerms
     logDir = args.logDir
     logFile = args.logFile
     loggingLevel = args.verbose
@@ -100,6 +140,27 @@ def doArguments(parser, isFlask):
         else:
             logging.basicConfig(format=logfmt, datefmt='%d/%m/%y %H:%M:%S %p')
     logging.debug('Logging set up')
+
+    # Set up the MetaMapLite endpoints
+    d.MetaMapLiteEndpoints = []
+    if args.MetaMapLiteEndpoints is None:
+        d.MetaMapLiteEndpoints.append({'host':d.MetaMapLiteHost, 'port':d.MetaMapLitePort, 'url':d.MetaMapLiteURL})
+    else:
+        for endpoint in args.MetaMapLiteEndpoints:
+            thisEndpoint = mm.parseEndpoint(endpoint)
+            if thisEndpoint is None:
+                logging.critical('Invalid MetaMapLite endpoint (%s) - must be host:port[/URL]', endpoint)
+                logging.shutdown()
+                sys.exit(d.EX_USAGE)
+            d.MetaMapLiteEndpoints.append(thisEndpoint)
+    if d.workers < 1:
+        logging.critical('--workers must be at least 1')
+        logging.shutdown()
+        sys.exit(d.EX_USAGE)
+    if d.MetaMapLiteSentenceCache and (d.MetaMapLiteCacheFile is None):
+        logging.critical('--MetaMapLiteSentenceCache requires --MetaMapLiteCache')
+        logging.shutdown()
+        sys.exit(d.EX_USAGE)
     return
 
 
@@ -113,6 +174,8 @@ def getSection(currentSection, text):
         section         - str, the new section name, or currentSection if no section marker found
     '''
 
+    if not ch.anyMarker('section', text):        # None of the section markers are in this text
+        return currentSection
     for marker in d.sectionMarkers:
         # logging.debug('Checking section_marker:%s', marker[0].pattern)
         match = marker[0].search(text)
@@ -121,90 +184,135 @@ def getSection(currentSection, text):
     return currentSection        # return current section
 
 
-def doNegationLists():
+def findMarkers(text):
+    '''
+    Find the positional markers in the text of a sentence.
+    Each marker name in d.sentenceMarkers has a list of regular expressions - the first match of each one is a marker
+    Parameters
+        text        - str, the text of the sentence
+    Returns
+        markers     - dict, the sorted list of marker positions (in text) for each marker name
+    '''
+
+    markers = {}
+    lowerText = ch.prefilterText(text)
+    counts = [0, 0]
+    for name, patterns in d.sentenceMarkers.items():
+        positions = []
+        for pattern in patterns:
+            if not ch.mayMatch(pattern, lowerText, counts):      # This marker is not in the text
+                continue
+            match = pattern.search(text)
+            if match is not None:
+                positions.append(match.start())
+        markers[name] = sorted(positions)
+    ch.addPrefilterStatistics('markers', counts)
+    return markers
+
+
+def indexConcepts(context):
+    '''
+    Index the places where each concept is in the mini-documents
+    Parameters
+        context         - d.AutoCodingContext, the state of AutoCoding this clinical document
+    Returns
+        conceptIndex    - dict, for each concept, the list of the places (sentenceNo, start, alternate) where it is, in document order
+    '''
+
+    conceptIndex = {}
+    for sentenceNo, sentence in enumerate(context.sentences):            # Step through each sentence
+        document = sentence.document    # Sentences hold mini-documents
+        for thisStart in document:        # We step through all the places where there are concepts in this sentence, in order
+            for jj, miniDoc in enumerate(document[thisStart]):            # Step through the list of alternate concepts at this point in this sentence
+                if miniDoc.concept not in conceptIndex:
+                    conceptIndex[miniDoc.concept] = [(sentenceNo, thisStart, jj)]
+                else:
+                    conceptIndex[miniDoc.concept].append((sentenceNo, thisStart, jj))
+    return conceptIndex
+
+
+def doNegationLists(context):
     '''
     Look for negated concepts that imply that a list of related concepts should also be negated or made ambiguous.
     When found, do negate/make ambiguous the related condepts.
     Parameters
-        None
+        context - d.AutoCodingContext, the state of AutoCoding this clinical document
     Returns
         Nothing
     '''
 
+    # Only the concepts in the negation lists are looked at, using an index of where each concept is.
+    # Negating a concept can make it a trigger, so the triggers are checked in document order and their negation is checked when they are reached
+    conceptIndex = indexConcepts(context)
+
     # Look for concepts within sentence that are negated,
     # and which imply other concepts in the same sentence should be set to negative or ambiguous
     # logging.debug('doNegationLists - looking for sentence negatations')
-    for sentenceNo, sentence in enumerate(d.sentences):            # Step through each sentence
-        # logging.debug('doNegationLists[sentences] - processing sentence[%d]', sentenceNo)
-        document = sentence[6]    # Sentences hold mini-documents
-        section = sentence[7]        # The section for this sentence    - can be 'None'
-        for thisStart in sorted(document, key=int):        # We step through all the places where there are concepts in this sentence
-            for jj in range(len(document[thisStart])):            # Step through the list of alternate concepts at this point in this sentence
-                thisConcept = document[thisStart][jj]['concept']
-                # logging.debug('checking concept (%s): %s', thisConcept, document[thisStart][jj])
-                # Check if this is a negated concept that is in sentenceNegationLists
-                if (document[thisStart][jj]['negation'] == '1') and (thisConcept in d.sentenceNegationLists):        # Check negated concepts
-                    # Check if this sentence is in an appropriate section
-                    if 'All' in d.sentenceNegationLists[thisConcept]:
-                        thisSection = 'All'
-                    elif section in d.sentenceNegationLists[thisConcept]:
-                        thisSection = section
+    triggers = sorted(place for concept in conceptIndex if concept in d.sentenceNegationLists for place in conceptIndex[concept])
+    for sentenceNo, thisStart, jj in triggers:
+        document = context.sentences[sentenceNo].document    # Sentences hold mini-documents
+        section = context.sentences[sentenceNo].section        # The section for this sentence    - can be 'None'
+        thisConcept = document[thisStart][jj].concept
+        # logging.debug('checking concept (%s): %s', thisConcept, document[thisStart][jj])
+        if document[thisStart][jj].negation != '1':        # Check negated concepts
+            continue
+        # Check if this sentence is in an appropriate section
+        if 'All' in d.sentenceNegationLists[thisConcept]:
+            thisSection = 'All'
+        elif section in d.sentenceNegationLists[thisConcept]:
+            thisSection = section
+        else:
+            continue        # Doesn't apply to this section
+        # Do all the negations/ambiguities that are implied by this negative concept
+        for negation in d.sentenceNegationLists[thisConcept][thisSection]:        # Do both 'make negative' and ' make ambuguous'
+            # For every concept in this sentence that matches a concept in this sentence negation list
+            for listConcept in d.sentenceNegationLists[thisConcept][thisSection][negation]:
+                for senNo, strt, k in conceptIndex.get(listConcept, []):
+                    if senNo != sentenceNo:
+                        continue
+                    if negation:
+                        document[strt][k].negation = '1'
                     else:
-                        continue        # Doesn't apply to this section
-                    # Do all the negations/ambiguities that are implied by this negative concept
-                    for negation in d.sentenceNegationLists[thisConcept][thisSection]:        # Do both 'make negative' and ' make ambuguous'
-                        # For every concept in this sentence that matches a concept in this sentence negation list
-                        for strt in sorted(document, key=int):        # We step through all concepts in this sentence
-                            for k in range(len(document[strt])):        # Step through the list of alternate concepts at this point in this sentence
-                                thisConcept = document[strt][k]['concept']
-                                if thisConcept in d.sentenceNegationLists[thisConcept][thisSection][negation]:
-                                    if negation:
-                                        document[strt][k]['negation'] = '1'
-                                    else:
-                                        document[strt][k]['negation'] = '2'
+                        document[strt][k].negation = '2'
 
     # Look for concepts within the document that are negated, and which imply other concepts within the document should be negated or made ambiguous
     # logging.debug('doNegationLists - looking for document negatations')
-    for sentenceNo, sentence in enumerate(d.sentences):            # Step through each sentence
-        # logging.debug('doNegationLists[document] - processing sentence[%d]', sentenceNo)
-        document = sentence[6]    # Sentences hold mini-documents
-        section = sentence[7]        # The section for this sentence
-        for thisStart in sorted(document, key=int):        # We step through all the places where there are concepts in this sentence
-            for jj in range(len(document[thisStart])):            # Step through the list of alternate concepts at this point in this sentence
-                thisConcept = document[thisStart][jj]['concept']
-                # logging.debug('checking concept (%s): %s', thisConcept, document[thisStart][jj])
-                # Check if this is a negated concept that is in documentNegationLists
-                if (document[thisStart][jj]['negation'] == '1') and (thisConcept in d.documentNegationLists):        # Check negated concepts
-                    # Check if this sentence is in an appropriate section
-                    if 'All' in d.documentNegationLists[thisConcept]:
-                        thisSection = 'All'
-                    elif section in d.documentNegationLists[thisConcept]:
-                        thisSection = section
+    triggers = sorted(place for concept in conceptIndex if concept in d.documentNegationLists for place in conceptIndex[concept])
+    for sentenceNo, thisStart, jj in triggers:
+        document = context.sentences[sentenceNo].document    # Sentences hold mini-documents
+        section = context.sentences[sentenceNo].section        # The section for this sentence
+        thisConcept = document[thisStart][jj].concept
+        # logging.debug('checking concept (%s): %s', thisConcept, document[thisStart][jj])
+        if document[thisStart][jj].negation != '1':        # Check negated concepts
+            continue
+        # Check if this sentence is in an appropriate section
+        if 'All' in d.documentNegationLists[thisConcept]:
+            thisSection = 'All'
+        elif section in d.documentNegationLists[thisConcept]:
+            thisSection = section
+        else:
+            continue        # Doesn't apply to this section
+        # Do all the negations/ambiguities that are implied by this negative concept
+        for negation in d.documentNegationLists[thisConcept][thisSection]:
+            # Negate/make ambiguous every thing that matches something in this list
+            for listConcept in d.documentNegationLists[thisConcept][thisSection][negation]:
+                for senNo, strt, k in conceptIndex.get(listConcept, []):
+                    docu = context.sentences[senNo].document    # Sentences hold mini-documents
+                    if negation:
+                        docu[strt][k].negation = '1'
                     else:
-                        continue        # Doesn't apply to this section
-                    # Do all the negations/ambiguities that are implied by this negative concept
-                    for negation in d.documentNegationLists[thisConcept][thisSection]:
-                        # Negate/make ambiguous every thing that matches something in this list
-                        for senNo, thisSntnc in enumerate(d.sentences):            # Step through each sentence
-                            docu = thisSntnc[6]    # Sentences hold mini-documents
-                            for strt in sorted(docu, key=int):        # We step through all concepts in this sentence
-                                for k in range(len(docu[strt])):            # Step through the list of alternate concepts at this point in this sentence
-                                    thisDocConcept = docu[strt][k]['concept']
-                                    if thisDocConcept in d.documentNegationLists[thisConcept][thisSection][negation]:
-                                        if negation:
-                                            docu[strt][k]['negation'] = '1'
-                                        else:
-                                            docu[strt][k]['negation'] = '2'
+                        docu[strt][k].negation = '2'
     return
 
 
-def addAdditionalConcept(concept, sentenceNo, start, j, description, negated, reason, depth):
+def addAdditionalConcept(context, concept, sentenceNo, start, j, description, negated, reason, depth):
     '''
     Add an additional concept to the mini-document for this sentence because a concept set has been found.
     The additional concept will be added at position 'start', by copying most of the details from the jth concept at start.
     Parameters
+        context     - d.AutoCodingContext, the state of AutoCoding this clinical document
         concept     - str, the additional concept being added to the mini-document
-        sentenceNo  - int, the sentence in d.sentences where the mini-document will be found
+        sentenceNo  - int, the sentence in context.sentences where the mini-document will be found
         start       - int, where, within the sentence the mini-document will be found and the additional concept added
         j           - int, the location of another concept in this mini-document from which attributes can be copied
         negated     - str, the negation/ambiguity status of the additional concept
@@ -221,44 +329,73 @@ def addAdditionalConcept(concept, sentenceNo, start, j, description, negated, re
         sys.exit(d.EX_CONFIG)
 
     # Check that this concept doesn't already exist in the document at this point
-    document = d.sentences[sentenceNo][6]    # Sentences hold mini-documents
+    document = context.sentences[sentenceNo].document    # Sentences hold mini-documents
     for k in range(len(document[start])):
-        if concept == document[start][k]['concept']:
+        if concept == document[start][k].concept:
             break
     else:
         logging.info('Adding additional concept (%s:%s) to sentence[%d] at %d [%s]', concept, negated, sentenceNo, start, reason)
-        thisConcept = {}
-        thisConcept['concept'] = concept
-        thisConcept['negation'] = negated
-        thisConcept['text'] = document[start][j]['text']
-        thisConcept['length'] = document[start][j]['length']
-        thisConcept['history'] = document[start][j]['history']
-        thisConcept['partOfSpeech'] = 'NN'
-        thisConcept['used'] = False
-        if description is not None:
-            thisConcept['description'] = description
-        elif concept in d.solutionMetaThesaurus:
-            thisConcept['description'] = d.solutionMetaThesaurus[concept]['description']
-        else:
-            thisConcept['description'] = 'unknown'
+        if description is None:
+            if concept in d.solutionMetaThesaurus:
+                description = d.solutionMetaThesaurus[concept]['description']
+            else:
+                description = 'unknown'
+        thisConcept = d.ConceptMention(concept, negated, document[start][j].text, document[start][j].length, document[start][j].history, 'NN', description)
         document[start].append(thisConcept)
 
         # Now see if this has implications for the solution
-        d.sc.solutionAddAdditionalConcept(concept, sentenceNo, start, j, negated, depth + 1)
+        d.sc.solutionAddAdditionalConcept(context, concept, sentenceNo, start, j, negated, depth + 1)
     return
 
 
-def cleanDocument():
+def replaceTerms(fusedTerms, text):
     '''
-    Clean d.rawClinicalDocument, saving the cleaned document in d.preparedDocument
+    Apply the terms, in order, to the text - skipping the blocks of terms, and the terms, that cannot match
+    Parameters
+        fusedTerms  - list, the blocks of terms and their fused gates (see solutionFunctions.fuseRules())
+        text        - str, the text in which commonly used terms are to be replaced
+    Returns
+        newText     - str, the text with the terms replaced
+    '''
+
+    newText = text
+    lowerText = ch.prefilterText(newText)
+    counts = [0, 0]
+    for gate, terms in fusedTerms:
+        if (gate is not None) and (gate.search(newText) is None):
+            continue
+        for common, replacement in terms:
+            if not ch.mayMatch(common, lowerText, counts):      # This term is not in the text
+                continue
+            # logging.debug('Replacing (%s) with (%s)', common.pattern, replacement)
+            replacedText = common.sub(replacement, newText)
+            if replacedText != newText:
+                newText = replacedText
+                lowerText = ch.prefilterText(newText)
+    ch.addPrefilterStatistics('terms', counts)
+    if d.verifyTerms:
+        # Check against applying every term
+        checkText = text
+        for gate, terms in fusedTerms:
+            for common, replacement in terms:
+                checkText = common.sub(replacement, checkText)
+        if checkText != newText:
+            logging.warning('Fused term replacement of (%s) gave (%s), not (%s)', text, newText, checkText)
+            newText = checkText
+    return newText
+
+
+def cleanDocument(context):
+    '''
+    Clean context.rawClinicalDocument, saving the cleaned document in context.preparedDocument
     '''
 
     # Start by doing any solution specific document cleaning
-    d.sp.solutionCleanDocument()
+    d.sp.solutionCleanDocument(context)
 
     # Clean the text document
     newDocument = []
-    for line in d.preparedDocument.split('\n'):
+    for line in context.preparedDocument.split('\n'):
         # logging.debug('Next line is (%s)', line)
         cleanLine = line.rstrip()
 
@@ -276,9 +413,7 @@ def cleanDocument():
 
         # Then change any commonly used terms into their technical equivalents
         # logging.debug('line before replacements:%s', cleanLine)
-        for common, technical in d.terms:
-            # logging.debug('Replacing (%s) with (%s)', common.pattern, technical)
-            cleanLine = common.sub(technical, cleanLine)
+        cleanLine = replaceTerms(d.fusedTerms, cleanLine)
         # logging.debug('line with replacements:%s', cleanLine)
 
         # And skip blank lines
@@ -292,7 +427,7 @@ def cleanDocument():
 
         newDocument.append(cleanLine)
 
-    d.preparedDocument = '\n'.join(newDocument) + '\n'
+    context.preparedDocument = '\n'.join(newDocument) + '\n'
 
     # Now change any commonly used preamble terms into their non-technical equivalents
     # We do that by treating the whole of the document as a single sentence and go looking for history.
@@ -300,11 +435,11 @@ def cleanDocument():
 
     # logging.debug('looking for preamble')
     # Looking for the start of history in the document
-    thisText = d.preparedDocument
+    thisText = context.preparedDocument
 
     # logging.debug('Text document before preamble Terms changed')
-    # logging.debug(d.preparedDocument)
-    (changeFound, changeAt) = ch.checkPreamble(False, thisText)
+    # logging.debug(context.preparedDocument)
+    (changeFound, changeAt) = ch.checkPreamble(context, False, thisText)
     if changeFound:            # We have history at the start or somewhere in, the document
         if changeAt != 0:
             document1 = thisText[:changeAt]        # Everything before the start of the first slab of history
@@ -312,66 +447,61 @@ def cleanDocument():
             someText = document2
             # logging.debug('some preamble found (%s)', document1)
             # Look for the end of history in the remainder of the document
-            (changeFound, changeAt) = ch.checkPreamble(True, someText)
+            (changeFound, changeAt) = ch.checkPreamble(context, True, someText)
             if not changeFound:            # We have end of history at the start, or somewhere in the document
                 if changeAt != 0:
                     document1 += someText[:changeAt]        # Preamble includes everything up to the end of the last slab of history
                     document2 = someText[changeAt:]        # Everything that must remain unchanged
             # logging.debug('preamble found (%s)', document1)
             # Now change any commonly used preamble terms into their non-technical equivalents
-            for common, nonTechnical in d.preambleTerms:
-                # logging.debug('Replacing preamble (%s) with (%s) if found in preamble', common.pattern, nonTechnical)
-                document1 = common.sub(nonTechnical, document1)
-            d.preparedDocument = document1 + document2
+            document1 = replaceTerms(d.fusedPreambleTerms, document1)
+            context.preparedDocument = document1 + document2
     # logging.debug('Text document after preamble Terms changed')
-    # logging.debug(d.preparedDocument)
+    # logging.debug(context.preparedDocument)
     return
 
 
-def AutoCode():
+def AutoCode(context):
     '''
-    AutoCode d.rawClinicalDocument
+    AutoCode context.rawClinicalDocument
     Call MetaMapLite to process this document
     Then complete the coding by calling the solution specific complete() function
     '''
 
     # Prepare the clinical document
-    cleanDocument()
-    logging.info('raw document:\n%s\n', d.rawClinicalDocument)
-    logging.info('prepared document:\n%s\n', d.preparedDocument)
+    cleanDocument(context)
+    logging.info('raw document:\n%s\n', context.rawClinicalDocument)
+    logging.info('prepared document:\n%s\n', context.preparedDocument)
 
     # Get the sentences and concepts using MetaMapLite and compute the start and end of each sentence
     # (sentence are output in sentence order - we ignore some in order to skip 'history')
 
-    # Acquire the MetaMapLite lock - MetaMapLite may not be thread safe
-    d.MetaMapLiteServiceLock.acquire()
-
-    # Set up the parameter (the document) and call the MetaMapLite service
-    params = urlencode({'document':d.preparedDocument})
-    try:
-        thisMetaMapLiteConnection = client.HTTPConnection(d.MetaMapLiteHost, d.MetaMapLitePort)
-        thisMetaMapLiteConnection.request('POST', d.MetaMapLiteURL, params, d.MetaMapLiteHeaders)
-        response = thisMetaMapLiteConnection.getresponse()
-        if response.status != 200:
-            logging.critical('Invalid response from MetaMapLite Service:error %s', response.status)
-            return (d.EX_SOFTWARE, f'Invalid response from MetaMapLite Service:({repr(response.status)})')
-        responseData = response.read()
-        thisMetaMapLiteConnection.close()
-    except (client.NotConnected, client.InvalidURL, client.UnknownProtocol,client.UnknownTransferEncoding,client.UnimplementedFileMode,   client.IncompleteRead, client.ImproperConnectionState, client.CannotSendRequest, client.CannotSendHeader, client.ResponseNotReady, client.BadStatusLine) as thisE:
-        logging.critical('MetaMapLite Service request error:(%s)', repr(thisE))
-        d.MetaMapLiteServiceLock.release()
-        return (d.EX_SOFTWARE, f'MetaMapLite Service request error:({repr(thisE)})')
-
-    # Release the MetaMapLite lock
-    d.MetaMapLiteServiceLock.release()
+    # Check the cache of MetaMapLite responses
+    responseData = None
+    if d.MetaMapLiteCacheFile is not None:
+        responseData = cache.getResponse(context.preparedDocument)
+    isCached = responseData is not None
+
+    # Call the MetaMapLite service, using a connection from the pool of keep-alive connections
+    # (waiting if the limit of requests in flight has been reached)
+    # With the sentence cache, only the sentences that are not in the cache are sent to the MetaMapLite service
+    if not isCached:
+        if d.MetaMapLiteSentenceCache:
+            success, responseData = cache.getSegmentedResponse(context.preparedDocument)
+        else:
+            success, responseData = mm.callMetaMapLite(context.preparedDocument)
+        if success != d.EX_OK:
+            return (success, responseData)
 
     # Parse the response into into a dictionary of sentences and concepts
     try:
-        d.MetaMapLiteResponse = json.loads(responseData)
+        context.MetaMapLiteResponse = json.loads(responseData)
     except ValueError as thisE:
         logging.critical('Invalid JSON response (%s) from MetaMapLite Service - error(%s)', repr(responseData), repr(thisE))
-        return (d.EX_SOFTWARE, f'Invalid JSON response ({repr(response.status)}) from MetaMapLite Service:({repr(thisE)})')
-    logging.debug('MetaMapLite response:%s', json.dumps(d.MetaMapLiteResponse, indent=2))
+        return (d.EX_SOFTWARE, f'Invalid JSON response ({repr(responseData)}) from MetaMapLite Service:({repr(thisE)})')
+    if (d.MetaMapLiteCacheFile is not None) and not isCached:
+        cache.putResponse(context.preparedDocument, responseData)
+    logging.debug('MetaMapLite response:%s', json.dumps(context.MetaMapLiteResponse, indent=2))
     # The MetaMapLite response is a dictionary with two keys - "concepts" and "sentences", each of which is an array of dictionaries
     # for "concepts" each dictionary has only one key - being a MetaMapLite Concept ID. The value is a dictionary with five keys
     #        "start" - where the text mapped to this concept starts in the text document
@@ -387,59 +517,131 @@ def AutoCode():
     # (each "start" value is larger than the preceeding "start" [by at least len("text")]
 
     # Now complete the coding of this document
-    codingSuccess, reason = complete()
+    codingSuccess, reason = complete(context)
     if codingSuccess != d.EX_OK:
         logging.critical('AutoCoding failed: error(%s) with reason (%s)', codingSuccess, reason)
         return codingSuccess
 
     # Now analyze the results
-    d.sa.analyze()
+    d.sa.analyze(context)
     return d.EX_OK
 
 
-def complete():
+def searchFrom(positions, pattern, text, start, end):
+    '''
+    Search for the first match of a pattern in text[start:end], exactly as pattern.search(text[start:end]) would.
+    Only the positions where the pattern matches in the whole of text can be the start of a match, so only they are checked
+    Parameters
+        positions   - list or range, the positions of the pattern in text (from checkFunctions.triggerPositions()), or None if the pattern is not indexed
+        pattern     - compiled regular expression, the pattern
+        text        - str, the text
+        start       - int, the start of the slice of text to search
+        end         - int, the end of the slice of text to search
+    Returns
+        found       - tuple, the start and end of the match (in the slice), or None if there is no match
+    '''
+
+    if (positions is None) or not ch.cleanCut(pattern, text, start, end):
+        match = pattern.search(text[start:end])
+        if match is None:
+            return None
+        return (match.start(), match.end())
+    nextPosition = bisect.bisect_left(positions, start)
+    while (nextPosition < len(positions)) and (positions[nextPosition] <= end):
+        match = pattern.match(text, positions[nextPosition], end)
+        if match is not None:
+            return (match.start() - start, match.end() - start)
+        nextPosition += 1
+    return None
+
+
+def findGrossNegations(context):
+    '''
+    Find the gross negations in this clinical document. For each sentence, and each gross negation, look for the first start of gross negation marker
+    in the text of this sentence and the following sentences in the gross negation's range, and the first end of gross negation marker after it.
+    The text of the sentences is joined into one text, and each marker is searched for once, in that one text,
+    rather than building and searching the text of every range of sentences
+    Parameters
+        context         - d.AutoCodingContext, the state of AutoCoding this clinical document
+    Returns
+        grossNegations  - dict, for each sentence, the list of gross negations found - (grossStart, grossEnd, grossRange, startAt, endAt)
+                          where startAt is the end of the start marker in the text of the range of sentences
+                          and endAt is the start of the end marker in the text after the start marker
+    '''
+
+    grossNegations = {}
+    if len(d.grossNegation) == 0:
+        return grossNegations
+
+    # Join the text of the sentences, remembering where each sentence starts
+    sentenceAt = []
+    at = 0
+    for sentence in context.sentences:
+        sentenceAt.append(at)
+        at += len(sentence.text) + 1
+    documentText = ' '.join([sentence.text for sentence in context.sentences])
+
+    for grossStart, grossEnd, grossRange in d.grossNegation:
+        startPositions = ch.triggerPositions(grossStart, documentText)
+        endPositions = ch.triggerPositions(grossEnd, documentText)
+        for sentenceNo, sentence in enumerate(context.sentences):
+            thisRange = grossRange
+            if sentenceNo + thisRange > len(context.sentences):
+                thisRange = len(context.sentences) - sentenceNo
+            if (thisRange < 1) or (sentence.text == ''):
+                # Build the text of this range of sentences (which doesn't start with a space, even if the first sentence is empty)
+                theText = ''
+                for grossSentence in range(sentenceNo, sentenceNo + thisRange):
+                    if theText != '':
+                        theText += ' '
+                    theText += context.sentences[grossSentence].text
+                rangeText = theText
+                rangeStart = 0
+                rangeEnd = len(theText)
+                startIndex = endIndex = None
+            else:
+                rangeText = documentText
+                rangeStart = sentenceAt[sentenceNo]
+                rangeEnd = sentenceAt[sentenceNo + thisRange - 1] + len(context.sentences[sentenceNo + thisRange - 1].text)
+                startIndex = startPositions
+                endIndex = endPositions
+            # logging.debug('Looking for gross negation pattern (%s.*%s) in (%s)', grossStart.pattern, grossEnd.pattern, rangeText[rangeStart:rangeEnd])
+            foundStart = searchFrom(startIndex, grossStart, rangeText, rangeStart, rangeEnd)
+            if foundStart is None:
+                continue
+            startAt = foundStart[1]        # Check after the end of the start of gross negation
+            foundEnd = searchFrom(endIndex, grossEnd, rangeText, rangeStart + startAt, rangeEnd)
+            if foundEnd is None:
+                continue
+            if sentenceNo not in grossNegations:
+                grossNegations[sentenceNo] = []
+            grossNegations[sentenceNo].append((grossStart, grossEnd, thisRange, startAt, foundEnd[0]))
+    return grossNegations
+
+
+def complete(context):
     '''
     Complete the coding of this document
     '''
 
     # The text document has been reassembled into sentences (full stops in the text helps).
-    # And the clinical terms have identified by MetaMapLite. All of this stored in the MetaMapLit respone (d.MetaMapLiteResponse).
-    # Next we create the "sentences" structure (d.sentences) where we associate the MetaThesaurus Concept IDs
+    # And the clinical terms have identified by MetaMapLite. All of this stored in the MetaMapLit respone (context.MetaMapLiteResponse).
+    # Next we create the "sentences" structure (context.sentences) where we associate the MetaThesaurus Concept IDs
     # with their specific location with their specific 'sentence'.
     # However, we also need to know which concepts are historical concepts and which concepts are current concepts.
-    # The main data structure here is 'sentences' - a list of the sentences in the clinical document.
-    # Each sentence in the list has the following attributes
-    #     [0] - a boolean that indicates that this sentence contains changes - parts of this sentence are not the same history as the start
-    #     [1] - a boolean that indicates the initial history state of this sentence (True => isHistory)
-    #     [2] - an integer - the character position of the start of this sentence within the document
-    #     [3] - an integer - the length of this sentence
-    #     [4] - a string - the text of this sentence
-    #     [5] - a list of all the places in this sentence where history flips (into/out of history)
-    #     [6] - a dictionary of the concepts within this sentence (a mini-document)
-    #     [7] - the section containg this sentence
-    #
-    #     Each mini-document (d.sentences[sentenceNo][6]) is a dictionary with an integer as the key (the start of this concept in the main document).
-    #     The value for each key ('start') is a list of alternate concepts, all of which start at the same character position in the main document.
-    #     Each alternate concept in the list is a dictionary of concept attributes.
-    #     The keys for each alternate concept dictionary in the list are
-    #         'length' - an integer - the number of characters in the sentence required to identifying this concept
-    #         'history' - a boolean that indicates that this concept is historical information - in a history sentence or after this sentence flipped into history
-    #         'concept' - a string - the MetaThesaurus concept.
-    #         'used' - a boolean that is set to True when a concept has been used to identify a higher concept
-    #         'text' - a string - the text at start, for 'length', which MetaMapLite found to be 'concept'.
-    #         'partOfSpeech' - a sting - the part of speech tag (code) that indicates how this concept was used in the sentence (noun, adverb, adjective etc)
-    #         'negation' - a string that indicates that this is a positive ('0'), negative ('1') or ambiguous ('2') concept
-    #         'description' - a string - the description of this concept (which may differ from the text matched to this concept).
+    # The main data structure here is 'sentences' - a list of the sentences in the clinical document (d.Sentence).
+    # Each sentence holds a mini-document (d.MiniDocument) - a dictionary, with the start of each concept in the main document as the key, kept in order,
+    # of the list of alternate concepts (d.ConceptMention) that start at that character position in the main document.
 
     # Process the returned sentences
-    d.sentences=[]    # The sentence/sentence part, to which we will attach mini documents of MetaThesaurus Concepts
+    context.sentences=[]    # The sentence/sentence part, to which we will attach mini documents of MetaThesaurus Concepts
     inHistory = False    # We assume the text document starts by referencing the present
     currentSection = 'None'
     DOSeol = False          # Check for DOS/Windows end of line characters
-    lastSentence = d.MetaMapLiteResponse['sentences'][-1]
-    if (lastSentence['start'] + len(lastSentence['text']) + 1) < len(d.preparedDocument):
+    lastSentence = context.MetaMapLiteResponse['sentences'][-1]
+    if (lastSentence['start'] + len(lastSentence['text']) + 1) < len(context.preparedDocument):
         DOSeol = True
-    for sentenceNo, sentence in enumerate(d.MetaMapLiteResponse['sentences']):        # process each sentence
+    for sentenceNo, sentence in enumerate(context.MetaMapLiteResponse['sentences']):        # process each sentence
         if DOSeol:
             thisStart = sentence['start'] + sentenceNo        # The start of the current sentence is DOS/Windows land
         else:
@@ -449,35 +651,37 @@ def complete():
         thisText = thisText.rstrip()
         section = getSection(currentSection, thisText)        # Get the section for this sentence
         currentSection = section
-        d.sentences.append([False, inHistory, thisStart, len(thisText), thisText, [], {}, section])
+        context.sentences.append(d.Sentence(False, inHistory, thisStart, len(thisText), thisText, [], d.MiniDocument(), section, findMarkers(thisText)))
         # We need to know if this sentence is in a history section, or just contains the word(s) implying 'history' somewhere in the sentence
         firstChange = True
         lastChange = 0
         depth = 0
-        changesAt, matchLen = ch.checkHistory(inHistory, thisText, depth)
+        changesAt, matchLen = ch.checkHistory(context, inHistory, thisText, depth)
         while changesAt is not None:        # Bounced in or out of history mid sentence
             # logging.debug('checkHistory() - bounced in/out of history at %d for %d characters', changesAt, matchLen)
             if firstChange and (changesAt == 0):            # Changed at the start of the text which is the start of the sentence
-                d.sentences[-1][1] = not inHistory
+                context.sentences[-1].isHistory = not inHistory
             else:
-                d.sentences[-1][0] = True    # Does contain history changes somewhere
-                if len(d.sentences[-1][5]) == 0:
-                    d.sentences[-1][5].append(changesAt)
+                context.sentences[-1].hasChanges = True    # Does contain history changes somewhere
+                if len(context.sentences[-1].changesAt) == 0:
+                    context.sentences[-1].changesAt.append(changesAt)
                 else:
-                    changesAt += d.sentences[-1][5][-1] + lastChange
-                    d.sentences[-1][5].append(changesAt)
+                    changesAt += context.sentences[-1].changesAt[-1] + lastChange
+                    context.sentences[-1].changesAt.append(changesAt)
             firstChange = False
             lastChange = matchLen
             inHistory = not inHistory
             thisText = thisText[changesAt + lastChange:]
-            changesAt, matchLen = ch.checkHistory(inHistory, thisText, depth)
+            changesAt, matchLen = ch.checkHistory(context, inHistory, thisText, depth)
 
     # Now get the MetaThesaurus concepts (MetaMapLite returned them as a dictionary)
     # And add them to the appropriate sentences as mini documents.
     # Concepts are returned as a list of dictionaries. Each dictionary has a single key - the MetaThesaurus Concept ID
     # The 'value' associated with each Concept ID is a dictionary of the attributes of that Concept ID
     # this.logger.debug('Concepts')
-    for thisConcept in d.MetaMapLiteResponse['concepts']:
+    # The end of each sentence (or of any earlier sentence that ends later), in order, for bisecting
+    sentenceEnds = list(itertools.accumulate([sentence.start + sentence.length for sentence in context.sentences], max))
+    for thisConcept in context.MetaMapLiteResponse['concepts']:
         conceptID = list(thisConcept.keys())[0]
         # logging.debug('Concept:%s', repr(thisConcept))
         thisStart = int(thisConcept[conceptID]['start'])
@@ -492,31 +696,33 @@ def complete():
         else:
             isNegated = '0'
 
-        # Find the relevant sentence for this concept
+        # Find the relevant sentence for this concept - the first sentence that doesn't end before this concept starts
         # The sentences array is ordered so
         sentenceNo = None
         lastJJ = None
-        for jj, sentence in enumerate(d.sentences):
+        jj = bisect.bisect_left(sentenceEnds, thisStart)
+        if jj == len(context.sentences):            # Every sentence ends before this concept starts
+            if jj > 0:
+                lastJJ = jj - 1
+        else:
             lastJJ = jj
-            if sentence[2] + sentence[3] < thisStart:    # This sentence ends before this concept starts
-                continue
-            if sentence[2] > thisStart:                # This sentence starts after this concept starts - which is an error
-                break
+            sentence = context.sentences[jj]
+            if sentence.start > thisStart:                # This sentence starts after this concept starts - which is an error
+                pass
             # We have found the right sentence
-            if sentence[2] + sentence[3] == thisStart:    # Can't start a concept with the last character of this sentence - must be next sentence
+            elif sentence.start + sentence.length == thisStart:    # Can't start a concept with the last character of this sentence - must be next sentence
                 sentenceNo = jj + 1
             else:
                 sentenceNo = jj
-            break
 
         # Check that we did find a sentence for this concept
         if sentenceNo is None:
             logging.critical('Concept not in any sentence')
             logging.critical('Concept at %d', thisStart)
-            if len(d.sentences) == 0:
+            if len(context.sentences) == 0:
                 logging.critical('THERE ARE NO SENTENCES!!!!')
             else:
-                logging.critical('Last sentence starts at %d and ends at %d', d.sentences[-1][2], d.sentences[-1][2] + d.sentences[-1][3] - 1)
+                logging.critical('Last sentence starts at %d and ends at %d', context.sentences[-1].start, context.sentences[-1].start + context.sentences[-1].length - 1)
             return (d.EX_SOFTWARE, f'Concept ({repr(thisConcept)}) at {thisStart} is not in a sentence')
 
         # Check that this is a knownConcept
@@ -529,11 +735,11 @@ def complete():
             pass
 
         # Check if this is a historical concept
-        isHistory = d.sentences[sentenceNo][1]
-        if d.sentences[sentenceNo][0]:            # This sentence contains history changes
+        isHistory = context.sentences[sentenceNo].isHistory
+        if context.sentences[sentenceNo].hasChanges:            # This sentence contains history changes
             # Check the history list for this concept
-            for changeAt in d.sentences[sentenceNo][5]:
-                if changeAt > thisStart - d.sentences[sentenceNo][2]:    # Next change is after this concept
+            for changeAt in context.sentences[sentenceNo].changesAt:
+                if changeAt > thisStart - context.sentences[sentenceNo].start:    # Next change is after this concept
                     break
                 isHistory = not isHistory
 
@@ -546,7 +752,7 @@ def complete():
         # Check if we need to negate - nouns and adjective only
         if partOfSpeech in ['NN', 'NNP', 'NNS', 'NNPS', 'JJ', 'JJR', 'JJS', 'RB', 'RBR', 'RBS']:
             # Here we assume some that some phrases are demonstrative enough to apply to everything before or after them in the sentence
-            changeIt, reason, prePost =  ch.checkNegation(thisConcept, thisText, thisStart, sentenceNo, isNegated)
+            changeIt, reason, prePost =  ch.checkNegation(context, thisConcept, thisText, thisStart, sentenceNo, isNegated)
             if changeIt != '0':
                 if changeIt == '1':
                     logging.info('Concept %s (%d/%d) got negated - %s:%s', thisConcept, thisStart, lastJJ, prePost, reason)
@@ -555,74 +761,74 @@ def complete():
                 isNegated = changeIt
 
         # Check if the Solution requires this concept
-        if not d.sc.requireConcept(thisConcept, isNegated, partOfSpeech, isHistory, sentenceNo, thisStart, length, thisText):
+        if not d.sc.requireConcept(context, thisConcept, isNegated, partOfSpeech, isHistory, sentenceNo, thisStart, length, thisText):
             continue
 
         # Add this concept to the mini-document in this sentence. The min-document can have multiple concepts starting at the same spot.
-        document = d.sentences[sentenceNo][6]    # Sentences hold mini-documents
+        document = context.sentences[sentenceNo].document    # Sentences hold mini-documents
         if thisStart not in document:
             document[thisStart] = []
         miniDoc = len(document[thisStart])
         # Check if this concept already exists in this document at this point
         found = False
         for k in range(miniDoc):
-            if document[thisStart][k]['concept'] == thisConcept:
+            if document[thisStart][k].concept == thisConcept:
                 found = True
                 break
         if found:
             continue
-        document[thisStart].append({})
-        document[thisStart][miniDoc]['concept'] = thisConcept            # This concept ID (MetaThesaurus or SolutionID)
-        document[thisStart][miniDoc]['negation'] = isNegated                # This concept is negated
-        document[thisStart][miniDoc]['text'] = thisText                        # The text that matches this concept
-        document[thisStart][miniDoc]['length'] = length                    # The length of the text that matches this concept
-        document[thisStart][miniDoc]['history'] = isHistory                # Whether or not this concept exists in historical text
-        document[thisStart][miniDoc]['partOfSpeech'] = partOfSpeech        # The part of speech assigned by MetaMapLite
-        document[thisStart][miniDoc]['used'] = False                    # This concept has not yet been used
 
         # Add a description if we have one
         if thisConcept in d.solutionMetaThesaurus:
-            document[thisStart][miniDoc]['description'] = d.solutionMetaThesaurus[thisConcept]['description']
+            description = d.solutionMetaThesaurus[thisConcept]['description']
         else:
             # logging.debug(thisConcept)
-            document[thisStart][miniDoc]['description'] = 'unknown'
-        if thisConcept != conceptID:
-            if conceptID in d.solutionMetaThesaurus:
-                document[thisStart][miniDoc]['description'] += '(was:' + d.solutionMetaThesaurus[conceptID]['description'] + ')'
-            else:
-                document[thisStart][miniDoc]['description'] += '(was:unknown)'
+            description = 'unknown'
+        provenance = None
+        if thisConcept != conceptID:        # The description will say what the equivalent concept was, if it is ever asked for
+            provenance = ('equivalent', conceptID)
+
+        # This concept ID (MetaThesaurus or SolutionID), whether it is negated, the text that matches this concept and its length,
+        # whether or not this concept exists in historical text and the part of speech assigned by MetaMapLite - not yet used
+        document[thisStart].append(d.ConceptMention(thisConcept, isNegated, thisText, length, isHistory, partOfSpeech, description, provenance))
 
         # Check if we need to modify this concept
-        ch.checkModified(thisConcept, document[thisStart][miniDoc]['negation'], sentenceNo, thisStart, miniDoc)
+        ch.checkModified(context, thisConcept, document[thisStart][miniDoc].negation, sentenceNo, thisStart, miniDoc)
         # logging.debug('added %s to sentence[%d]', repr(document[thisStart][miniDoc]), sentenceNo)
 
-    d.codedSentences = d.sentences.copy()       # Save the coded sentences
+    context.codedSentences = context.sentences.copy()       # Save the coded sentences
 
     # We have all the basic clinical concepts attached to sentences.
     # Now we need to add the higher concepts - or compound concepts - or solution specific concepts
     # Add to the mini-documents in each sentence any sentence implied concepts - word/pattern matching
     # Known compound phrases, or known acronyms that have a specific clinical concept.
-    for sentenceNo, sentence in enumerate(d.sentences):            # Step through all the sentence in order
+    counts = [0, 0]
+    for sentenceNo, sentence in enumerate(context.sentences):            # Step through all the sentence in order
         # Look for sentenceConcepts in this sentence.
         # Scan the original text looking for any words and/or phrases that are commonly used within documents, which have implied MetaThesaurus Concept.
-        for (thisConcept, pattern, thisIsNeg, commonText) in d.sentenceConcepts:        # Check each sentence against all of the sentence concepts
-            # this.logger.debug('looking for %s in sentence[%d] (%s)', str(common), sentenceNo, str(this.sentences[sentenceNo][4]))
-            for match in pattern.finditer(sentence[4]):    # Process each match and add to the higherConcept to the document
-                thisStart = sentence[2] + match.start()
+        # Only the blocks of sentence concepts whose fused gate matches this sentence can be in this sentence
+        sentenceConcepts = [rule for gate, rules in d.fusedSentenceConcepts if (gate is None) or (gate.search(sentence.text) is not None) for rule in rules]
+        lowerText = ch.prefilterText(sentence.text)
+        for (thisConcept, pattern, thisIsNeg, commonText) in sentenceConcepts:        # Check each sentence against all of the sentence concepts
+            if not ch.mayMatch(pattern, lowerText, counts):        # Skip sentence concepts whose literal text is not in this sentence
+                continue
+            # this.logger.debug('looking for %s in sentence[%d] (%s)', str(common), sentenceNo, str(this.sentences[sentenceNo].text))
+            for match in pattern.finditer(sentence.text):    # Process each match and add to the higherConcept to the document
+                thisStart = sentence.start + match.start()
                 # logging.debug('pattern(%s) found at %d', pattern.pattern, thisStart)
                 # Check if this is a historical concept
-                isHistory = sentence[1]
-                if sentence[0]:            # This sentence contains history
+                isHistory = sentence.isHistory
+                if sentence.hasChanges:            # This sentence contains history
                     # Check the history list for this concept
-                    for changeAt in sentence[5]:
-                        if changeAt > thisStart - sentence[2]:    # Next change is after this concept
+                    for changeAt in sentence.changesAt:
+                        if changeAt > thisStart - sentence.start:    # Next change is after this concept
                             break
                         isHistory = not isHistory
 
                 # Check if the sentence concept (text) has been negated
                 # We pass 'isNegated' as 0 so that checkNegation() will check for both negation and ambiguity
                 thisText = match.group()
-                changeIt, reason, prePost =  ch.checkNegation(thisConcept, thisText, thisStart, sentenceNo, 0)
+                changeIt, reason, prePost =  ch.checkNegation(context, thisConcept, thisText, thisStart, sentenceNo, 0)
 
                 # Need to XOR(isNeg, changeIt) as negating a negative is a positive
                 # If the 'concept' has a negated semantic meaning, but those word(s) have been negated
@@ -639,40 +845,34 @@ def complete():
                     thisIsNeg = '1'                    # 'possible flu' versus 'not possible flu' -> not flu
 
                 # Add to min-document
-                document = sentence[6]    # Sentences hold mini-documents
+                document = sentence.document    # Sentences hold mini-documents
                 if thisStart not in document:
                     document[thisStart] = []
                 else:
                     found = False       # Check that we aren't doubling up
                     for miniDoc in document[thisStart]:
-                        if (miniDoc['concept'] == thisConcept) and (miniDoc['negation'] == thisIsNeg):
+                        if (miniDoc.concept == thisConcept) and (miniDoc.negation == thisIsNeg):
                             found = True
                     if found:
                         continue
                 miniDoc = len(document[thisStart])
-                document[thisStart].append({})
-                document[thisStart][miniDoc]['length'] = match.end() - match.start()
-                document[thisStart][miniDoc]['history'] = isHistory
-                document[thisStart][miniDoc]['concept'] = thisConcept
-                document[thisStart][miniDoc]['used'] = False
-                document[thisStart][miniDoc]['text'] = thisText
-                document[thisStart][miniDoc]['partOfSpeech'] = 'NN'
-                document[thisStart][miniDoc]['negation'] = thisIsNeg
 
                 # With a description if we have one
                 if thisConcept in d.solutionMetaThesaurus:
-                    document[thisStart][miniDoc]['description'] = d.solutionMetaThesaurus[thisConcept]['description']
+                    description = d.solutionMetaThesaurus[thisConcept]['description']
                 else:
-                    document[thisStart][miniDoc]['description'] = commonText
+                    description = commonText
+                document[thisStart].append(d.ConceptMention(thisConcept, thisIsNeg, thisText, match.end() - match.start(), isHistory, 'NN', description))
 
                 # Check if we need to modify this concept
-                ch.checkModified(thisConcept, thisIsNeg, sentenceNo, thisStart, miniDoc)
+                ch.checkModified(context, thisConcept, thisIsNeg, sentenceNo, thisStart, miniDoc)
                 logging.info('SentenceConcept(%s) found - adding %s to sentence[%d]', thisConcept, document[thisStart][miniDoc], sentenceNo)
+    ch.addPrefilterStatistics('sentence concepts', counts)
 
     # Now add any solution specific raw concepts to the document
     # Note: We have not yet done negation, so these concepts may get negated, but are candidates for concept sets
     # Note: Must be knownConcepts as we cannot change the configuration at this point
-    d.sc.addRawConcepts()
+    d.sc.addRawConcepts(context)
 
     # At this point all the word based concepts have been added to the mini-documents. Two things remain to complete the process.
     # 1. Do some extension of negation.
@@ -681,65 +881,42 @@ def complete():
     # So we extend negation and then look for concept sets.
 
     # Work through each of the sentences - extending negation
-    for sentenceNo, sentence in enumerate(d.sentences):            # Step through each sentence
+    grossNegations = findGrossNegations(context)
+    for sentenceNo, sentence in enumerate(context.sentences):            # Step through each sentence
         # logging.debug('Extending negation - processing sentence[%d]', sentenceNo)
-        sentenceStart = sentence[2]
-        sentenceLength = sentence[3]
-        document = sentence[6]    # Sentences hold mini-documents
+        sentenceStart = sentence.start
+        sentenceLength = sentence.length
+        document = sentence.document    # Sentences hold mini-documents
 
         # Do some gross negation - look for negations patterns within the text in the sentence
         # Gross negatation patters are a start regular expression and and end regular expression
-        for grossStart, grossEnd, grossRange in d.grossNegation:
-            if sentenceNo + grossRange > len(d.sentences):
-                grossRange = len(d.sentences) - sentenceNo
-            theText = ''
+        for grossStart, grossEnd, grossRange, startAt, endAt in grossNegations.get(sentenceNo, []):
+            # logging.info('Gross negation found - (%s..%s)', grossStart.pattern, grossEnd.pattern)
+            startNegation = sentenceStart + startAt                # Start after the start of gross negation marker
+            endNegation = sentenceStart + endAt                    # And end at the end of gross negation marker
+            # logging.debug('negating from %d to %d', sentenceStart + startNegation, sentenceStart + endNegation)
             for grossSentence in range(sentenceNo, sentenceNo + grossRange):
-                if theText != '':
-                    theText += ' '
-                theText += d.sentences[grossSentence][4]
-            # logging.debug('Looking for gross negation pattern (%s.*%s) in (%s)', grossStart.pattern, grossEnd.pattern, theText)
-            matchStart = grossStart.search(theText)
-            if matchStart is not None:                # Start of gross negation found
-                startNegation = matchStart.end()        # Check after the end of the start of gross negation
-                matchEnd = grossEnd.search(theText[startNegation:])
-                if matchEnd is not None:                # End of gross negation found
-                    # logging.info('Gross negation found - (%s..%s)', grossStart.pattern, grossEnd.pattern)
-                    startNegation += sentenceStart                        # Start after the start of gross negation marker
-                    endNegation = sentenceStart + matchEnd.start()        # And end at the end of gross negation marker
-                    # logging.debug('negating from %d to %d', sentenceStart + startNegation, sentenceStart + endNegation)
-                    for grossSentence in range(sentenceNo, sentenceNo + grossRange):
-                        thisDocument = d.sentences[grossSentence][6]    # Sentences hold mini-documents
-                        for thisStart in sorted(thisDocument, key=int):        # Negate each concept between start and end of gross negation markers
-                            if thisStart < startNegation:
-                                continue
-                            if thisStart > endNegation:
-                                break
-                            for jj, miniDoc in enumerate(thisDocument[thisStart]):
-                                thisConcept = miniDoc['concept']
-                                thisDocument[thisStart][jj]['negation'] = 1        # Negate this concept
-                                logging.info('Negating concept(%s.*%s) [gross negation(%s)] in sentence[%d]',
-                                                 thisConcept, grossStart.pattern, grossEnd.pattern, sentenceNo)
+                thisDocument = context.sentences[grossSentence].document    # Sentences hold mini-documents
+                # Negate each concept between start and end of gross negation markers
+                for thisStart in thisDocument.between(startNegation, endNegation):
+                    for jj, miniDoc in enumerate(thisDocument[thisStart]):
+                        thisConcept = miniDoc.concept
+                        thisDocument[thisStart][jj].negation = 1        # Negate this concept
+                        logging.info('Negating concept(%s.*%s) [gross negation(%s)] in sentence[%d]',
+                                         thisConcept, grossStart.pattern, grossEnd.pattern, sentenceNo)
 
         # Extend negation and ambiguity for mini-document concepts in this sentence up to 'but' or from 'but'
-        butAt = []
-        buts = []
         thisBut = None
-        # Find all the but boundaries in this sentence
-        for butBoundary in d.butBoundaries:
-            # logging.debug('looking for butBoundary (%s)', butBoundary.pattern)
-            match = butBoundary.search(d.sentences[sentenceNo][4])
-            if match is not None:
-                butAt.append(match.start() + d.sentences[sentenceNo][2])
-                # logging.debug('butBoundary found at %d', butAt[-1])
-        if len(butAt) > 0:        # At least one found
-            buts = sorted(butAt)
+        # Get all the but boundaries in this sentence
+        buts = [butAt + context.sentences[sentenceNo].start for butAt in context.sentences[sentenceNo].markers['but']]
+        if len(buts) > 0:        # At least one found
             thisBut = 0
 
         # Let the solution initialze it's own negate code
-        d.sc.initalizeNegation()
+        d.sc.initalizeNegation(context)
 
         lastNegation = None        # Last concept was not negated - because there wasn't one
-        for thisStart in sorted(document, key=int):        # We step through all concepts, in sequence across this sentence
+        for thisStart in document:        # We step through all concepts, in sequence across this sentence
             # Stop extending negation if we are crossing a but boundary
             while (thisBut is not None) and (buts[thisBut] <= thisStart):
                 # logging.debug('Crossing a butBoundary at %d in sentence %d', thisStart, sentenceNo)
@@ -751,30 +928,30 @@ def complete():
 
             thisNegation = None            # Remember the negation of any noun or adjective at this point in the sentence
             for jj, minDoc in enumerate(document[thisStart]):            # Step through the list of alternate concepts at this point in this sentence
-                if thisStart + minDoc['length'] > sentenceStart + sentenceLength:     # Skip concepts that extend beyond the end of this sentence
+                if thisStart + minDoc.length > sentenceStart + sentenceLength:     # Skip concepts that extend beyond the end of this sentence
                     break
 
                 # If this is a noun or adjective, then it is a concept of interest
-                if minDoc['partOfSpeech'] in ['NN', 'NNP', 'NNS', 'NNPS', 'JJ', 'JJR', 'JJT']:
+                if minDoc.partOfSpeech in ['NN', 'NNP', 'NNS', 'NNPS', 'JJ', 'JJR', 'JJT']:
                     # Check if this is a concept is a knownConcept
                     # We do not extend negation to concepts we do not understand
-                    thisConcept = minDoc['concept']
+                    thisConcept = minDoc.concept
                     if thisConcept not in d.knownConcepts:
                         continue
 
                     # If this noun or adjective has been negated or is ambiguous
                     # then this will trigger negation/ambiguity extension for following concepts
-                    if minDoc['negation'] in [1, 2, 3]:
-                        thisNegation = minDoc['negation']
+                    if minDoc.negation in [1, 2, 3]:
+                        thisNegation = minDoc.negation
 
                     # If the last noun or adjective was negated or was ambigous, then extend negation/ambiguity
                     if lastNegation is not None:
-                        logging.info('Extending negation or ambiguity to %s - %s [%d/%d]', thisConcept, document[thisStart][jj]['description'], thisStart, jj)
-                        minDoc['negation'] = lastNegation
+                        logging.info('Extending negation or ambiguity to %s - %s [%d/%d]', thisConcept, document[thisStart][jj].description, thisStart, jj)
+                        minDoc.negation = lastNegation
                         thisNegation = lastNegation        # Continue extending negation
 
             # Check if the solution wants to negate anything at this point in the document, before we update lastNegation
-            d.sc.extendNegation(sentenceNo, thisStart, lastNegation, thisNegation)
+            d.sc.extendNegation(context, sentenceNo, thisStart, lastNegation, thisNegation)
 
             # If we had a negated noun or adjective, then we better extend negation from this point forward
             if thisNegation is not None:
@@ -782,9 +959,9 @@ def complete():
 
 
     # Output the mini-documents to the log if required
-    for sentenceNo, sentence in enumerate(d.sentences):            # Step through each sentence
-        document = sentence[6]    # Sentences hold mini-documents
-        for thisStart in sorted(document, key=int):
+    for sentenceNo, sentence in enumerate(context.sentences):            # Step through each sentence
+        document = sentence.document    # Sentences hold mini-documents
+        for thisStart in document:
             for jj, miniDoc in enumerate(document[thisStart]):
                 # logging.debug('[%d:%d:%d]%s', sentenceNo, thisStart, jj, miniDoc)
                 pass
@@ -794,30 +971,30 @@ def complete():
     # Note: We have done negation extension, but not sentence or document list negation.
     # So these concepts may get negated, if they are in sentence_negation_lists or document_negation_lists, but are candidates for concept sets
     # Note: Must be knownConcepts as we cannot change the configuration at this point
-    d.sc.addSolutionConcepts()
+    d.sc.addSolutionConcepts(context)
 
     # Now check the mini-documents for Document and Sentence Concept sets
 
     # Do any negation lists
-    doNegationLists()
+    doNegationLists(context)
 
     # Check for document and sentence sets in the history
-    ch.checkSets(True)
+    ch.checkSets(context, True)
 
     # Check for document and sentence sets in the non-history
-    ch.checkSets(False)
+    ch.checkSets(context, False)
 
     # Do any negation lists again - in case a sentence set created a negated higher concept which is in a Negation List
-    doNegationLists()
+    doNegationLists(context)
 
     # Now add any final solution specific concepts to the document
     # Note: We have done all negation and concept set checking, so these concepts are not candidates for concept sets
     # Note: Must be knownConcepts as we cannot change the configuration at this point
-    d.sc.addFinalConcepts()
+    d.sc.addFinalConcepts(context)
 
     # Do any solution completion tasks
-    d.sc.complete()
+    d.sc.complete(context)
 
-    d.completedSentences = d.sentences.copy()       # Save the completely coded sentences
+    context.completedSentences = context.sentences.copy()       # Save the completely coded sentences
 
     return (d.EX_OK, 'success')
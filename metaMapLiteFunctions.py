@@ -0,0 +1,526 @@
+'''
+The functions for calling the MetaMapLite Service
+
+The MetaMapLite Service can be provided by one or more MetaMapLite endpoints (host, port and URL).
+Each document is routed to the endpoint with the fewest requests in flight.
+An endpoint that keeps failing is ejected for d.MetaMapLiteEjectTime seconds and then re-admitted.
+Each endpoint is called over a bounded pool of reusable (keep-alive) HTTP connections,
+so that each clinical document doesn't pay the cost of setting up a new TCP connection.
+The number of requests in flight is limited by a semaphore (d.MetaMapLiteConcurrency), which is shared by all the worker processes with --workers.
+Requests over that limit wait in a queue, and the time spent waiting is measured separately from the MetaMapLite service time.
+With d.MetaMapLiteRecordFile every MetaMapLite response is recorded, keyed by the document that was sent,
+so that it can be replayed by replayMetaMapLite.py without a MetaMapLite Server.
+'''
+
+# pylint: disable=invalid-name, line-too-long, broad-exception-caught
+
+import logging
+import json
+import hashlib
+import queue
+import threading
+import time
+from urllib.parse import urlencode
+from http import client
+import data as d
+
+# The exceptions that indicate that a pooled connection had gone stale (the MetaMapLite Service closed it while it was idle)
+staleConnection = (client.RemoteDisconnected, client.CannotSendRequest, client.ImproperConnectionState, BrokenPipeError, ConnectionResetError, ConnectionAbortedError)
+
+# The exceptions that indicate that the MetaMapLite Service request failed
+requestFailed = (client.HTTPException, OSError)
+
+statsLock = threading.Lock()      # A Threading Lock to protect the endpoints, the pool statistics and the concurrency statistics
+recordLock = threading.Lock()     # A Threading Lock to protect the file of recorded MetaMapLite responses
+
+
+def parseEndpoint(endpoint):
+    '''
+    Parse a MetaMapLite endpoint specification (host:port[/URL])
+    Parameters
+        endpoint    - str, the endpoint specification
+    Returns
+        endpoint    - dict, the 'host', 'port' and 'url' of this endpoint, or None if the specification is invalid
+    '''
+
+    url = d.MetaMapLiteURL
+    slash = endpoint.find('/')
+    if slash != -1:
+        url = endpoint[slash:]
+        endpoint = endpoint[:slash]
+    host, colon, port = endpoint.rpartition(':')
+    if (colon == '') or (host == '') or not port.isdigit():
+        return None
+    return {'host':host, 'port':port, 'url':url}
+
+
+def openPool():
+    '''
+    Create a pool of reusable connections for each MetaMapLite endpoint, and the limit on requests in flight,
+    and zero the pool and concurrency statistics.
+    Each pool holds d.MetaMapLitePoolSize slots. An empty slot (None) means a new connection can be created.
+    Parameters
+        None
+    Returns
+        Nothing
+    '''
+
+    for endpoint in d.MetaMapLiteEndpoints:
+        endpoint['pool'] = queue.LifoQueue(maxsize=d.MetaMapLitePoolSize)
+        for i in range(d.MetaMapLitePoolSize):
+            endpoint['pool'].put(None)
+        endpoint['inFlight'] = 0            # The number of requests in flight to this endpoint
+        endpoint['requests'] = 0            # The number of requests sent to this endpoint
+        endpoint['failures'] = 0            # The number of consecutive failed requests to this endpoint
+        endpoint['ejections'] = 0           # The number of times this endpoint has been ejected
+        endpoint['ejectedUntil'] = None     # When this ejected endpoint can be re-admitted (None if not ejected)
+    d.MetaMapLitePoolStats = {'requests':0, 'hits':0, 'newConnections':0, 'reconnects':0, 'waitTime':0.0}
+    d.MetaMapLiteLimiter = threading.BoundedSemaphore(d.MetaMapLiteConcurrency)
+    d.MetaMapLiteLimiterStats = {'requests':0, 'waiting':0, 'maxWaiting':0, 'inFlight':0, 'maxInFlight':0, 'queueWait':0.0, 'serviceTime':0.0}
+    return
+
+
+def closePool():
+    '''
+    Close all the idle connections in the pools of connections to the MetaMapLite endpoints
+    Parameters
+        None
+    Returns
+        Nothing
+    '''
+
+    for endpoint in d.MetaMapLiteEndpoints:
+        if endpoint.get('pool') is None:
+            continue
+        while True:
+            try:
+                connection = endpoint['pool'].get_nowait()
+            except queue.Empty:
+                break
+            if connection is not None:
+                connection.close()
+        endpoint['pool'] = None
+    return
+
+
+def addStats(**counts):
+    '''
+    Add to the pool statistics
+    Parameters
+        counts - keyword arguments, the amount to add to each named statistic
+    Returns
+        Nothing
+    '''
+
+    with statsLock:
+        for stat, count in counts.items():
+            d.MetaMapLitePoolStats[stat] += count
+    return
+
+
+def shareLimiter(limiter, flight):
+    '''
+    Use a limit on requests in flight that is shared by all the worker processes (--workers), instead of this process's own limit
+    Parameters
+        limiter - multiprocessing.BoundedSemaphore, the limit on requests in flight, across all the worker processes
+        flight  - multiprocessing.Array, the requests in flight and waiting across all the worker processes (see d.MetaMapLiteFlight)
+    Returns
+        Nothing
+    '''
+
+    d.MetaMapLiteLimiter = limiter
+    d.MetaMapLiteFlight = flight
+    return
+
+
+def countFlight(inFlight, waiting):
+    '''
+    Count the requests in flight and waiting across all the worker processes, and their maxima (only with --workers)
+    Parameters
+        inFlight    - int, the change in the number of requests in flight
+        waiting     - int, the change in the number of requests waiting
+    Returns
+        Nothing
+    '''
+
+    flight = d.MetaMapLiteFlight
+    if flight is None:
+        return
+    with flight.get_lock():
+        flight[0] += inFlight
+        flight[1] = max(flight[1], flight[0])
+        flight[2] += waiting
+        flight[3] = max(flight[3], flight[2])
+    return
+
+
+def acquireService():
+    '''
+    Wait, in the queue, until the number of requests in flight to the MetaMapLite Service is below the limit
+    Parameters
+        None
+    Returns
+        queueWait   - float, the seconds spent waiting in the queue
+    '''
+
+    stats = d.MetaMapLiteLimiterStats
+    queueWait = 0.0
+    if not d.MetaMapLiteLimiter.acquire(False):          # Don't block (threading and multiprocessing semaphores name this argument differently)
+        # At the limit of requests in flight - join the queue
+        with statsLock:
+            stats['waiting'] += 1
+            stats['maxWaiting'] = max(stats['maxWaiting'], stats['waiting'])
+        countFlight(0, 1)
+        waitStart = time.perf_counter()
+        d.MetaMapLiteLimiter.acquire()
+        queueWait = time.perf_counter() - waitStart
+        with statsLock:
+            stats['waiting'] -= 1
+        countFlight(0, -1)
+    countFlight(1, 0)
+    with statsLock:
+        stats['requests'] += 1
+        stats['inFlight'] += 1
+        stats['maxInFlight'] = max(stats['maxInFlight'], stats['inFlight'])
+        stats['queueWait'] += queueWait
+    return queueWait
+
+
+def releaseService(serviceTime):
+    '''
+    Release this request's place in the limit of requests in flight to the MetaMapLite Service
+    Parameters
+        serviceTime - float, the seconds the MetaMapLite Service took to service this request
+    Returns
+        Nothing
+    '''
+
+    with statsLock:
+        d.MetaMapLiteLimiterStats['inFlight'] -= 1
+        d.MetaMapLiteLimiterStats['serviceTime'] += serviceTime
+    countFlight(-1, 0)
+    d.MetaMapLiteLimiter.release()
+    return
+
+
+def limiterStatistics():
+    '''
+    Return a copy of the concurrency statistics
+    Parameters
+        None
+    Returns
+        stats - dict, requests, waiting, maxWaiting, inFlight, maxInFlight, queueWait (seconds in the queue) and serviceTime (seconds in the MetaMapLite Service)
+    '''
+
+    with statsLock:
+        stats = dict(d.MetaMapLiteLimiterStats)
+    if d.MetaMapLiteFlight is not None:     # The maxima across all the worker processes
+        with d.MetaMapLiteFlight.get_lock():
+            stats['maxInFlight'] = d.MetaMapLiteFlight[1]
+            stats['maxWaiting'] = d.MetaMapLiteFlight[3]
+    return stats
+
+
+def poolStatistics():
+    '''
+    Return a copy of the pool statistics
+    Parameters
+        None
+    Returns
+        stats - dict, requests, hits (reused connections), newConnections, reconnects (stale connections replaced) and waitTime (seconds waiting for a connection)
+    '''
+
+    with statsLock:
+        return dict(d.MetaMapLitePoolStats)
+
+
+def endpointStatistics():
+    '''
+    Return a copy of the endpoint statistics
+    Parameters
+        None
+    Returns
+        stats - list, the requests, failures (consecutive) and ejections of each endpoint (in the order of d.MetaMapLiteEndpoints)
+    '''
+
+    with statsLock:
+        return [{'requests':endpoint['requests'], 'failures':endpoint['failures'], 'ejections':endpoint['ejections']} for endpoint in d.MetaMapLiteEndpoints]
+
+
+def mergeStatistics(poolStats, limiterStats, endpointStats):
+    '''
+    Add the pool, concurrency and endpoint statistics from a worker process to these statistics
+    Parameters
+        poolStats       - dict, the worker's pool statistics (from poolStatistics())
+        limiterStats    - dict, the worker's concurrency statistics (from limiterStatistics())
+        endpointStats   - list, the worker's endpoint statistics (from endpointStatistics())
+    Returns
+        Nothing
+    '''
+
+    with statsLock:
+        for stat, count in poolStats.items():
+            d.MetaMapLitePoolStats[stat] += count
+        for stat, count in limiterStats.items():
+            if stat in ['maxWaiting', 'maxInFlight']:       # The maxima across all the worker processes are counted in d.MetaMapLiteFlight
+                continue
+            d.MetaMapLiteLimiterStats[stat] += count
+        for endpoint, stats in zip(d.MetaMapLiteEndpoints, endpointStats):
+            endpoint['requests'] += stats['requests']
+            endpoint['failures'] = max(endpoint['failures'], stats['failures'])
+            endpoint['ejections'] += stats['ejections']
+    return
+
+
+def logStatistics():
+    '''
+    Log the pool, concurrency and endpoint statistics
+    Parameters
+        None
+    Returns
+        Nothing
+    '''
+
+    stats = poolStatistics()
+    logging.info('MetaMapLite connection pool: requests(%d), hits(%d), new connections(%d), reconnects(%d), wait time(%.3f seconds)',
+                 stats['requests'], stats['hits'], stats['newConnections'], stats['reconnects'], stats['waitTime'])
+    stats = limiterStatistics()
+    requests = max(stats['requests'], 1)
+    logging.info('MetaMapLite concurrency: limit(%d), requests(%d), max in flight(%d), max waiting(%d), queue wait(%.3f seconds, average %.3f), service time(%.3f seconds, average %.3f)',
+                 d.MetaMapLiteConcurrency, stats['requests'], stats['maxInFlight'], stats['maxWaiting'],
+                 stats['queueWait'], stats['queueWait'] / requests, stats['serviceTime'], stats['serviceTime'] / requests)
+    with statsLock:
+        for endpoint in d.MetaMapLiteEndpoints:
+            logging.info('MetaMapLite endpoint %s:%s%s: requests(%d), consecutive failures(%d), ejections(%d)',
+                         endpoint['host'], endpoint['port'], endpoint['url'], endpoint['requests'], endpoint['failures'], endpoint['ejections'])
+    return
+
+
+def chooseEndpoint(tried):
+    '''
+    Choose the MetaMapLite endpoint with the fewest requests in flight.
+    Ejected endpoints are only chosen when every untried endpoint is ejected, and then the one due for re-admission first is chosen.
+    Parameters
+        tried       - list, the endpoints already tried for this document
+    Returns
+        endpoint    - dict, the chosen endpoint, or None if every endpoint has been tried
+    '''
+
+    with statsLock:
+        now = time.monotonic()
+        healthy = []
+        ejected = []
+        for endpoint in d.MetaMapLiteEndpoints:
+            if endpoint in tried:
+                continue
+            if (endpoint['ejectedUntil'] is None) or (endpoint['ejectedUntil'] <= now):
+                healthy.append(endpoint)
+            else:
+                ejected.append(endpoint)
+        if len(healthy) > 0:
+            endpoint = min(healthy, key=lambda thisEndpoint: (thisEndpoint['inFlight'], thisEndpoint['requests']))
+        elif len(ejected) > 0:
+            endpoint = min(ejected, key=lambda thisEndpoint: thisEndpoint['ejectedUntil'])
+        else:
+            return None
+        endpoint['inFlight'] += 1
+        endpoint['requests'] += 1
+    return endpoint
+
+
+def endpointDone(endpoint, isHealthy):
+    '''
+    Record the outcome of a request to a MetaMapLite endpoint, ejecting the endpoint if it has failed too many times in a row
+    Parameters
+        endpoint    - dict, the endpoint
+        isHealthy   - boolean, True if the endpoint serviced the request
+    Returns
+        Nothing
+    '''
+
+    with statsLock:
+        endpoint['inFlight'] -= 1
+        if isHealthy:
+            if endpoint['ejectedUntil'] is not None:
+                logging.info('MetaMapLite endpoint %s:%s%s re-admitted', endpoint['host'], endpoint['port'], endpoint['url'])
+            endpoint['failures'] = 0
+            endpoint['ejectedUntil'] = None
+            return
+        endpoint['failures'] += 1
+        if endpoint['failures'] >= d.MetaMapLiteMaxFailures:
+            logging.warning('MetaMapLite endpoint %s:%s%s ejected for %d seconds after %d consecutive failures',
+                            endpoint['host'], endpoint['port'], endpoint['url'], d.MetaMapLiteEjectTime, endpoint['failures'])
+            endpoint['ejectedUntil'] = time.monotonic() + d.MetaMapLiteEjectTime
+            endpoint['ejections'] += 1
+    return
+
+
+def getConnection(endpoint):
+    '''
+    Get a connection to a MetaMapLite endpoint from its pool, waiting if all the connections are in use
+    Parameters
+        endpoint    - dict, the endpoint
+    Returns
+        connection  - http.client.HTTPConnection, the connection to use
+        isReused    - boolean, True if this connection came from the pool and may have gone stale
+    '''
+
+    waitStart = time.perf_counter()
+    connection = endpoint['pool'].get()
+    waitTime = time.perf_counter() - waitStart
+    if connection is None:
+        addStats(newConnections=1, waitTime=waitTime)
+        return (client.HTTPConnection(endpoint['host'], endpoint['port']), False)
+    addStats(hits=1, waitTime=waitTime)
+    return (connection, True)
+
+
+def releaseConnection(endpoint, connection, isReusable):
+    '''
+    Return a connection to its endpoint's pool. Connections that can't be reused are closed and their slot is freed.
+    Parameters
+        endpoint    - dict, the endpoint
+        connection  - http.client.HTTPConnection, the connection being returned
+        isReusable  - boolean, True if the connection can be kept alive for the next request
+    Returns
+        Nothing
+    '''
+
+    if isReusable:
+        endpoint['pool'].put(connection)
+    else:
+        connection.close()
+        endpoint['pool'].put(None)
+    return
+
+
+def postDocument(endpoint, connection, params):
+    '''
+    POST a document to a MetaMapLite endpoint, over this connection, and read the whole response
+    Parameters
+        endpoint    - dict, the endpoint
+        connection  - http.client.HTTPConnection, the connection to use
+        params      - str, the url encoded document
+    Returns
+        status      - int, the HTTP status of the response
+        data        - bytes, the body of the response
+        willClose   - boolean, True if the MetaMapLite Service will close this connection
+    '''
+
+    connection.request('POST', endpoint['url'], params, d.MetaMapLiteHeaders)
+    response = connection.getresponse()
+    responseData = response.read()        # Always read the whole response so that the connection can be reused
+    return (response.status, responseData, response.will_close)
+
+
+def callEndpoint(endpoint, params):
+    '''
+    Send a document to one MetaMapLite endpoint.
+    If a pooled connection has gone stale, then it is transparently replaced by a new connection and the request retried.
+    Parameters
+        endpoint    - dict, the endpoint
+        params      - str, the url encoded document
+    Returns
+        status      - int, the HTTP status of the response, or None if the request failed
+        data        - bytes, the body of the response, or str, the reason the request failed
+    '''
+
+    addStats(requests=1)
+    connection, isReused = getConnection(endpoint)
+    try:
+        try:
+            status, responseData, willClose = postDocument(endpoint, connection, params)
+        except staleConnection as thisE:
+            if not isReused:
+                raise
+            # The MetaMapLite Service closed this idle connection - reconnect and try again
+            logging.info('Stale MetaMapLite connection (%s) - reconnecting', repr(thisE))
+            connection.close()
+            addStats(reconnects=1)
+            connection = client.HTTPConnection(endpoint['host'], endpoint['port'])
+            status, responseData, willClose = postDocument(endpoint, connection, params)
+    except requestFailed as thisE:
+        releaseConnection(endpoint, connection, False)
+        return (None, repr(thisE))
+    releaseConnection(endpoint, connection, not willClose)
+    return (status, responseData)
+
+
+def recordKey(document):
+    '''
+    Compute the key of a recorded MetaMapLite response
+    Parameters
+        document    - str, the document sent to the MetaMapLite Service
+    Returns
+        key         - str, the SHA-256 hash of the document
+    '''
+
+    return hashlib.sha256(document.encode('utf-8')).hexdigest()
+
+
+def recordResponse(document, responseData):
+    '''
+    Append a MetaMapLite response to the file of recorded MetaMapLite responses (one JSON object per line)
+    Parameters
+        document        - str, the document sent to the MetaMapLite Service
+        responseData    - bytes, the MetaMapLite response
+    Returns
+        Nothing
+    '''
+
+    record = json.dumps({'key':recordKey(document), 'response':responseData.decode('utf-8')}) + '\n'
+    with recordLock:
+        try:
+            # One write per record, so that concurrent AutoCoding processes can share the file
+            with open(d.MetaMapLiteRecordFile, 'at', encoding='utf-8', newline='') as recordFile:
+                recordFile.write(record)
+        except OSError as e:
+            logging.warning('Cannot record MetaMapLite response in (%s) - error(%s)', d.MetaMapLiteRecordFile, repr(e))
+    return
+
+
+def callMetaMapLite(document):
+    '''
+    Call the MetaMapLite Service to code this document, waiting if the limit of requests in flight has been reached.
+    The document is sent to the endpoint with the fewest requests in flight.
+    If that endpoint fails then the document is sent to the next best endpoint, until every endpoint has been tried.
+    Parameters
+        document    - str, the prepared clinical document
+    Returns
+        success     - int, d.EX_OK if the MetaMapLite Service returned a response, otherwise d.EX_SOFTWARE
+        data        - bytes, the MetaMapLite response, or str, the reason for failure
+    '''
+
+    # Set up the parameter (the document)
+    params = urlencode({'document':document})
+    acquireService()
+    serviceStart = time.perf_counter()
+    try:
+        tried = []
+        reason = 'No MetaMapLite endpoints'
+        while True:
+            endpoint = chooseEndpoint(tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            status, responseData = callEndpoint(endpoint, params)
+            if status is None:
+                endpointDone(endpoint, False)
+                logging.critical('MetaMapLite Service request error on %s:%s%s:(%s)', endpoint['host'], endpoint['port'], endpoint['url'], responseData)
+                reason = f'MetaMapLite Service request error:({responseData})'
+                continue
+            if status >= 500:
+                endpointDone(endpoint, False)
+                logging.critical('Invalid response from MetaMapLite Service on %s:%s%s:error %s', endpoint['host'], endpoint['port'], endpoint['url'], status)
+                reason = f'Invalid response from MetaMapLite Service:({repr(status)})'
+                continue
+            endpointDone(endpoint, True)
+            if status != 200:       # The endpoint is fine, but it didn't like this document
+                logging.critical('Invalid response from MetaMapLite Service:error %s', status)
+                return (d.EX_SOFTWARE, f'Invalid response from MetaMapLite Service:({repr(status)})')
+            if d.MetaMapLiteRecordFile is not None:
+                recordResponse(document, responseData)
+            return (d.EX_OK, responseData)
+    finally:
+        releaseService(time.perf_counter() - serviceStart)
+    return (d.EX_SOFTWARE, reason)
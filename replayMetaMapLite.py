@@ -0,0 +1,186 @@
+# pylint: disable=line-too-long, broad-exception-caught, invalid-name
+'''
+Script replayMetaMapLite.py
+A stand-in for the MetaMapLite Server, which replays MetaMapLite responses recorded by AutoCoding.py (--MetaMapLiteRecord).
+
+This script accepts the same requests as the AutoCoding.war servlet (MetaMap.doPost) - a url encoded form, with the clinical document
+in the 'document' parameter, POSTed to the MetaMapLite URL - and returns the recorded MetaMapLite response for that document.
+This means that AutoCoding.py can be run, and benchmarked, without a Tomcat server or the UMLS index.
+An artificial latency can be added to every response, so that AutoCoding throughput can be measured reproducibly.
+
+
+    SYNOPSIS
+    $ python replayMetaMapLite.py -R recordFile|--recordFile=recordFile
+        [-p port|--port=port]
+        [-U URL|--MetaMapLiteURL=URL]
+        [--latency=milliseconds]
+        [-v loggingLevel|--verbose=logingLevel]
+        [-L logDir|--logDir=logDir]
+        [-l logfile|--logfile=logfile]
+
+
+    REQUIRED
+    -R recordFile|--recordFile=recordFile
+    The file of MetaMapLite responses recorded by AutoCoding.py (--MetaMapLiteRecord=recordFile).
+    The option can be repeated to replay several recordings.
+
+
+    OPTIONS
+    -p port|--port=port
+    The port for this stand-in MetaMapLite service (default="8080")
+
+    -U URL|--MetaMapLiteURL=URL
+    The URL for this stand-in MetaMapLite service (default="/AutoCoding/MetaMapLite")
+
+    --latency=milliseconds
+    The artificial delay added to every MetaMapLite response (default=0)
+
+    -v loggingLevel|--verbose=loggingLevel
+    Set the level of logging that you want.
+
+    -L logDir|--logDir=logDir
+    The directory where the log file will be created (default=".").
+
+    -l logfile|--logfile=logfile
+    The name of a log file where you want all messages captured.
+'''
+
+import os
+import sys
+import argparse
+import logging
+import json
+import time
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import metaMapLiteFunctions as mm
+import data as d
+
+
+recordings = {}         # The recorded MetaMapLite responses, keyed by the hash of the document
+latency = 0.0           # The artificial delay (in seconds) added to every response
+replayURL = None        # The URL of this stand-in MetaMapLite service
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    '''
+    Replay the recorded MetaMapLite response for each POSTed document
+    '''
+
+    protocol_version = 'HTTP/1.1'       # Keep connections alive, like Tomcat
+
+    def do_POST(self):
+        '''
+        Return the recorded MetaMapLite response for the document in this request
+        '''
+
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        if self.path != replayURL:
+            self.send_error(404, 'Not found')
+            return
+        params = parse_qs(body, keep_blank_values=True)
+        if 'document' not in params:
+            self.send_error(400, 'Missing a document')
+            return
+        document = params['document'][0]
+        if document.strip() == '':
+            self.send_error(400, 'Empty document')
+            return
+        key = mm.recordKey(document)
+        if key not in recordings:
+            logging.warning('No recorded MetaMapLite response for document(%s)', key)
+            self.send_error(500, 'Internal server error (no recorded response)')
+            return
+        if latency > 0:
+            time.sleep(latency)
+        responseData = recordings[key]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/json')
+        self.send_header('Content-Length', str(len(responseData)))
+        self.end_headers()
+        self.wfile.write(responseData)
+        return
+
+    def log_message(self, format, *args):       # pylint: disable=redefined-builtin
+        '''
+        Send the request log to the logging module
+        '''
+
+        logging.debug('%s - %s', self.address_string(), format % args)
+        return
+
+
+if __name__ == '__main__':
+    '''
+    The main code
+    Start by parsing the command line arguements and setting up logging.
+    Then read the recorded MetaMapLite responses and serve them.
+    '''
+
+    # Set the command line options
+    parser = argparse.ArgumentParser(description='Replay recorded MetaMapLite responses')
+    parser.add_argument('-R', '--recordFile', dest='recordFiles', action='append', required=True, metavar='recordFile',
+                        help='The file of MetaMapLite responses recorded by AutoCoding.py (may be repeated)')
+    parser.add_argument('-p', '--port', dest='port', type=int, default=8080,
+                        help='The port for this stand-in MetaMapLite service (default=8080)')
+    parser.add_argument('-U', '--MetaMapLiteURL', dest='MetaMapLiteURL', default='/AutoCoding/MetaMapLite',
+                        help='The URL for this stand-in MetaMapLite service (default="/AutoCoding/MetaMapLite")')
+    parser.add_argument('--latency', dest='latency', type=int, default=0, metavar='milliseconds',
+                        help='The artificial delay added to every MetaMapLite response (default=0)')
+    parser.add_argument ('-v', '--verbose', dest='verbose', type=int, choices=range(0,5),
+                         help='The level of logging\n\t0=CRITICAL,1=ERROR,2=WARNING,3=INFO,4=DEBUG')
+    parser.add_argument ('-L', '--logDir', dest='logDir', default='.', metavar='logDir',
+                         help='The name of the directory where the logging file will be created')
+    parser.add_argument ('-l', '--logFile', dest='logFile', metavar='logfile', help='The name of a logging file')
+
+    # Parse the command line
+    args = parser.parse_args()
+    replayURL = args.MetaMapLiteURL
+    latency = args.latency / 1000.0
+
+    # Set up logging
+    logging_levels = {0:logging.CRITICAL, 1:logging.ERROR, 2:logging.WARNING, 3:logging.INFO, 4:logging.DEBUG}
+    logfmt = 'replayMetaMapLite [%(asctime)s]: %(message)s'
+    loggingLevel = logging.WARNING
+    if args.verbose is not None:
+        loggingLevel = logging_levels[args.verbose]
+    if args.logFile is not None:
+        logging.basicConfig(format=logfmt, datefmt='%d/%m/%y %H:%M:%S %p', level=loggingLevel, filename=os.path.join(args.logDir, args.logFile), filemode='w')
+    else:
+        logging.basicConfig(format=logfmt, datefmt='%d/%m/%y %H:%M:%S %p', level=loggingLevel)
+
+    # Read the recorded MetaMapLite responses (later recordings replace earlier recordings of the same document)
+    for recordFile in args.recordFiles:
+        try:
+            with open(recordFile, 'rt', encoding='utf-8', newline='') as fp:
+                for lineNo, line in enumerate(fp):
+                    if line.strip() == '':
+                        continue
+                    try:
+                        record = json.loads(line)
+                        recordings[record['key']] = record['response'].encode('utf-8')
+                    except (ValueError, KeyError, AttributeError) as e:
+                        logging.warning('Invalid recording at line %d in (%s) - error(%s)', lineNo + 1, recordFile, repr(e))
+        except OSError as e:
+            logging.critical('Cannot read recorded MetaMapLite responses from (%s) - error(%s)', recordFile, repr(e))
+            logging.shutdown()
+            sys.exit(d.EX_NOINPUT)
+    logging.info('%d recorded MetaMapLite responses', len(recordings))
+
+    # Serve the recorded MetaMapLite responses
+    try:
+        server = ThreadingHTTPServer(('', args.port), ReplayHandler)
+    except OSError as e:
+        logging.critical('Cannot listen on port (%d) - error(%s)', args.port, repr(e))
+        logging.shutdown()
+        sys.exit(d.EX_UNAVAILABLE)
+    server.daemon_threads = True
+    logging.info('Replaying MetaMapLite responses on port %d at %s', args.port, replayURL)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    logging.shutdown()
+    sys.exit(d.EX_OK)
@@ -0,0 +1,509 @@
+'''
+The functions for loading a solution
+
+A solution is a folder (solutions/<solution>) of Excel workbooks and Python modules.
+loadSolution() checks the solution, imports the solution specific modules and loads and compiles the configuration data.
+It is called once by AutoCoding.py, and once by each worker process when AutoCoding in parallel (--workers).
+
+Loading the Excel workbooks, and compiling all the regular expressions, is slow. So compileSolution.py saves the loaded
+solution configuration data as a compiled solution bundle (a pickle), which AutoCoding.py can load (--solutionBundle)
+without openpyxl or pandas. Each bundle records the bundle format version and a fingerprint of the solution files,
+so a bundle that is out of date with the solution folder is rejected.
+'''
+
+# pylint: disable=invalid-name, line-too-long, broad-exception-caught, import-outside-toplevel
+
+import os
+import sys
+import logging
+import importlib
+import re
+import types
+import pickle
+import hashlib
+import excelFunctions as excel
+import data as d
+
+bundleVersion = 7       # The compiled solution bundle format - change this whenever the solution configuration data changes shape
+
+# The solution configuration data, in data.py, that is saved in a compiled solution bundle
+bundleData = ['solutionMetaThesaurus', 'labels', 'terms', 'fusedTerms', 'preambleMarkers', 'preambleTerms', 'fusedPreambleTerms',
+              'knownConcepts', 'historyMarkers', 'preHistory', 'sectionMarkers', 'equivalents', 'butBoundaries', 'sentenceMarkers',
+              'preNegation', 'immediatePreNegation', 'postNegation', 'immediatePostNegation', 'preAmbiguous', 'immediatePreAmbiguous',
+              'postAmbiguous', 'immediatePostAmbiguous', 'preModifiers', 'postModifiers',
+              'sentenceConcepts', 'fusedSentenceConcepts', 'grossNegation', 'sentenceNegationLists', 'documentNegationLists', 'sentenceConceptSequenceSets',
+              'sentenceConceptSets', 'documentConceptSequenceSets', 'documentConceptSets', 'conceptSetIndex', 'fusedMarkers', 'otherConcepts',
+              'requiredLiterals']
+
+# The functions that each solution specific module must have
+prepareFunctions = ['configure', 'solutionCleanDocument', 'solutionCheckPreamble', 'solutionCheckNotPreamble']
+completeFunctions = ['configure', 'requireConcept', 'solutionCheckHistory', 'addRawConcepts', 'initalizeNegation',
+                     'extendNegation', 'higherConceptFound', 'setConcept', 'solutionAddAdditionalConcept', 'addFinalConcepts', 'complete']
+analyzeFunctions = ['configure', 'analyze']
+
+# The kinds of concept sets, in data.py, that are indexed by concept
+conceptSetNames = ['sentenceConceptSequenceSets', 'sentenceConceptSets', 'documentConceptSequenceSets', 'documentConceptSets']
+
+# Fused gates
+ruleBlockSize = 6           # The number of rules behind each fused gate
+unfusable = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')     # Back references and conditionals - group numbers change when terms are fused
+
+
+def fuseGate(patterns):
+    '''
+    Compile the alternation of some regular expressions - a gate which matches somewhere if, and only if, one of them matches somewhere
+    Parameters
+        patterns    - list, compiled regular expressions
+    Returns
+        gate        - compiled regular expression, or None if these regular expressions cannot be fused (so they must always be used)
+    '''
+
+    if len(patterns) == 0:
+        return None
+    flags = patterns[0].flags
+    alternatives = []
+    for pattern in patterns:
+        if pattern.flags != flags:
+            return None
+        if unfusable.search(pattern.pattern) is not None:
+            return None
+        alternatives.append('(?:' + pattern.pattern + ')')
+    try:
+        return re.compile('|'.join(alternatives), flags=flags)
+    except re.error:        # Inline flags, repeated group names etc.
+        return None
+
+
+def fuseRules(rules, column):
+    '''
+    Compile a list of rules (such as terms) into blocks of rules, each with a fused gate, so that a whole block of rules,
+    none of which match some text, is skipped in a single regular expression pass.
+    The rules in the other blocks are still used in order, so the result is exactly the same as using every rule.
+    Small blocks work best - the Python re module searches a long alternation much more slowly than its separate regular expressions.
+    Parameters
+        rules       - list, tuples with a compiled regular expression in column, in the order in which they are used
+        column      - int, the column of each rule holding the compiled regular expression
+    Returns
+        fusedRules  - list, (gate, rules) tuples, one for each block of rules
+    '''
+
+    fusedRules = []
+    for start in range(0, len(rules), ruleBlockSize):
+        block = rules[start:start + ruleBlockSize]
+        fusedRules.append((fuseGate([rule[column] for rule in block]), block))
+    return fusedRules
+
+
+def fuseMarkers(markers):
+    '''
+    Compile a list of markers into fused gates - one for each set of regular expression flags - so that the first place where any of the markers matches
+    is found with one regular expression pass for each gate, rather than searching for every marker
+    Parameters
+        markers     - list, compiled regular expressions
+    Returns
+        gates       - list, the fused gates, or None if these markers cannot be fused (so every marker must be searched for)
+    '''
+
+    markersByFlags = {}
+    for marker in markers:
+        if marker.flags not in markersByFlags:
+            markersByFlags[marker.flags] = [marker]
+        else:
+            markersByFlags[marker.flags].append(marker)
+    gates = []
+    for sameFlags in markersByFlags.values():
+        gate = fuseGate(sameFlags)
+        if gate is None:
+            return None
+        gates.append(gate)
+    return gates
+
+
+def fuseMarkerFamilies():
+    '''
+    Fuse each family of history, preamble and section markers
+    Parameters
+        None
+    Returns
+        fusedMarkers    - dict, for each family of markers, the markers (in order) and their fused gates (from fuseMarkers())
+    '''
+
+    families = {}
+    families['historyStart'] = [marker for marker, isStart in d.historyMarkers if isStart]
+    families['historyEnd'] = [marker for marker, isStart in d.historyMarkers if not isStart]
+    families['preHistory'] = list(d.preHistory)
+    families['preambleStart'] = [marker for marker, isStart in d.preambleMarkers if isStart]
+    families['preambleEnd'] = [marker for marker, isStart in d.preambleMarkers if not isStart]
+    families['section'] = [marker[0] for marker in d.sectionMarkers]
+    fusedMarkers = {}
+    for family, markers in families.items():
+        fusedMarkers[family] = (markers, fuseMarkers(markers))
+    return fusedMarkers
+
+
+def indexConceptSets():
+    '''
+    Build the inverted index from each concept to the concept sets that contain it, for each kind of concept set.
+    A concept sequence set can't be started without its first concept, so only the first concept of each sequence set is indexed
+    Parameters
+        None
+    Returns
+        conceptSetIndex - dict, for each kind of concept set, a dictionary of concept to the list of the numbers of the sets containing that concept
+    '''
+
+    conceptSetIndex = {}
+    for setsName in conceptSetNames:
+        conceptSetIndex[setsName] = {}
+        for setNo, conceptSet in enumerate(getattr(d, setsName)):
+            thisSet = conceptSet[1]
+            if setsName in ['sentenceConceptSequenceSets', 'documentConceptSequenceSets']:
+                thisSet = thisSet[:1]
+            for concept, isNeg in thisSet:
+                if concept not in conceptSetIndex[setsName]:
+                    conceptSetIndex[setsName][concept] = [setNo]
+                elif conceptSetIndex[setsName][concept][-1] != setNo:
+                    conceptSetIndex[setsName][concept].append(setNo)
+    return conceptSetIndex
+
+
+def importSolutionModule(moduleName, requiredFunctions):
+    '''
+    Import a solution specific module and check that it has all the required functions
+    Parameters
+        moduleName          - str, the name of the module (solutionData, prepare, complete or analyze)
+        requiredFunctions   - list, the names of the functions that this module must have
+    Returns
+        module              - the imported module
+    '''
+
+    try:
+        module = importlib.import_module('solutions.' + d.solution + '.' + moduleName)
+    except Exception as e:
+        logging.fatal('Cannot import "%s.py" for solution "%s"', moduleName, d.solution)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+    for requiredFunction in requiredFunctions:
+        if not hasattr(module, requiredFunction):
+            logging.fatal('"%s" module in solution "%s" is missing the "%s" function', moduleName, d.solution, requiredFunction)
+            logging.shutdown()
+            sys.exit(d.EX_CONFIG)
+    return module
+
+
+def reportFunctions(isFlask):
+    '''
+    The report functions that the solution specific analyze module must have
+    Parameters
+        isFlask - Boolean, True if the calling application is a Flask application
+    Returns
+        list    - the names of the report functions
+    '''
+
+    if isFlask:
+        return ['reportHTML', 'reportJSON']
+    return ['reportFile']
+
+
+def loadSolution(isFlask):
+    '''
+    Check the solution files, import the solution specific modules and load the solution configuration data
+    Parameters
+        isFlask - Boolean, True if the calling application is a Flask application
+    Returns
+        Nothing
+    '''
+
+    # Start from the compiled solution bundle, if there is one
+    if d.solutionBundle is not None:
+        loadBundle(isFlask)
+        return
+
+    from openpyxl import load_workbook
+
+    # Check that the solution files all exist and appear correct.
+    if not os.path.isdir(os.path.join('solutions', d.solution)):
+        logging.critical('No solution folder named "%s"', d.solution)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+    if not os.path.isfile(os.path.join('solutions', d.solution, 'solutionData.py')):
+        logging.critical('No solution file "solutionData.py" in solution folder "%s"', d.solution)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+    if not os.path.isfile(os.path.join('solutions', d.solution, 'prepare.py')):
+        logging.critical('No solution file "prepare.py" in solution folder "%s"', d.solution)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+    if not os.path.isfile(os.path.join('solutions', d.solution, 'prepare.xlsx')):
+        logging.critical('No solution file "prepare.xlsx" in solution folder "%s"', d.solution)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+    if not os.path.isfile(os.path.join('solutions', d.solution, 'complete.py')):
+        logging.critical('No solution file "complete.py" in solution folder "%s"', d.solution)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+    if not os.path.isfile(os.path.join('solutions', d.solution, 'complete.xlsx')):
+        logging.critical('No solution file "complete.xlsx" in solution folder "%s"', d.solution)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+    if not os.path.isfile(os.path.join('solutions', d.solution, 'analyze.py')):
+        logging.critical('No solution file "analyze.py" in solution folder "%s"', d.solution)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+    if not os.path.isfile(os.path.join('solutions', d.solution, 'analyze.xlsx')):
+        logging.critical('No solution file "analyze.xlsx" in solution folder "%s"', d.solution)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+    if not os.path.isfile(os.path.join('solutions', d.solution, 'Solution MetaThesaurus.xlsx')):
+        logging.critical('No solution file "Solution MetaThesaurus.xlsx" in solution folder "%s"', d.solution)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+
+    # Check the solution specific MetaThesaurus Excel workbook
+    wb = load_workbook(os.path.join('solutions', d.solution, 'Solution MetaThesaurus.xlsx'), read_only=True)
+    requiredColumns = ['MetaThesaurus code', 'MetaThesaurus description','Source', 'Source code']
+    d.solutionMetaThesaurus = {}
+    for row in excel.readWorksheet(wb, 'Solution MetaThesaurus', 'Solution MetaThesaurus', requiredColumns, True):
+        if row[0] is None:
+            break
+        # The code is really the dictionary key
+        thisCode = {}
+        for column, value in zip(row._fields[1:], row[1:]):
+            if column == 'MetaThesaurus_description':
+                column = 'description'
+            thisCode[column] = value
+        d.solutionMetaThesaurus[row[0]] = thisCode
+    wb.close()
+
+    # Import the solution specific data module
+    d.sd = importSolutionModule('solutionData', [])
+    # logging.debug('Solution specific data loaded')
+
+    # Check the solution 'prepare' Excel workbook
+    wb = load_workbook(os.path.join('solutions', d.solution, 'prepare.xlsx'), read_only=True)
+    requiredColumns = ['Label', 'Replacement']
+    d.labels = excel.loadSimpleCompileSheet(wb, 'prepare', 'labels', requiredColumns, r'^', None, False, False)
+    requiredColumns = ['Common', 'Technical']
+    d.terms = excel.loadSimpleCompileSheet(wb, 'prepare', 'terms', requiredColumns, None, None, True, True)
+    requiredColumns = ['Preamble markers', 'isCase', 'isStart']
+    d.preambleMarkers = excel.loadBoolCompileWorksheet(wb, 'prepare', 'preamble markers', requiredColumns, None, None, True)
+    requiredColumns = ['Preamble terms', 'Technical']
+    d.preambleTerms = excel.loadSimpleCompileSheet(wb, 'prepare', 'preamble terms', requiredColumns, None, None, True, True)
+    d.fusedTerms = fuseRules(d.terms, 0)
+    d.fusedPreambleTerms = fuseRules(d.preambleTerms, 0)
+
+    # Import the solution specific prepare module and check that it has all the required functions
+    d.sp = importSolutionModule('prepare', prepareFunctions)
+
+    # Now do any solution specific 'prepare' configuration and initialzation
+    configConcepts = d.sp.configure(wb)
+    d.knownConcepts.update(configConcepts)
+    wb.close()
+    # logging.debug('Prepare module loaded and configured')
+
+    # Check the solution 'complete' Excel workbook
+    wb = load_workbook(os.path.join('solutions', d.solution, 'complete.xlsx'), read_only=True)
+    requiredColumns = ['History markers', 'isCase', 'isStart']
+    d.historyMarkers = excel.loadBoolCompileWorksheet(wb, 'complete', 'history markers', requiredColumns, None, None, True)
+    requiredColumns = ['Pre history']
+    d.preHistory = excel.loadSimpleCompileSheet(wb, 'complete', 'pre history', requiredColumns, None, None, True, True)
+    requiredColumns = ['Section markers', 'Section', 'isCase']
+    d.sectionMarkers = excel.loadSimpleCompileSheet(wb, 'complete', 'section markers', requiredColumns, None, None, True, True)
+    requiredColumns = ['SolutionID', 'MetaThesaurusID(s)']
+    for record in excel.readWorksheet(wb, 'complete', 'equivalents', requiredColumns, False):
+        if record[0] is None:
+            break
+        # logging.debug("sheet(site implied), columns(%s), record(%s)", requiredColumns, record)
+        equivalent = record[0]
+        d.knownConcepts.add(equivalent)
+        j = 1
+        while (j < len(record)) and (record[j] is not None):
+            d.equivalents[record[j]] = equivalent
+            d.knownConcepts.add(record[j])
+            j += 1
+    requiredColumns = ['But boundaries']
+    d.butBoundaries = excel.loadSimpleCompileSheet(wb, 'complete', 'but boundaries', requiredColumns, None, None, True, True)
+    d.sentenceMarkers = {'but':d.butBoundaries}
+    requiredColumns = ['Pre negations']
+    d.preNegation = excel.loadCompileConceptsWorksheet(wb, 'complete', 'pre negations', requiredColumns, None, r'.*')
+    requiredColumns = ['Immediate pre negations']
+    d.immediatePreNegation = excel.loadCompileConceptsWorksheet(wb, 'complete', 'immediate pre negations', requiredColumns, None, r'\s+')
+    requiredColumns = ['Post negations', 'Exceptions']
+    d.postNegation = excel.loadCompileCompileWorksheet(wb, 'complete', 'post negations', requiredColumns, r'.*')
+    requiredColumns = ['Immediate post negations', 'Exceptions']
+    d.immediatePostNegation = excel.loadCompileCompileWorksheet(wb, 'complete', 'immediate post negations', requiredColumns, r'\s*')
+    requiredColumns = ['Pre ambiguous']
+    d.preAmbiguous = excel.loadCompileConceptsWorksheet(wb, 'complete', 'pre ambiguous', requiredColumns, None, r'.*')
+    requiredColumns = ['Immediate pre ambiguous']
+    d.immediatePreAmbiguous = excel.loadCompileConceptsWorksheet(wb, 'complete', 'immediate pre ambiguous', requiredColumns, None, r'\s+')
+    requiredColumns = ['Post ambiguous', 'Exceptions']
+    d.postAmbiguous = excel.loadCompileCompileWorksheet(wb, 'complete', 'post ambiguous', requiredColumns, r'\s*')
+    requiredColumns = ['Immediate post ambiguous', 'Exceptions']
+    d.immediatePostAmbiguous = excel.loadCompileCompileWorksheet(wb, 'complete', 'immediate post ambiguous', requiredColumns, r'\s*')
+    requiredColumns = ['MetaThesaurusID', 'SolutionID', 'Modifier']
+    d.preModifiers = excel.loadModifierWorksheet(wb, 'complete', 'pre modifiers', requiredColumns, None, r'\s.*$')
+    d.postModifiers = excel.loadModifierWorksheet(wb, 'complete', 'post modifiers', requiredColumns, r'^\s*', None)
+    requiredColumns = ['SolutionID', 'Concept']
+    for row in excel.readWorksheet(wb, 'complete', 'sentence concepts', requiredColumns, True):
+        if row.SolutionID is None:
+            break
+        # logging.debug("sheet(sentence concepts)), columns(%s), row(%s)", requiredColumns, row)
+        concept, isNeg = excel.checkConfigConcept(row.SolutionID)
+        reText = excel.literalPrefilter(re.compile(excel.checkPattern(row.Concept), flags=re.IGNORECASE|re.DOTALL))
+        text = row.Concept
+        text = re.sub(r'\s+', ' ', text)
+        text = re.sub(r'\b', '', text)
+        text = re.sub(r'\(', '(', text)
+        text = re.sub(r'\)', ')', text)
+        d.sentenceConcepts.append((concept, reText, isNeg, text))
+        d.knownConcepts.add(concept)
+    d.fusedSentenceConcepts = fuseRules(d.sentenceConcepts, 1)
+    requiredColumns = ['Start Negation', 'End Negation', 'Sentences']
+    for row in excel.readWorksheet(wb, 'complete', 'gross negations', requiredColumns, True):
+        if row.Start_Negation is None:
+            break
+        # logging.debug("sheet(gross negations)), columns(%s), row(%s)", requiredColumns, row)
+        startNeg = excel.literalPrefilter(re.compile(excel.checkPattern(row.Start_Negation), flags=re.IGNORECASE|re.DOTALL))
+        endNeg = excel.literalPrefilter(re.compile(excel.checkPattern(row.End_Negation), flags=re.IGNORECASE|re.DOTALL))
+        sentences = int(row.Sentences)
+        d.grossNegation.append((startNeg, endNeg, sentences))
+    requiredColumns = ['SolutionID', 'Section', 'Negate', 'MetaThesaurusIDs']
+    d.sentenceNegationLists = excel.loadNegationListWorksheet(wb, 'complete', 'sentence negation lists', requiredColumns)
+    d.documentNegationLists = excel.loadNegationListWorksheet(wb, 'complete', 'document negation lists', requiredColumns)
+    requiredColumns = ['SolutionID', 'Asserted', 'MetaThesaurus or Solution IDs']
+    d.sentenceConceptSequenceSets = excel.loadSequenceConceptSetsWorksheet(wb, 'complete', 'sent strict seq concept sets', requiredColumns, True)
+    d.sentenceConceptSequenceSets += excel.loadSequenceConceptSetsWorksheet(wb, 'complete', 'sentence sequence concept sets', requiredColumns, False)
+    requiredColumns = ['SolutionID', 'Sentences', 'Asserted', 'MetaThesaurus or Solution IDs']
+    d.sentenceConceptSequenceSets += excel.loadSequenceConceptSetsWorksheet(wb, 'complete', 'multi sent strict seq conc sets', requiredColumns, True)
+    d.sentenceConceptSequenceSets += excel.loadSequenceConceptSetsWorksheet(wb, 'complete', 'multi sentence seq concept sets', requiredColumns, False)
+    requiredColumns = ['SolutionID', 'Asserted', 'MetaThesaurus or Solution IDs']
+    d.sentenceConceptSets = excel.loadConceptSetsWorksheet(wb, 'complete', 'sentence concept sets', requiredColumns)
+    requiredColumns = ['SolutionID', 'Sentences', 'Asserted', 'MetaThesaurus or Solution IDs']
+    d.sentenceConceptSets += excel.loadConceptSetsWorksheet(wb, 'complete', 'multi sentence concept sets', requiredColumns)
+    requiredColumns = ['SolutionID', 'Asserted', 'MetaThesaurus or Solution IDs']
+    d.documentConceptSequenceSets = excel.loadConceptSetsWorksheet(wb, 'complete', 'document sequence concept sets', requiredColumns)
+    d.documentConceptSets = excel.loadConceptSetsWorksheet(wb, 'complete', 'document concept sets', requiredColumns)
+    requiredColumns = ['MetaThesaurus code']
+    for row in excel.readWorksheet(wb, 'complete', 'other concepts', requiredColumns, True):
+        if row.MetaThesaurus_code is None:
+            break
+        d.otherConcepts.add(row.MetaThesaurus_code)
+
+
+    # Import the solution specific complete module and check that it has all the required functions
+    d.sc = importSolutionModule('complete', completeFunctions)
+
+    # Now do any solution specific 'complete' configuration and initialzation
+    configConcepts = d.sc.configure(wb)
+    d.knownConcepts.update(configConcepts)
+    wb.close()
+    d.conceptSetIndex = indexConceptSets()
+    d.fusedMarkers = fuseMarkerFamilies()
+    # logging.debug('Complete module loaded and configured')
+
+    # Check the solution 'analyze' Excel workbook
+    wb = load_workbook(os.path.join('solutions', d.solution, 'analyze.xlsx'), read_only=True)
+
+    # There are no standard solution 'analyze' Excel worksheets
+
+    # Import the solution specific analyze module and check that it has all the required functions
+    d.sa = importSolutionModule('analyze', analyzeFunctions + reportFunctions(isFlask))
+
+    # Now do any solution specific 'analyze' configuration and initialzation
+    configConcepts = d.sa.configure(wb)
+    d.knownConcepts.update(configConcepts)
+    wb.close()
+    # logging.debug('Analyze module loaded and configured')
+    return
+
+
+def solutionFingerprint():
+    '''
+    Compute the fingerprint of the solution files (the Excel workbooks and Python modules in the solution folder)
+    Parameters
+        None
+    Returns
+        fingerprint - str, the SHA-256 hash of the names and contents of the solution files
+    '''
+
+    folder = os.path.join('solutions', d.solution)
+    fingerprint = hashlib.sha256()
+    for fileName in sorted(os.listdir(folder)):
+        if os.path.splitext(fileName)[1] not in ['.xlsx', '.py']:
+            continue
+        fingerprint.update(fileName.encode('utf-8') + b'\0')
+        with open(os.path.join(folder, fileName), 'rb') as fp:
+            fingerprint.update(hashlib.sha256(fp.read()).digest())
+    return fingerprint.hexdigest()
+
+
+def saveBundle(bundleFile):
+    '''
+    Save the loaded solution configuration data as a compiled solution bundle
+    Parameters
+        bundleFile  - str, the name of the compiled solution bundle file
+    Returns
+        Nothing
+    '''
+
+    # The solution specific data is everything in solutionData.py, except any modules and functions
+    solutionData = {}
+    for name, value in vars(d.sd).items():
+        if name.startswith('_') or isinstance(value, types.ModuleType) or callable(value):
+            continue
+        solutionData[name] = value
+    bundle = {'version':bundleVersion, 'solution':d.solution, 'fingerprint':solutionFingerprint(),
+              'data':{name:getattr(d, name) for name in bundleData}, 'solutionData':solutionData}
+    try:
+        with open(bundleFile, 'wb') as fp:
+            pickle.dump(bundle, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    except (OSError, pickle.PicklingError) as e:
+        logging.critical('Cannot create compiled solution bundle (%s) - error(%s)', bundleFile, repr(e))
+        logging.shutdown()
+        sys.exit(d.EX_CANTCREAT)
+    return
+
+
+def loadBundle(isFlask):
+    '''
+    Load the solution configuration data from the compiled solution bundle (d.solutionBundle) and import the solution specific modules
+    Parameters
+        isFlask - Boolean, True if the calling application is a Flask application
+    Returns
+        Nothing
+    '''
+
+    try:
+        with open(d.solutionBundle, 'rb') as fp:
+            bundle = pickle.load(fp)
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        logging.critical('Cannot read compiled solution bundle (%s) - error(%s)', d.solutionBundle, repr(e))
+        logging.shutdown()
+        sys.exit(d.EX_NOINPUT)
+    if (not isinstance(bundle, dict)) or (bundle.get('version') != bundleVersion):
+        logging.critical('Compiled solution bundle (%s) is not a version %d bundle - rerun compileSolution.py', d.solutionBundle, bundleVersion)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+    if bundle['solution'] != d.solution:
+        logging.critical('Compiled solution bundle (%s) is for solution "%s", not "%s"', d.solutionBundle, bundle['solution'], d.solution)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+    if not os.path.isdir(os.path.join('solutions', d.solution)):
+        logging.critical('No solution folder named "%s"', d.solution)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+    if bundle['fingerprint'] != solutionFingerprint():
+        logging.critical('Compiled solution bundle (%s) is out of date with solution "%s" - rerun compileSolution.py', d.solutionBundle, d.solution)
+        logging.shutdown()
+        sys.exit(d.EX_CONFIG)
+
+    # Import the solution specific modules and restore the solution configuration data
+    d.sd = importSolutionModule('solutionData', [])
+    for name, value in bundle['solutionData'].items():
+        setattr(d.sd, name, value)
+    for name, value in bundle['data'].items():
+        setattr(d, name, value)
+    d.sp = importSolutionModule('prepare', prepareFunctions)
+    d.sc = importSolutionModule('complete', completeFunctions)
+    d.sa = importSolutionModule('analyze', analyzeFunctions + reportFunctions(isFlask))
+    logging.info('Solution "%s" loaded from compiled solution bundle (%s)', d.solution, d.solutionBundle)
+    return
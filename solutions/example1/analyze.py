@@ -409,7 +409,7 @@ def configure(wb):
     return configConcepts
 
 
-def gridAppend (sentenceNo, start, thisSite, isHistory, thisFinding, AIHWcode, subSiteCode):
+def gridAppend(context, sentenceNo, start, thisSite, isHistory, thisFinding, AIHWcode, subSiteCode):
     '''
     Append this Site and Finding to the grid (unless it's historical).
     The grid is a list of all the Site/Finding pairs, with matching AIHW S/E/O code.
@@ -417,7 +417,8 @@ def gridAppend (sentenceNo, start, thisSite, isHistory, thisFinding, AIHWcode, s
     is offset by the readability of the code and the ease of using it in reporting.
     The grid is maintained 'in order' based upon a ranking for AIHW S/E/O codes.
     Parameters
-        sentenceNo      - int, the sentence in d.sentences where the diagnosis was detected
+        context         - d.AutoCodingContext, the state of AutoCoding this clinical document
+        sentenceNo      - int, the sentence in context.sentences where the diagnosis was detected
         start           - int, the position within the clinical document where this diagnosis was detected
         thisSite        - str, the SNOMED_CT Site Code
         isHistory       - boolean, True if this is historical diagnosis (Site/Finding pair)
@@ -426,7 +427,7 @@ def gridAppend (sentenceNo, start, thisSite, isHistory, thisFinding, AIHWcode, s
         subSiteCode     - str, the classification of Site into cervix, enometrial, etc.
     '''
 
-    if not isHistory and ((thisSite, thisFinding) not in d.sd.gridFound):
+    if not isHistory and ((thisSite, thisFinding) not in context.solution['gridFound']):
         if thisSite in d.sd.Site:
             logging.debug('gridAppend() - saving Site[%s](%s - %s)/Finding[%s](%s - %s)',
                         thisSite, d.sd.Site[thisSite]['snomed_ct'], d.sd.Site[thisSite]['desc'],
@@ -449,21 +450,21 @@ def gridAppend (sentenceNo, start, thisSite, isHistory, thisFinding, AIHWcode, s
                 AIHWrank = ['O4.2', 'O4.1', 'O3.2', 'O3.1', 'O2', 'O1', 'ON', 'OU'].index(AIHWcode) + 21
             except ValueError:
                 AIHWrank = 29
-        for i, grid in enumerate(d.sd.grid):
+        for i, grid in enumerate(context.solution['grid']):
             if grid[3] > AIHWrank:      # Insert before here
                 logging.debug('gridAppend() - inserting code(%s), rank %d before %d at %d', AIHWcode, AIHWrank, grid[3], i)
-                d.sd.grid.insert(i, [thisSite, thisFinding, AIHWcode, AIHWrank])
+                context.solution['grid'].insert(i, [thisSite, thisFinding, AIHWcode, AIHWrank])
                 break
         else:
             logging.debug('gridAppend() - appending code(%s), rank %d', AIHWcode, AIHWrank)
-            d.sd.grid.append([thisSite, thisFinding, AIHWcode, AIHWrank])
-        d.sd.gridFound.add((thisSite, thisFinding))
+            context.solution['grid'].append([thisSite, thisFinding, AIHWcode, AIHWrank])
+        context.solution['gridFound'].add((thisSite, thisFinding))
 
         # Check if we've found a cervix or endometrial code
         if subSiteCode == 'Cervix':
-            d.sd.solution['cervixDone'] = True
+            context.solution['cervixDone'] = True
         elif subSiteCode == 'endom':
-            d.sd.solution['endomDone'] = True
+            context.solution['endomDone'] = True
 
     # Check if this Site/Finding pair defines a Procedure
     if (thisSite, thisFinding) not in d.sd.ProcedureDefined:
@@ -474,65 +475,65 @@ def gridAppend (sentenceNo, start, thisSite, isHistory, thisFinding, AIHWcode, s
     if isHistory:
         logging.info('saving defined history procedure:%s - %s', thisProcedure, d.sd.Procedure[thisProcedure]['desc'])
         # We save the sentence number for reporting purposes
-        d.sd.historyProcedure[start] = thisProcedure
+        context.solution['historyProcedure'][start] = thisProcedure
     else:
         logging.info('saving defined procedure:%s - %s', thisProcedure, d.sd.Procedure[thisProcedure]['desc'])
         # We save the sentence number for reporting purposes
         # If the AIHW code for this procedure is '7', then this is a hysterectomy procedure.
         # We only need to check the 'Cervix' site because, for hysterectomies, the AIHW code is '7' for all sites.
         if d.sd.Procedure[thisProcedure]['Cervix'] == '7':
-            d.sd.hysterectomy.add((thisProcedure, sentenceNo))
+            context.solution['hysterectomy'].add((thisProcedure, sentenceNo))
         else:
-            d.sd.otherProcedure.add((thisProcedure, sentenceNo))
+            context.solution['otherProcedure'].add((thisProcedure, sentenceNo))
     return
 
 
-def analyze():
+def analyze(context):
     '''
     Analyze the sentences and concepts and build up the results which are stored in the this.solution dictionary
     '''
 
     # Find all the sentence Sites and Finding, plus track Procedures.
     # This is preparitory work that is needed by the juxtoposition analysis below.
-    d.sd.historyProcedure = {}
-    d.sd.hysterectomy = set()
-    d.sd.otherProcedure = set()
-    d.sd.solution['unsatFinding'] = None
-    d.sd.solution['cervixFound'] = False
-    d.sd.solution['endomFound'] = False
+    context.solution['historyProcedure'] = {}
+    context.solution['hysterectomy'] = set()
+    context.solution['otherProcedure'] = set()
+    context.solution['unsatFinding'] = None
+    context.solution['cervixFound'] = False
+    context.solution['endomFound'] = False
     SentenceSites = {}                   # The Sites found in each sentence
     SentenceFindings = {}                # The Findings found in each sentence
-    for sentenceNo, sentence in enumerate(d.sentences):            # Step through each sentence looking for implied Sites preceed any SentenceSites
+    for sentenceNo, sentence in enumerate(context.sentences):            # Step through each sentence looking for implied Sites preceed any SentenceSites
         # logging.debug('analyze() finding Sites and Findings - processing sentence[%d]', sentenceNo)
-        sentence = d.sentences[sentenceNo]
+        sentence = context.sentences[sentenceNo]
         SentenceSites[sentenceNo] = {}
         SentenceFindings[sentenceNo] = {}
-        document = sentence[6]    # Sentences hold mini-documents
-        for start in sorted(document, key=int):        # We step through all concepts in this sentence
+        document = sentence.document    # Sentences hold mini-documents
+        for start in document:        # We step through all concepts in this sentence
             for j in range(len(document[start])):            # Step through the list of alternate concepts at this point in this sentence
-                concept = document[start][j]['concept']
-                if document[start][j]['used']:        # Skip used concepts [only Findings get 'used']
+                concept = document[start][j].concept
+                if document[start][j].used:        # Skip used concepts [only Findings get 'used']
                     continue
                 # We only report positive procedures, sites and findings
-                if document[start][j]['negation'] != '0':    # Skip negated and ambiguous concepts
+                if document[start][j].negation != '0':    # Skip negated and ambiguous concepts
                     continue
-                isHistory = document[start][j]['history']    # A history concept - information about things that predate this analysis.
+                isHistory = document[start][j].history    # A history concept - information about things that predate this analysis.
                 # Check if this concept is a Procedure
                 if concept in d.sd.Procedure:
                     # Check if it's a history procedure
                     if isHistory:    # Save the last history procedure
                         logging.info('saving history procedure (sentence %d):%s - %s', sentenceNo, str(concept), str(d.sd.Procedure[concept]['desc']))
-                        d.sd.historyProcedure[start] = concept
+                        context.solution['historyProcedure'][start] = concept
                     else:
                         logging.info('saving procedure (sentence %d):%s - %s', sentenceNo, str(concept), str(d.sd.Procedure[concept]['desc']))
                         # Check if this is a hysterectomy
                         # If the AIHW code for this procedure is '7', then this is a hysterectomy procedure.
                         # We only need to check the 'Cervix' site because, for hysterectomies, the AIHW code is '7' for all sites.
                         if d.sd.Procedure[concept]['Cervix'] == '7':
-                            d.sd.hysterectomy.add((concept, sentenceNo))
+                            context.solution['hysterectomy'].add((concept, sentenceNo))
                             logging.info('saving hysterectomy procedure(sentence %d):%s - %s', sentenceNo, str(concept), str(d.sd.Procedure[concept]['desc']))
                         else:
-                            d.sd.otherProcedure.add((concept, sentenceNo))
+                            context.solution['otherProcedure'].add((concept, sentenceNo))
                             logging.info('saving other procedure(sentence %d):%s - %s', sentenceNo, str(concept), str(d.sd.Procedure[concept]['desc']))
                     continue
 
@@ -546,7 +547,7 @@ def analyze():
                     logging.info('saving Finding(sentence %d):%s - %s', sentenceNo, str(concept), str(d.sd.Finding[concept]['desc']))
                     # Check if this concept is an unsatifactory Finding
                     if d.sd.Finding[concept]['Cervix'] == 'SU':
-                        d.sd.solution['unsatFinding'] = concept
+                        context.solution['unsatFinding'] = concept
                     continue
 
                 # Check if this concept is a Site
@@ -562,12 +563,12 @@ def analyze():
                     # By "found" we mean that these site were noted
                     subsite = d.sd.Site[concept]['SubSite']
                     if subsite == 'Cervix':
-                        if not d.sd.solution['cervixFound']:
-                            d.sd.solution['cervixFound'] = True
+                        if not context.solution['cervixFound']:
+                            context.solution['cervixFound'] = True
                             logging.info('cervixFound')
                     elif subsite == 'endom':
-                        if not d.sd.solution['endomFound']:
-                            d.sd.solution['endomFound'] = True
+                        if not context.solution['endomFound']:
+                            context.solution['endomFound'] = True
                             logging.info('endomFound')
                     continue
             # end of all the alternate concepts
@@ -580,11 +581,11 @@ def analyze():
     # Start by looking through each sentence for Site/Finding pairs, in the same history phase, and add them to the grid.
     # [Only non-history things are actually added to the grid, but the gridAppend() function does procedure analysis as well
     #  for implied procedures, which can be historical.]
-    d.sd.grid = []
-    d.sd.gridFound = set()
-    d.sd.solution['cervixDone'] = False
-    d.sd.solution['endomDone'] = False
-    for sentenceNo in range(len(d.sentences)):            # Step through each sentence
+    context.solution['grid'] = []
+    context.solution['gridFound'] = set()
+    context.solution['cervixDone'] = False
+    context.solution['endomDone'] = False
+    for sentenceNo in range(len(context.sentences)):            # Step through each sentence
         # Check if at least one Site was found in this sentence
         if len(SentenceSites[sentenceNo]) == 0:
             continue
@@ -662,7 +663,7 @@ def analyze():
                     siteCode = d.sd.Site[bestSite]['Site']
                     subSiteCode = d.sd.Site[bestSite]['SubSite']
                     findingCode = d.sd.Finding[thisFinding][siteCode]
-                    gridAppend(sentenceNo, FindingStart, bestSite, bestSiteHistory, thisFinding, findingCode, subSiteCode)
+                    gridAppend(context, sentenceNo, FindingStart, bestSite, bestSiteHistory, thisFinding, findingCode, subSiteCode)
                     # Delete this finding and move onto the next one
                     # logging.debug('analyze() - deleting Finding (%s) at %d from sentence %d', thisFinding, FindingStart, sentenceNo)
                     # logging.debug('analyze() - Findings at %d in sentence no %d - %s',
@@ -681,7 +682,7 @@ def analyze():
 
     # Now re-work the sentences looking for Sites for any remaining Findings.
     # These can occur when the site is in a subheading, with all the finding in following sentence below that subheading
-    for sentenceNo, sentence in enumerate(d.sentences):            # Step through each sentence
+    for sentenceNo, sentence in enumerate(context.sentences):            # Step through each sentence
         # Check if there is a remaining found Finding in this sentence
         if len(SentenceFindings[sentenceNo]) == 0:
             # logging.debug('No unmatched findings in sentence(%d)', sentenceNo)
@@ -689,20 +690,20 @@ def analyze():
 
         # Check a number of the sentences around this Finding
         maxGap = 2            # Sites are really only valid for two sentences (unless the grid is empty)
-        if len(d.sd.grid) == 0:
+        if len(context.solution['grid']) == 0:
             maxGap = 3        # in which case they are valid for 3
         # Find the Sites across these sentences
         logging.debug('analyze() - checking sentence %d with findings (%s) for Sites within %d sentences',
                       sentenceNo, SentenceFindings[sentenceNo], maxGap)
         localSites = []
         bestSiteIndex = None
-        for sno in range(max(0, sentenceNo - maxGap), min(sentenceNo + maxGap, len(d.sentences))):
+        for sno in range(max(0, sentenceNo - maxGap), min(sentenceNo + maxGap, len(context.sentences))):
             # logging.debug('analyze() - checking sentence %d which has Sites(%s)', sno, SentenceSites[sno])
             if sno == sentenceNo:        # No Sites in the current sentence - that was handled above
                 localSites.append((sno, 0))     # A fake marker being "this sentence"
                 bestSiteIndex = len(localSites)     # The index of "this sentence"
                 continue
-            elif (sno > sentenceNo) and (d.sd.sentenceCAPS.match(d.sentences[sno][4]) is not None):    # Stop searching forward if we hit a label
+            elif (sno > sentenceNo) and (d.sd.sentenceCAPS.match(context.sentences[sno].text) is not None):    # Stop searching forward if we hit a label
                 break
             if len(SentenceSites[sno]) == 0:        # No Sites in this sentence
                 continue
@@ -768,7 +769,7 @@ def analyze():
                     siteCode = d.sd.Site[bestSite]['Site']
                     subSiteCode = d.sd.Site[bestSite]['SubSite']
                     findingCode = d.sd.Finding[thisFinding][siteCode]
-                    gridAppend(sentenceNo, FindingStart, bestSite, bestSiteHistory, thisFinding, findingCode, subSiteCode)
+                    gridAppend(context, sentenceNo, FindingStart, bestSite, bestSiteHistory, thisFinding, findingCode, subSiteCode)
                     # Delete this finding and move onto the next one
                     del SentenceFindings[sentenceNo][FindingStart][thisFindingIndex]
                     # Mark the site as used
@@ -798,12 +799,12 @@ def analyze():
                     siteCode = d.sd.Site[thisSite]['Site']
                     subSiteCode = d.sd.Site[thisSite]['SubSite']
                     findingCode = d.sd.Finding[thisFinding][siteCode]
-                    gridAppend(sentenceNo, FindingStart, thisSite, thisSiteHistory, thisFinding, findingCode, subSiteCode)
+                    gridAppend(context, sentenceNo, FindingStart, thisSite, thisSiteHistory, thisFinding, findingCode, subSiteCode)
                 else:
                     logging.info('Unused Finding in sentence(%s):%s - %s', sentenceNo, thisFinding, d.sd.Finding[thisFinding]['desc'])
 
     # Make sure there is something in the grid
-    if len(d.sd.grid) == 0:    # We have no Site/Finding pairs (which means no usable Findings or they would have been handled above)
+    if len(context.solution['grid']) == 0:    # We have no Site/Finding pairs (which means no usable Findings or they would have been handled above)
         logging.info('Empty grid')
         # We may have usable sites (Report Sites) in the document, which we can pair with 'nothing found' - check each in order
         # However, they are only report sites if all the associated concepts are found in the coded histopathology report
@@ -814,16 +815,16 @@ def analyze():
             thisReportSet = siteInfo[1]
             conceptNo = 0           # Step through the concepts for this Report Site in thisReportSet
             # logging.debug('analyze() - checking Report Site set %d - %s', setNo, thisReportSet)
-            for sentenceNo, sentence in enumerate(d.sentences):            # Step through each sentence
-                document = sentence[6]      # Sentences hold mini-documents
-                for start in sorted(document, key=int):        # We step through all concepts in this sentence
+            for sentenceNo, sentence in enumerate(context.sentences):            # Step through each sentence
+                document = sentence.document      # Sentences hold mini-documents
+                for start in document:        # We step through all concepts in this sentence
                     for j in range(len(document[start])):            # Step through the list of alternate concepts at this point in this sentence
-                        if document[start][j]['used']:        # Skip used concepts [only Findings get 'used']
+                        if document[start][j].used:        # Skip used concepts [only Findings get 'used']
                             continue
-                        if document[start][j]['history']:            # Skip historical concepts
+                        if document[start][j].history:            # Skip historical concepts
                             continue
-                        concept = document[start][j]['concept']
-                        isNeg =  document[start][j]['negation']        # Check that the negation matches
+                        concept = document[start][j].concept
+                        isNeg =  document[start][j].negation        # Check that the negation matches
 
                         # Check if this alternate concept at 'start' is the next one in this Report Site sequence of concept in this set
                         found = False
@@ -851,58 +852,58 @@ def analyze():
         for thisSite in foundSites:
             subsite = d.sd.Site[thisSite]['SubSite']
             if subsite == 'Cervix':         # A 'Cervix' type Site
-                if d.sd.solution['cervixDone']:
+                if context.solution['cervixDone']:
                     continue
-                if d.sd.solution['unsatFinding'] is not None:
-                    thisFinding = d.sd.solution['unsatFinding']
+                if context.solution['unsatFinding'] is not None:
+                    thisFinding = context.solution['unsatFinding']
                     findingCode = 'SU'      # Unsatisfactory
-                elif d.sd.solution['cervixFound']:
+                elif context.solution['cervixFound']:
                     thisFinding = d.sd.normalCervixCode
                     findingCode = 'S1'      # Normal
                 else:
                     thisFinding = d.sd.noAbnormality
                     findingCode = 'S1'      # Normal
                 # logging.debug('cervical ReportSite:%s', str(thisSite))
-                gridAppend(0, 0, thisSite, False, thisFinding, findingCode, subsite)
+                gridAppend(context, 0, 0, thisSite, False, thisFinding, findingCode, subsite)
             elif subsite == 'endom':        # An 'endom' type Site
-                if d.sd.solution['endomDone']:
+                if context.solution['endomDone']:
                     continue
-                if d.sd.solution['unsatFinding'] is not None:
-                    Finding = d.sd.solution['unsatFinding']
+                if context.solution['unsatFinding'] is not None:
+                    Finding = context.solution['unsatFinding']
                     findingCode = 'ON'      # Not applicable
-                elif d.sd.solution['endomFound']:
+                elif context.solution['endomFound']:
                     Finding = d.sd.normalEndomCode
                     findingCode = 'O1'      # Negative/no abnormalities reported or benign changes only
                 else:
                     Finding = d.sd.noAbnormality
                     findingCode = 'E1'      # Negative
-                gridAppend(0, 0, thisSite, False, Finding, findingCode, subsite)
+                gridAppend(context, 0, 0, thisSite, False, Finding, findingCode, subsite)
                 # logging.debug('endometrial ReportSite:%s', thisSite)
             else:
                 # logging.info('other ReportSite:%s', thisSite)
-                if d.sd.solution['unsatFinding'] is not None:
-                    gridAppend(0, 0, thisSite, False, d.sd.solution['unsatFinding'], 'ON', '')
+                if context.solution['unsatFinding'] is not None:
+                    gridAppend(context, 0, 0, thisSite, False, context.solution['unsatFinding'], 'ON', '')
                 else:
-                    gridAppend(0, 0, thisSite, False, d.sd.noAbnormality, 'ON', '')
+                    gridAppend(context, 0, 0, thisSite, False, d.sd.noAbnormality, 'ON', '')
                 break
 
     # Now add any 'normal' finding for any missing things - there may have been no Report Sites
-    logging.info('cervixFound:%s, cervixDone:%s', d.sd.solution['cervixFound'], d.sd.solution['cervixDone'])
-    if d.sd.solution['cervixFound'] and not d.sd.solution['cervixDone']:
-        gridAppend(0, 0, d.sd.cervixUteri, False, d.sd.normalCervixCode, 'S1', 'Cervix')
-    logging.info('endomFound:%s, endomDone:%d', d.sd.solution['endomFound'], d.sd.solution['endomDone'])
-    if d.sd.solution['endomFound'] and not d.sd.solution['endomDone']:
-        gridAppend(0, 0, d.sd.endomStructure, False, d.sd.normalEndomCode, 'O1', 'endom')
+    logging.info('cervixFound:%s, cervixDone:%s', context.solution['cervixFound'], context.solution['cervixDone'])
+    if context.solution['cervixFound'] and not context.solution['cervixDone']:
+        gridAppend(context, 0, 0, d.sd.cervixUteri, False, d.sd.normalCervixCode, 'S1', 'Cervix')
+    logging.info('endomFound:%s, endomDone:%d', context.solution['endomFound'], context.solution['endomDone'])
+    if context.solution['endomFound'] and not context.solution['endomDone']:
+        gridAppend(context, 0, 0, d.sd.endomStructure, False, d.sd.normalEndomCode, 'O1', 'endom')
 
-    if len(d.sd.grid) == 0:        # We still have nothing - So report No Topopgraphy/No abnormality
-        gridAppend(0, 0, '', False, d.sd.noAbnormality, 'ON', '')
+    if len(context.solution['grid']) == 0:        # We still have nothing - So report No Topopgraphy/No abnormality
+        gridAppend(context, 0, 0, '', False, d.sd.noAbnormality, 'ON', '')
 
     # Find the first S, E and O codes in the grid
     foundRows = set()       # Filter out duplicates of Site/Finding pairs
-    d.sd.reportS = None
-    d.sd.reportE = None
-    d.sd.reportO = None
-    for row in d.sd.grid:
+    context.solution['reportS'] = None
+    context.solution['reportE'] = None
+    context.solution['reportO'] = None
+    for row in context.solution['grid']:
         thisSite = row[0]
         thisFinding = row[1]
         thisAIHW = row[2]
@@ -910,42 +911,42 @@ def analyze():
         if thisRow not in foundRows:
             foundRows.add(thisRow)
             if thisAIHW[:1] == 'S':
-                if d.sd.reportS is None:
-                    d.sd.reportS = thisAIHW
+                if context.solution['reportS'] is None:
+                    context.solution['reportS'] = thisAIHW
             elif thisAIHW[:1] == 'E':
-                if d.sd.reportE is None:
-                    d.sd.reportE = thisAIHW
+                if context.solution['reportE'] is None:
+                    context.solution['reportE'] = thisAIHW
             else:
-                if d.sd.reportO is None:
-                    d.sd.reportO = thisAIHW
-    if d.sd.reportS is None:
-        d.sd.reportS = 'SN'
-    if d.sd.reportE is None:
-        d.sd.reportE = 'EN'
-    if d.sd.reportO is None:
-        d.sd.reportO = 'ON'
+                if context.solution['reportO'] is None:
+                    context.solution['reportO'] = thisAIHW
+    if context.solution['reportS'] is None:
+        context.solution['reportS'] = 'SN'
+    if context.solution['reportE'] is None:
+        context.solution['reportE'] = 'EN'
+    if context.solution['reportO'] is None:
+        context.solution['reportO'] = 'ON'
 
     # If we have no procedures, but we have a history procedure, then that's as good as it gets
     # Promote the last history procedure found to procedures and remove from the set of history procedures
     # History procedures are stored as a dictionary, where the key is the position within the document
     reportedProcs = set()       # The set of procedures included in the report/analysis
-    if (len(d.sd.hysterectomy) == 0) and (len(d.sd.otherProcedure) == 0):
-        if len(d.sd.historyProcedure) > 0:
-            histStart = sorted(d.sd.historyProcedure)[-1]       # The last historical procedure in the histopathology report
-            histProc = d.sd.historyProcedure[histStart]
+    if (len(context.solution['hysterectomy']) == 0) and (len(context.solution['otherProcedure']) == 0):
+        if len(context.solution['historyProcedure']) > 0:
+            histStart = sorted(context.solution['historyProcedure'])[-1]       # The last historical procedure in the histopathology report
+            histProc = context.solution['historyProcedure'][histStart]
             # Check if this is a hysterectomy
             # If the AIHW code for this procedure is '7', then this is a hysterectomy procedure.
             # We only need to check the 'Cervix' site because, for hysterectomies, the AIHW code is '7' for all sites.
             if d.sd.Procedure[histProc]['Cervix'] == '7':
-                d.sd.hysterectomy.add((histProc, sentenceNo))
+                context.solution['hysterectomy'].add((histProc, sentenceNo))
             else:
-                d.sd.otherProcedure.add((histProc, sentenceNo))
+                context.solution['otherProcedure'].add((histProc, sentenceNo))
             reportedProcs.add(histProc)
-            del d.sd.historyProcedure[histStart]        # Remove as we have moved this to hyterectomy or otherProcedure
+            del context.solution['historyProcedure'][histStart]        # Remove as we have moved this to hyterectomy or otherProcedure
 
     # Now lets work out those Procedures - start by finding the top site
     # We have some defaults in case the grid only has 'Topography not assigned'
-    topSite = d.sd.grid[0][0]
+    topSite = context.solution['grid'][0][0]
     if topSite != '':
         TopSite = d.sd.Site[topSite]['Site']
         TopSubSite = d.sd.Site[topSite]['SubSite']
@@ -957,24 +958,24 @@ def analyze():
     # logging.debug('topSite:%s', str(TopSite))
 
     # Compute the SNOMED_CT procedure and AIHW procedure
-    d.sd.reportSN_CTprocedure = {}
-    d.sd.reportAIHWprocedure = {}
-    if len(d.sd.hysterectomy) > 0:      # Use any hysterectomy
-        thisProcedure, thisSno = list(d.sd.hysterectomy)[0]
+    context.solution['reportSN_CTprocedure'] = {}
+    context.solution['reportAIHWprocedure'] = {}
+    if len(context.solution['hysterectomy']) > 0:      # Use any hysterectomy
+        thisProcedure, thisSno = list(context.solution['hysterectomy'])[0]
         logging.info('Hysterectomy procedure(%s):%s - %s',
                           thisProcedure, d.sd.Procedure[thisProcedure]['snomed_ct'], d.sd.Procedure[thisProcedure]['desc'])
-        d.sd.reportSN_CTprocedure['code'] = d.sd.Procedure[thisProcedure]['snomed_ct']
-        d.sd.reportSN_CTprocedure['desc'] = d.sd.Procedure[thisProcedure]['desc']
-        d.sd.reportAIHWprocedure['code'] = '7'
-        d.sd.reportAIHWprocedure['desc'] = d.sd.AIHWprocedure['7']
+        context.solution['reportSN_CTprocedure']['code'] = d.sd.Procedure[thisProcedure]['snomed_ct']
+        context.solution['reportSN_CTprocedure']['desc'] = d.sd.Procedure[thisProcedure]['desc']
+        context.solution['reportAIHWprocedure']['code'] = '7'
+        context.solution['reportAIHWprocedure']['desc'] = d.sd.AIHWprocedure['7']
         reportedProcs.add(thisProcedure)
-        d.sd.hysterectomy.remove((thisProcedure, thisSno))
-    elif len(d.sd.otherProcedure) > 0:        # Multiple other procedures - find the highest ranked procedure for the top site
+        context.solution['hysterectomy'].remove((thisProcedure, thisSno))
+    elif len(context.solution['otherProcedure']) > 0:        # Multiple other procedures - find the highest ranked procedure for the top site
         rank = -1
         rankProc = None
         rankSno = None
         # We need to print the highest ranked procedure
-        for thisProc, thisSno in d.sd.otherProcedure:
+        for thisProc, thisSno in context.solution['otherProcedure']:
             if TopSite == 'Cervix':
                 thisRank = int(d.sd.Procedure[thisProc]['Cervix_Rank'])
             elif TopSite == 'Vagina':
@@ -990,56 +991,56 @@ def analyze():
                 rankSno = thisSno
         if rankProc is None:        # None of the procedures were valid
             logging.info('No valid procedure')
-            d.sd.reportSN_CTprocedure['code'] = 'WARNING'
-            d.sd.reportSN_CTprocedure['desc'] = 'No Procedure specified'
-            d.sd.reportAIHWprocedure['code'] = 'WARNING'
-            d.sd.reportAIHWprocedure['desc'] = 'No Procedure specified'
+            context.solution['reportSN_CTprocedure']['code'] = 'WARNING'
+            context.solution['reportSN_CTprocedure']['desc'] = 'No Procedure specified'
+            context.solution['reportAIHWprocedure']['code'] = 'WARNING'
+            context.solution['reportAIHWprocedure']['desc'] = 'No Procedure specified'
         else:
             logging.info('Other procedure(%s):%s - %s',
                               rankProc, d.sd.Procedure[rankProc]['snomed_ct'], d.sd.Procedure[rankProc]['desc'])
-            d.sd.reportSN_CTprocedure['code'] = d.sd.Procedure[rankProc]['snomed_ct']
-            d.sd.reportSN_CTprocedure['desc'] = d.sd.Procedure[rankProc]['desc']
+            context.solution['reportSN_CTprocedure']['code'] = d.sd.Procedure[rankProc]['snomed_ct']
+            context.solution['reportSN_CTprocedure']['desc'] = d.sd.Procedure[rankProc]['desc']
             AIHWProc = d.sd.Procedure[rankProc][TopSite]
             if AIHWProc == '99':
-                d.sd.reportAIHWprocedure['code'] = 'WARNING'
-                d.sd.reportAIHWprocedure['desc'] = 'No Applicable Procedure specified'
+                context.solution['reportAIHWprocedure']['code'] = 'WARNING'
+                context.solution['reportAIHWprocedure']['desc'] = 'No Applicable Procedure specified'
             else:
-                d.sd.reportAIHWprocedure['code'] = AIHWProc
-                d.sd.reportAIHWprocedure['desc'] = d.sd.AIHWprocedure[AIHWProc]
+                context.solution['reportAIHWprocedure']['code'] = AIHWProc
+                context.solution['reportAIHWprocedure']['desc'] = d.sd.AIHWprocedure[AIHWProc]
             reportedProcs.add(rankProc)
-            d.sd.otherProcedure.remove((rankProc, rankSno))
+            context.solution['otherProcedure'].remove((rankProc, rankSno))
     else:
         logging.info('No procedure')
-        d.sd.reportSN_CTprocedure['code'] = 'WARNING'
-        d.sd.reportSN_CTprocedure['desc'] = 'No Procedure specified'
-        d.sd.reportAIHWprocedure['code'] = 'WARNING'
-        d.sd.reportAIHWprocedure['desc'] = 'No Procedure specified'
+        context.solution['reportSN_CTprocedure']['code'] = 'WARNING'
+        context.solution['reportSN_CTprocedure']['desc'] = 'No Procedure specified'
+        context.solution['reportAIHWprocedure']['code'] = 'WARNING'
+        context.solution['reportAIHWprocedure']['desc'] = 'No Procedure specified'
 
     # Report any unused hysterectomies
-    d.sd.solution['otherHysterectomies'] = []
-    for proc, sno in d.sd.hysterectomy:
+    context.solution['otherHysterectomies'] = []
+    for proc, sno in context.solution['hysterectomy']:
         if proc in reportedProcs:
             continue
         logging.info('Unused Hysterectomy procedure in sentence(%s):%s - %s', sno, proc, d.sd.Procedure[proc]['desc'])
-        d.sd.solution['otherHysterectomies'].append([d.sd.Prodecure[proc]['snomed_ct'], d.sd.Procedure[proc]['desc'], '7', d.sd.AIHWprocedure['7']])
+        context.solution['otherHysterectomies'].append([d.sd.Prodecure[proc]['snomed_ct'], d.sd.Procedure[proc]['desc'], '7', d.sd.AIHWprocedure['7']])
         reportedProcs.add(proc)
 
     # Report any unused procedures
-    d.sd.solution['otherProcedures'] = []
-    for proc, sno in d.sd.otherProcedure:
+    context.solution['otherProcedures'] = []
+    for proc, sno in context.solution['otherProcedure']:
         if proc in reportedProcs:
             continue
         logging.info('Unused Procedure in sentence(%d):%s - %s', sno, proc, d.sd.Procedure[proc]['desc'])
         AIHWProc = d.sd.Procedure[proc][TopSite]
         if AIHWProc == '99':
-            d.sd.solution['otherProcedures'].append([d.sd.Procedure[proc]['snomed_ct'], d.sd.Procedure[proc]['desc'], 'WARNING', 'No Applicable Procedure specified'])
+            context.solution['otherProcedures'].append([d.sd.Procedure[proc]['snomed_ct'], d.sd.Procedure[proc]['desc'], 'WARNING', 'No Applicable Procedure specified'])
         else:
-            d.sd.solution['otherProcedures'].append([d.sd.Procedure[proc]['snomed_ct'], d.sd.Procedure[proc]['desc'], AIHWProc, d.sd.AIHWprocedure[AIHWProc]])
+            context.solution['otherProcedures'].append([d.sd.Procedure[proc]['snomed_ct'], d.sd.Procedure[proc]['desc'], AIHWProc, d.sd.AIHWprocedure[AIHWProc]])
         reportedProcs.add(proc)
     return
 
 
-def reportJSON(asSuccess):
+def reportJSON(context, asSuccess):
     '''
     Assemble the response as a dictionary.
     reportHTML converts this into HTML.
@@ -1065,9 +1066,9 @@ def reportJSON(asSuccess):
         return response
 
     # Build the dictionary of response values
-    response['SCTprocedure'] = d.sd.reportSN_CTprocedure
+    response['SCTprocedure'] = context.solution['reportSN_CTprocedure']
     response['grid'] = []
-    for row in d.sd.grid:
+    for row in context.solution['grid']:
         thisRow = {}
         thisSite = row[0]
         thisFinding = row[1]
@@ -1082,26 +1083,26 @@ def reportJSON(asSuccess):
         thisRow['finding description'] = d.sd.Finding[thisFinding]['desc']
         thisRow['AIHW'] = AIHW
         response['grid'].append(thisRow)
-    response['AIHWprocedure'] = d.sd.reportAIHWprocedure
+    response['AIHWprocedure'] = context.solution['reportAIHWprocedure']
     response['S'] = {}
-    response['S']['code'] = d.sd.reportS
-    response['S']['desc'] = d.sd.AIHWfinding[d.sd.reportS]
+    response['S']['code'] = context.solution['reportS']
+    response['S']['desc'] = d.sd.AIHWfinding[context.solution['reportS']]
     response['E'] = {}
-    response['E']['code'] = d.sd.reportE
-    response['E']['desc'] = d.sd.AIHWfinding[d.sd.reportE]
+    response['E']['code'] = context.solution['reportE']
+    response['E']['desc'] = d.sd.AIHWfinding[context.solution['reportE']]
     response['O'] = {}
-    response['O']['code'] = d.sd.reportO
-    response['O']['desc'] = d.sd.AIHWfinding[d.sd.reportO]
+    response['O']['code'] = context.solution['reportO']
+    response['O']['desc'] = d.sd.AIHWfinding[context.solution['reportO']]
     response['otherHysterectomies'] = []
-    for i in range(len(d.sd.solution['otherHysterectomies'])):
-        response['otherHysterectomies'].append(d.sd.solution['otherHysterectomies'][i])
+    for i in range(len(context.solution['otherHysterectomies'])):
+        response['otherHysterectomies'].append(context.solution['otherHysterectomies'][i])
     response['otherProcedures'] = []
-    for i in range(len(d.sd.solution['otherProcedures'])):
-        response['otherProcedures'].append(d.sd.solution['otherProcedures'][i])
+    for i in range(len(context.solution['otherProcedures'])):
+        response['otherProcedures'].append(context.solution['otherProcedures'][i])
     return response
 
 
-def reportFile(folder, filename):
+def reportFile(context, folder, filename):
     '''
     Print the results
     '''
@@ -1122,7 +1123,7 @@ def reportFile(folder, filename):
     findingCodeLen = 0
     findingDescLen = 0
     AIHWlen = 0
-    for row in d.sd.grid:
+    for row in context.solution['grid']:
         thisSite = row[0]
         thisFinding = row[1]
         if thisSite != '':
@@ -1156,7 +1157,7 @@ def reportFile(folder, filename):
     boxLine = '+-' + '-' * col1Len + '+-' + '-' * col2Len + '+-' + '-' * AIHWlen + '+'
     print(headerLine, file=fpOut)
     print(file=fpOut)
-    print(f"Procedure: {d.sd.reportSN_CTprocedure['code']} - {d.sd.reportSN_CTprocedure['desc']}", file=fpOut)
+    print(f"Procedure: {context.solution['reportSN_CTprocedure']['code']} - {context.solution['reportSN_CTprocedure']['desc']}", file=fpOut)
     print(file=fpOut)
     print(headerLine, file=fpOut)
 
@@ -1166,7 +1167,7 @@ def reportFile(folder, filename):
     print(boxLine, file=fpOut)
 
     # Next print the Grid (it is already in descending S, then descending E, then descending O order)
-    for row in d.sd.grid:
+    for row in context.solution['grid']:
         thisSite = row[0]
         thisFinding = row[1]
         thisAIHW = row[2]
@@ -1187,18 +1188,18 @@ def reportFile(folder, filename):
     # Now output the AIHW results
     print(file=fpOut)
     print('AIHW', file=fpOut)
-    print(f"Procedure: {d.sd.reportAIHWprocedure['code']} - {d.sd.reportAIHWprocedure['desc']}", file=fpOut)
-    print(f'S: {d.sd.reportS} - {d.sd.AIHWfinding[d.sd.reportS]}', file=fpOut)
-    print(f'E: {d.sd.reportE} - {d.sd.AIHWfinding[d.sd.reportE]}', file=fpOut)
-    print(f'O: {d.sd.reportO} - {d.sd.AIHWfinding[d.sd.reportO]}', file=fpOut)
+    print(f"Procedure: {context.solution['reportAIHWprocedure']['code']} - {context.solution['reportAIHWprocedure']['desc']}", file=fpOut)
+    print(f'S: {context.solution["reportS"]} - {d.sd.AIHWfinding[context.solution["reportS"]]}', file=fpOut)
+    print(f'E: {context.solution["reportE"]} - {d.sd.AIHWfinding[context.solution["reportE"]]}', file=fpOut)
+    print(f'O: {context.solution["reportO"]} - {d.sd.AIHWfinding[context.solution["reportO"]]}', file=fpOut)
 
     # Now output any other Hysterectomies
-    if len(d.sd.solution['otherHysterectomies']) > 0:
+    if len(context.solution['otherHysterectomies']) > 0:
         SCTcodeWidth = len('SCT code')
         SCTdescWidth = len('SCT hysterectomy description')
         AIHWcodeWidth = len('AIHW code')
         AIHWdescWidth = len('AIHW hysterectomy description')
-        for row in d.sd.solution['otherHysterectomies']:
+        for row in context.solution['otherHysterectomies']:
             if len(row[0]) > SCTcodeWidth:
                 SCTcodeWidth = len(row[0])
             if len(row[1]) > SCTdescWidth:
@@ -1219,19 +1220,19 @@ def reportFile(folder, filename):
         print(boxLine, file=fpOut)
         print(f"| {'SNOMED CT':{col1Len}}| {'AIHW':{col2Len}}|", file=fpOut)
         print(boxLine, file=fpOut)
-        for row in d.sd.solution['otherHysterectomies']:
+        for row in context.solution['otherHysterectomies']:
             line = f"| {row[0] + ' - ' + row[1]:{col1Len}}"
             line += f"| {row[2] + ' - ' + row[3]:{col2Len}}|"
             print(line, file=fpOut)
         print(boxLine, file=fpOut)
 
     # Now output any other Procedures
-    if len(d.sd.solution['otherProcedures']) > 0:
+    if len(context.solution['otherProcedures']) > 0:
         SCTcodeWidth = len('SCT code')
         SCTdescWidth = len('SCT procedure description')
         AIHWcodeWidth = len('AIHW code')
         AIHWdescWidth = len('AIHW procedure description')
-        for row in d.sd.solution['otherProcedures']:
+        for row in context.solution['otherProcedures']:
             if len(row[0]) > SCTcodeWidth:
                 SCTcodeWidth = len(row[0])
             if len(row[1]) > SCTdescWidth:
@@ -1252,7 +1253,7 @@ def reportFile(folder, filename):
         print(boxLine, file=fpOut)
         print(f"| {'SNOMED CT':{col1Len }}| {'AIHW':{col2Len}}|", file=fpOut)
         print(boxLine, file=fpOut)
-        for row in d.sd.solution['otherProcedures']:
+        for row in context.solution['otherProcedures']:
             line = f"| {row[0] + ' - ' + row[1]:{col1Len }}"
             line += f"| {row[2] + ' - ' + row[3]:{col2Len}}|"
             print(line, file=fpOut)
@@ -1260,7 +1261,7 @@ def reportFile(folder, filename):
     return
 
 
-def reportHTML():
+def reportHTML(context):
     '''
     Create the HTML version of the report
     '''
@@ -1268,7 +1269,7 @@ def reportHTML():
     # logging.debug('reportHTML()')
 
     message = '<h2>AutoCoding of a Histopathology Report</h2>'
-    response = reportJSON(True)
+    response = reportJSON(context, True)
     siteLen = 5
     findLen = 8
     aihwLen = 5
@@ -26,7 +26,7 @@ def configure(wb):
     return configConcepts
 
 
-def requireConcept(concept, isNegated, partOfSpeech, isHistory, sentenceNo, start, length, text):
+def requireConcept(context, concept, isNegated, partOfSpeech, isHistory, sentenceNo, start, length, text):
     '''
     Check if the solution requires this concept
     For histopathology, the '?' character is used to indicate that the following may be present.
@@ -34,11 +34,12 @@ def requireConcept(concept, isNegated, partOfSpeech, isHistory, sentenceNo, star
     It is a suggestion of a direction for further testing, as in "? stomach ulcer"
     As such, then concept following the '?' can be discarded
     Parameters
+        context         - d.AutoCodingContext, the state of AutoCoding this clinical document
         concept         - str, the concept that may be required
         isNegated       - str, one character indicating whether the concept is negated or ambiguous
         partOfSpeech    - str, the MetaMapLite determined part of speech for this concept
         isHistory       - boolean, True means that this is a historical concept
-        sentenceNo      - int, the sentence in d.sentences where this concept was found
+        sentenceNo      - int, the sentence in context.sentences where this concept was found
         start           - int, the location within this sentence where this concept was found
         length          - int, the length of the matching text that was coded to this concept
         text            - str, the text that was coded to this concept
@@ -52,13 +53,13 @@ def requireConcept(concept, isNegated, partOfSpeech, isHistory, sentenceNo, star
         # logging.debug('noun, adjective or adverb at %d[%s]', start, text)
         # Check if this is just a question, not an answer - the ? will always be the last character on the previous line
         if sentenceNo > 0:        # Start by looking for ' ? xxxx'
-            if re.search(r'\s\?\s*$', d.sentences[sentenceNo - 1][4], flags=re.IGNORECASE) is not None:
+            if re.search(r'\s\?\s*$', context.sentences[sentenceNo - 1].text, flags=re.IGNORECASE) is not None:
                 # logging.debug('requiredConcept:ignored as query term')
                 return False
     return True
 
 
-def solutionCheckHistory(inHistory, text):
+def solutionCheckHistory(context, inHistory, text):
     '''
     Check for any solution specific markers that indicate the start or end of a section of history
     in the current sentence or an preceeding sentence (when combined with information from this sentence).
@@ -70,10 +71,11 @@ def solutionCheckHistory(inHistory, text):
     Sometimes the section heading 'CLINICAL INFORMATION',
     [which is a history marker] gets split over two lines.
     Parameters
+        context         - d.AutoCodingContext, the state of AutoCoding this clinical document
         inHistory       - boolean, True indicates that the text preceeding 'text' is historical information
         text            - str, the text to be scanned
     Returns
-        sentenceFound   - How many sentence back from the current end d.sentences the match was found
+        sentenceFound   - How many sentence back from the current end context.sentences the match was found
         changeAt        - Where the change occured in the last/current sentence (only valid if sentenceFound == 0)
         matchLen        - The length of the matching text in the last/current sentence (only valid if sentenceFound == 0)
     '''
@@ -82,20 +84,20 @@ def solutionCheckHistory(inHistory, text):
         return (-1, None, None)
     else:                # We are not in history - check to see if that we have fallen into a new history section
         # Checking if this sentence contains 'INFORMATION:' and any of the three previous sentences starts with 'CLINICAL'
-        # logging.debug('solutionCheckHistory() - searching through sentences %s', d.sentences)
+        # logging.debug('solutionCheckHistory() - searching through sentences %s', context.sentences)
         clinicalFound = -1
         search = re.search(r'\b' + r'INFORMATION\s*:', text)
-        if search is not None:      # We have 'INFORMATION' in the current sentence in d.sentences
+        if search is not None:      # We have 'INFORMATION' in the current sentence in context.sentences
             clinicalFound = -1      # Now search previous sentence for 'CLINICAL'
-            if (len(d.sentences) == 0) and (re.search(r'^\s*CLINICAL', text) is not None):
+            if (len(context.sentences) == 0) and (re.search(r'^\s*CLINICAL', text) is not None):
                 clinicalFound = 0
-            if (len(d.sentences) > 0) and (re.search(r'^\s*CLINICAL', d.sentences[-1][4]) is not None):
+            if (len(context.sentences) > 0) and (re.search(r'^\s*CLINICAL', context.sentences[-1].text) is not None):
                 clinicalFound = 1
-            if (len(d.sentences) > 1) and (re.search(r'^\s*CLINICAL', d.sentences[-2][4]) is not None):
+            if (len(context.sentences) > 1) and (re.search(r'^\s*CLINICAL', context.sentences[-2].text) is not None):
                 clinicalFound = 2
-            if (len(d.sentences) > 2) and (re.search(r'^\s*CLINICAL', d.sentences[-3][4]) is not None):
+            if (len(context.sentences) > 2) and (re.search(r'^\s*CLINICAL', context.sentences[-3].text) is not None):
                 clinicalFound = 3
-            if (len(d.sentences) > 3) and (re.search(r'^\s*CLINICAL', d.sentences[-4][4]) is not None):
+            if (len(context.sentences) > 3) and (re.search(r'^\s*CLINICAL', context.sentences[-4].text) is not None):
                 clinicalFound = 4
         if clinicalFound == -1:
             return (-1, None, None)
@@ -105,7 +107,7 @@ def solutionCheckHistory(inHistory, text):
             return (clinicalFound, None, None)
 
 
-def solutionAddAdditionalConcept(concept, sentenceNo, start, j, negated, depth):
+def solutionAddAdditionalConcept(context, concept, sentenceNo, start, j, negated, depth):
     '''
     An additional concept has been added to the mini-document.
     If the concept is a Finding and it is an unsatisfactory finding, then we save it as the unsatFinding so we can report it as the finding,
@@ -113,8 +115,9 @@ def solutionAddAdditionalConcept(concept, sentenceNo, start, j, negated, depth):
     If the concept is a Site then we update 'cervixFound' or 'endomFound' as appropriate so we can report 'xxx - normal'
     rather 'no abnormality' when, after all other processing, we've no site/finding pairs.
     Parameters
+        context     - d.AutoCodingContext, the state of AutoCoding this clinical document
         concept     - str, the additional concept  added to the mini-document
-        sentenceNo  - int, the sentence in d.sentences where the mini-document was found
+        sentenceNo  - int, the sentence in context.sentences where the mini-document was found
         start       - int, where, within the sentence the mini-document was found and the additional concept added
         j           - int, the location of another concept in this mini-document from which attributes can be copied
         negated     - str, the negation/ambiguity status of the additional concept
@@ -131,13 +134,13 @@ def solutionAddAdditionalConcept(concept, sentenceNo, start, j, negated, depth):
         sys.exit(d.EX_CONFIG)
 
     # Sentence hold mini-documents of concepts
-    document = d.sentences[sentenceNo][6]
+    document = context.sentences[sentenceNo].document
 
     # Check if this concept has an implied procedure
     if concept in d.sd.ProcedureImplied:
         thisProcedure = d.sd.ProcedureImplied[concept]
         description = d.sd.Procedure[thisProcedure]['desc']
-        f.addAdditionalConcept(thisProcedure, sentenceNo, start, j, description, negated, f'procedureImplied by concept "{concept}"', depth + 1)
+        f.addAdditionalConcept(context, thisProcedure, sentenceNo, start, j, description, negated, f'procedureImplied by concept "{concept}"', depth + 1)
 
     # Check if this concept has an implied diagnosis
     if concept in d.sd.DiagnosisImplied:
@@ -145,38 +148,38 @@ def solutionAddAdditionalConcept(concept, sentenceNo, start, j, negated, depth):
         for thisSite, thisFinding in d.sd.DiagnosisImplied[concept]:
             # There is an implied Site so we add it to the document
             description = d.sd.Site[thisSite]['desc']
-            f.addAdditionalConcept(thisSite, sentenceNo, start, j, description, negated, f'diagnosis(Site) implied by "{concept}"', depth + 1)
+            f.addAdditionalConcept(context, thisSite, sentenceNo, start, j, description, negated, f'diagnosis(Site) implied by "{concept}"', depth + 1)
             # There is an implied Finding so we add it to the document
             description = d.sd.Finding[thisFinding]['desc']
-            f.addAdditionalConcept(thisFinding, sentenceNo, start, j, description, negated, f'diagnosis(Finding) implied by "{concept}"', depth + 1)
+            f.addAdditionalConcept(context, thisFinding, sentenceNo, start, j, description, negated, f'diagnosis(Finding) implied by "{concept}"', depth + 1)
 
         # Mark this diagnosis implied concept as 'used'; we don't want it to participant in any other Site/Finding pair.
         # this.logger.debug('[implies diagnosis] concept (%s) at %d/%d is used', str(concept), start, j)
-        document[start][j]['used'] = True
+        document[start][j].used = True
 
     # Check if this concept has any implied site(s) (concept can be a Finding or a Procedure, but the implied concept must be a Site)
     if concept in d.sd.SiteImplied:
         # There is one or more implied Sites so we add them to the mini-document
         for thisSite in d.sd.SiteImplied[concept]:
             description = d.sd.Site[thisSite]['desc']
-            f.addAdditionalConcept(thisSite, sentenceNo, start, j, description, negated, f'siteImplied by concept "{concept}"', depth + 1)
+            f.addAdditionalConcept(context, thisSite, sentenceNo, start, j, description, negated, f'siteImplied by concept "{concept}"', depth + 1)
 
     # Check if this concept has any implied finding(s) (concept can be a Site or a Procedure, but the implied concept must be a Finding)
     if concept in d.sd.FindingImplied:
         # There is one or more implied Findings so we add them to the mini-document
         for thisFinding in d.sd.FindingImplied[concept]:
             description = d.sd.Finding[thisFinding]['desc']
-            f.addAdditionalConcept(thisFinding, sentenceNo, start, j, description, negated, f'findingImplied by concept "{concept}"', depth + 1)
+            f.addAdditionalConcept(context, thisFinding, sentenceNo, start, j, description, negated, f'findingImplied by concept "{concept}"', depth + 1)
     return
 
 
-def addRawConcepts():
+def addRawConcepts(context):
     '''
     Add any solution specific concepts to the document before negation.
     These concepts may get negated, but are candiates for inclusion in concept sets.
     Note: must be knownConcepts as we cannot change the configuration at this point
     Parameters
-        None
+        context - d.AutoCodingContext, the state of AutoCoding this clinical document
     Returns
         Nothing
     '''
@@ -184,25 +187,26 @@ def addRawConcepts():
     return
 
 
-def initalizeNegation():
+def initalizeNegation(context):
     '''
     Initialize any local variables required for extending negation.
     this.solution is a dictionary reservered for solution variables
     Parameters
-        None
+        context - d.AutoCodingContext, the state of AutoCoding this clinical document
     Returns
         Nothing
     '''
 
-    d.sd.solution['lastNegation'] = None        # Last Site/Finding negation
+    context.solution['lastNegation'] = None        # Last Site/Finding negation
     return
 
 
-def extendNegation(sentenceNo, start, lastNegation, thisNegation):
+def extendNegation(context, sentenceNo, start, lastNegation, thisNegation):
     '''
     Extend negation or ambiguity for any Findings at this point in this sentence
     Parameters
-        sentenceNo      - int, the sentence in d.sentences
+        context         - d.AutoCodingContext, the state of AutoCoding this clinical document
+        sentenceNo      - int, the sentence in context.sentences
         start           - int, where we are in this sentence
         lastNegation    - str, the last negation or None
         thisNegation    - str, the current negation
@@ -214,14 +218,14 @@ def extendNegation(sentenceNo, start, lastNegation, thisNegation):
 
     # Don't extend negation at the start of a sentence or if we have just crossed a but boundary
     if lastNegation is None:
-        d.sd.solution['lastNegation'] = None
+        context.solution['lastNegation'] = None
 
     # Look for Findings, Sites and Procedures at this point in the sentence
-    document = d.sentences[sentenceNo][6]    # Sentences hold mini-documents
+    document = context.sentences[sentenceNo].document    # Sentences hold mini-documents
     for i, miniDoc in enumerate(document[start]):            # Step through the list of alternate concepts at this point in this sentence
         # Extend negation or ambiguity for non-adjacent, but sequential Findings, Sites and Procedures
         # (Skip things that are not a Finding, Site or Procedure)
-        thisConcept = miniDoc['concept']
+        thisConcept = miniDoc.concept
         if (thisConcept not in d.sd.Site) and (thisConcept not in d.sd.Finding) and (thisConcept not in d.sd.Procedure):
             continue
 
@@ -229,26 +233,27 @@ def extendNegation(sentenceNo, start, lastNegation, thisNegation):
         # If we are extending solution negation or ambiguity, then we do so to all Findings
         # but we use a non-negated/not ambigous Site or Procedure to terminate solution negation/ambiguity extension
         # If we are not extending solution negation or ambiguity, then we use a negated Finding to trigger solution negation/ambiguity extension
-        if d.sd.solution['lastNegation'] is not None:    # Extending negation/ambiguity
+        if context.solution['lastNegation'] is not None:    # Extending negation/ambiguity
             if thisConcept in d.sd.Finding:            # All Findings become negated or ambiguous
-                logging.info('Extending negation or amgiguity to %s - %s [%d/%d]', thisConcept, miniDoc['description'], start, i)
-                miniDoc['negation'] = d.sd.solution['lastNegation']        # Negate this Finding or make it ambiguous
+                logging.info('Extending negation or amgiguity to %s - %s [%d/%d]', thisConcept, miniDoc.description, start, i)
+                miniDoc.negation = context.solution['lastNegation']        # Negate this Finding or make it ambiguous
             else:        # Not a Finding - must be a Site or Procedure
                 # A Site or Procedure that isn't negated or ambiguous terminates solution negation/ambiguity extension
-                if miniDoc['negation'] == '0':
-                    d.sd.solution['thisNegation'] = None            # Turn off negations or ambiguity
+                if miniDoc.negation == '0':
+                    context.solution['thisNegation'] = None            # Turn off negations or ambiguity
         elif thisConcept in d.sd.Finding:            # Not extending negation/ambiguity - see if we should start
             # Negated or ambiguous Findings trigger solution negation/ambituity extension.
             # Check if this is a negated or ambiguous (but not immediately ambiguous) Finding
-            if (miniDoc['negation'] in ['1','2']):
-                d.sd.solution['thisNegation'] = miniDoc['negation']        # Turn on solution negations or ambiguity
+            if (miniDoc.negation in ['1','2']):
+                context.solution['thisNegation'] = miniDoc.negation        # Turn on solution negations or ambiguity
     return
 
 
-def higherConceptFound(higherConcept):
+def higherConceptFound(context, higherConcept):
     '''
     Check if this higher concept, which has just been found, implies that any of the concepts in the set should be marked as 'used'
     Parameters
+        context         - d.AutoCodingContext, the state of AutoCoding this clinical document
         higherConcept   - str, the higher concept being check for implications
     Returns
         markUsed        - boolean, True means higher concept implies related concepts should be marked as used
@@ -260,10 +265,11 @@ def higherConceptFound(higherConcept):
         return False
 
 
-def setConcept(thisHigherConcept, thisConcept):
+def setConcept(context, thisHigherConcept, thisConcept):
     '''
     Check if this concept, which has just been found in this higher concept set, set should be marked as 'used'
     Parameters
+        context         - d.AutoCodingContext, the state of AutoCoding this clinical document
         higherConcept   - str, the higher concept being check for implications
     Returns
         markUsed        - boolean, True means higher concept implies related concepts should be marked as used
@@ -278,7 +284,7 @@ def setConcept(thisHigherConcept, thisConcept):
         return False
 
 
-def addSolutionConcepts():
+def addSolutionConcepts(context):
     '''
     Add any solution specific concepts to the document after negation extension, but before sentence or document list negation.
     These concepts may get negated, if they are in sentence_negation_lists or document_negation_lists, but are candidates for concept sets
@@ -290,7 +296,7 @@ def addSolutionConcepts():
     return
 
 
-def addFinalConcepts():
+def addFinalConcepts(context):
     '''
     Add any solution specific concepts to the document. We have done all negation and all concept set checking.
     So these concepts are not candidates for inclusion in concept sets.
@@ -300,25 +306,25 @@ def addFinalConcepts():
     '''
 
     # Walk throught the document and add any sites or findings implied by MetaThesaurus concepts in the document
-    for sentenceNo, sentence in enumerate(d.sentences):            # Step through each sentence
-        document = sentence[6]    # Sentences hold mini-documents
-        for start in sorted(document, key=int):        # We step through all concepts, in sequence across this sentence
+    for sentenceNo, sentence in enumerate(context.sentences):            # Step through each sentence
+        document = sentence.document    # Sentences hold mini-documents
+        for start in document:        # We step through all concepts, in sequence across this sentence
             for j in range(len(document[start])):            # Step through the list of alternate concepts at this point in this sentence
-                concept = document[start][j]['concept']        # This concept
+                concept = document[start][j].concept        # This concept
 
-                if document[start][j]['used']:        # Skip used concepts [only Findings get 'used']
+                if document[start][j].used:        # Skip used concepts [only Findings get 'used']
                     continue
 
-                if document[start][j]['negation'] != '0':    # Skip negated and ambiguous concepts
+                if document[start][j].negation != '0':    # Skip negated and ambiguous concepts
                     continue
 
-                negated =  document[start][j]['negation']
+                negated =  document[start][j].negation
 
                 # Check if this concept has an implied procedure
                 if concept in d.sd.ProcedureImplied:
                     thisProcedure = d.sd.ProcedureImplied[concept]
                     description = d.sd.Procedure[thisProcedure]['desc']
-                    f.addAdditionalConcept(thisProcedure, sentenceNo, start, j, description, negated, f'procedureImplied by concept "{concept}"', 0)
+                    f.addAdditionalConcept(context, thisProcedure, sentenceNo, start, j, description, negated, f'procedureImplied by concept "{concept}"', 0)
 
                 # Check if this concept has an implied diagnosis
                 if concept in d.sd.DiagnosisImplied:
@@ -326,31 +332,31 @@ def addFinalConcepts():
                     for thisSite, thisFinding in d.sd.DiagnosisImplied[concept]:
                         # There is an implied Site so we add it to the document
                         description = d.sd.Site[thisSite]['desc']
-                        f.addAdditionalConcept(thisSite, sentenceNo, start, j, description, negated, f'diagnosis(Site) implied by "{concept}"', 0)
+                        f.addAdditionalConcept(context, thisSite, sentenceNo, start, j, description, negated, f'diagnosis(Site) implied by "{concept}"', 0)
                         # There is an implied Finding so we add it to the document
                         description = d.sd.Finding[thisFinding]['desc']
-                        f.addAdditionalConcept(thisFinding, sentenceNo, start, j, description, negated, f'diagnosis(Finding) implied by "{concept}"', 0)
+                        f.addAdditionalConcept(context, thisFinding, sentenceNo, start, j, description, negated, f'diagnosis(Finding) implied by "{concept}"', 0)
                     # Mark this diagnosis implied concept as 'used'; we don't want it to participant in any other Site/Finding pair.
                     # this.logger.debug('[implies diagnosis] concept (%s) at %d/%d is used', str(concept), start, j)
-                    document[start][j]['used'] = True
+                    document[start][j].used = True
 
                 # Check if this concept has any implied site(s) (concept can be a Finding or a Procedure, but the implied concept must be a Site)
                 if concept in d.sd.SiteImplied:
                     # There is one or more implied Sites so we add them to the mini-document
                     for thisSite in d.sd.SiteImplied[concept]:
                         description = d.sd.Site[thisSite]['desc']
-                        f.addAdditionalConcept(thisSite, sentenceNo, start, j, description, negated, f'siteImplied by concept "{concept}"', 0)
+                        f.addAdditionalConcept(context, thisSite, sentenceNo, start, j, description, negated, f'siteImplied by concept "{concept}"', 0)
 
                 # Check if this concept has any implied finding(s) (concept can be a Site or a Procedure, but the implied concept must be a Finding)
                 if concept in d.sd.FindingImplied:
                     # There is one or more implied Findings so we add them to the mini-document
                     for thisFinding in d.sd.FindingImplied[concept]:
                         description = d.sd.Finding[thisFinding]['desc']
-                        f.addAdditionalConcept(thisFinding, sentenceNo, start, j, description, negated, f'findingImplied by concept "{concept}"', 0)
+                        f.addAdditionalConcept(context, thisFinding, sentenceNo, start, j, description, negated, f'findingImplied by concept "{concept}"', 0)
     return
 
 
-def complete():
+def complete(context):
     '''
     Complete any histopathology specific coding
     '''
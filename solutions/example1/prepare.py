@@ -25,8 +25,7 @@ def configure(wb):
 
     # Read in the List Markers which are at the start of lines
     requiredColumns = ['List markers', 'isCase']
-    this_df = excel.checkWorksheet(wb, 'prepare', 'List markers', requiredColumns, True)
-    for row in this_df.itertuples():
+    for row in excel.readWorksheet(wb, 'prepare', 'List markers', requiredColumns, True):
         if row.List_markers is None:
             break
         # logging.debug("sheet(List markers)), columns(%s), row(%s)", requiredColumns, row)
@@ -40,8 +39,7 @@ def configure(wb):
             marker = re.compile(excel.checkPattern(r'^' + row.List_markers), flags=re.IGNORECASE|re.DOTALL)
         d.sd.listMarkers.append(marker)
     requiredColumns = ['Hyphenated words']
-    this_df = excel.checkWorksheet(wb, 'prepare', 'Hyphenated words', requiredColumns, True)
-    for row in this_df.itertuples():
+    for row in excel.readWorksheet(wb, 'prepare', 'Hyphenated words', requiredColumns, True):
         if row.Hyphenated_words is None:
             break
         # logging.debug("sheet(Hypenated words)), columns(%s), row(%s)", requiredColumns, row)
@@ -75,11 +73,11 @@ def checkHyphenated(cleanLine):
     return newCleanLine
 
 
-def solutionCleanDocument():
+def solutionCleanDocument(context):
     '''
     Perform any histopathology specific document cleaning
     Parameters
-        None
+        context - d.AutoCodingContext, the state of AutoCoding this clinical document
     Returns
         Nothing
     '''
@@ -89,8 +87,8 @@ def solutionCleanDocument():
     # List items are lines that start with optional white space, then a '-'
     newDocument = []
     # logging.debug('Text document before lists removed:')
-    # logging.debug('%s', d.rawClinicalDocument)
-    for line in d.rawClinicalDocument.split('\n'):
+    # logging.debug('%s', context.rawClinicalDocument)
+    for line in context.rawClinicalDocument.split('\n'):
         # logging.debug('Next line is:(%s)', line)
         cleanLine = line.strip()
 
@@ -135,19 +133,20 @@ def solutionCleanDocument():
                     newDocument[-1] = d.addPeriod.sub(r'\1.', newDocument[-1], count=1)
             newDocument.append(cleanLine)
 
-    d.preparedDocument = '\n'.join(newDocument) + '\n'
+    context.preparedDocument = '\n'.join(newDocument) + '\n'
     # logging.debug('Text document after lists removed:')
-    # logging.debug('%s', d.preparedDocument)
+    # logging.debug('%s', context.preparedDocument)
     return
 
 
-def solutionCheckPreamble(text):
+def solutionCheckPreamble(context, text):
     '''
     Check for any solution specific markers that indicate the start of a preamble section (not the body of the text document)
     Here text is whole document.
     Histopathologies sometimes use hanging paragraphs.
     Sometimes the section heading 'CLINICAL INFORMATION', [a preamble marker] gets split over two lines.
     Parameters
+        context - d.AutoCodingContext, the state of AutoCoding this clinical document
         text    - str, the text to be checked for preamble markers
     Returns
         at      - int, location within text where preamble located, or -1 if no preamble located
@@ -170,11 +169,12 @@ def solutionCheckPreamble(text):
     return -1
 
 
-def solutionCheckNotPreamble(text):
+def solutionCheckNotPreamble(context, text):
     '''
     Check for any solution specific markers that indicate the end of a preamble section (not the body of the text document)
     Here text is whole document.
     Parameters
+        context - d.AutoCodingContext, the state of AutoCoding this clinical document
         text    - str, the text to be checked for end of preamble markers
     Returns
         at      - int, location within text where end of preamble located, or -1 if no end of preamble located
@@ -20,10 +20,6 @@ tisCLINICAL = re.compile(r'^\s*CLINICAL')
 tisINFORMATION = re.compile(r'\b' + r'INFORMATION\s*:')
 
 
-# Required for solution specific coding completion
-solution = {}           # A dictionary of various state variables
-
-
 # Required for solution specific analysis
 # Some fixed MethaThesaurus codes
 cervixUteri = 'C0007874'
@@ -49,15 +45,5 @@ ProcedureDefined = {}   # The dictionary of Procedure concepts and two concepts
 tempList = []           # A temporary list
 tempDict = {}           # A temporary dictionary
 
-# Report data
-historyProcedure = {}   # The dictionary of history procedures (key: location of procedure code in clinical document, value: concept)
-hysterectomy = set()    # The set of a hysterectomy procedures
-otherProcedure = set()  # The set of non-hysterectomy procedures
-grid = []               # The list of Diagnoses to report (Site/Finding pairs with AIHW S/E/O code)
-gridFound = set()       # The set of Site/Diagnosis pairs already added to the grid
-reportS = None          # The most important S code
-reportE = None          # The most important E code
-reportO = None          # The most important O code
-reportAIHWprocedure = {}    # The dictionary of the AIHW procedure to report
-reportSN_CTprocedure = {}   # The dictionary of the SNOMED_CT procedure to report
+# Report data (the per-document report data is kept in context.solution)
 ReportSites = []        # The list of Report site sequence concepts